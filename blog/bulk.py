@@ -0,0 +1,85 @@
+# blog/bulk.py
+"""
+博客批量操作：批量发布 / 撤回 / 修改可见性 / 删除
+
+- 归属校验只用一条查询：锁定 author=当前用户 且 id 在列表中的博客，
+  不存在或不属于当前用户的 id 结果为 not_found（与单篇接口一致，不区分两者）
+- 整批在一个事务内用一条 UPDATE / 一次集合 DELETE 完成，不逐条 save()
+- QuerySet.update() 不触发 post_save：搜索索引同步与列表缓存失效在事务提交后手动完成（各一次），
+  进入/离开公开列表的博客手动投递时间线任务，作者的已发布数手动累加；
+  删除仍走 post_delete 信号，用户统计的扣减合并为一次写入
+- 返回按请求顺序（去重后）逐个 id 的处理结果
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache as list_cache
+from . import counters, search
+from .models import Blog
+from .signals import is_listed, sync_timeline
+from user import stats as user_stats
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+
+
+def _lock_owned(user, ids):
+    """一条查询完成归属校验并加行锁，返回 {id: {is_public, status}}"""
+    # 按主键顺序加锁，并发的批量操作之间不会互相死锁
+    rows = Blog.objects.select_for_update().filter(author=user, pk__in=ids).order_by('pk').values('id', 'is_public', 'status')
+    return {row['id']: row for row in rows}
+
+
+def _results(ids, owned, done, result):
+    return [
+        {'id': pk, 'result': NOT_FOUND if pk not in owned else (result if pk in done else UNCHANGED)}
+        for pk in ids
+    ]
+
+
+def update(user, ids, changes):
+    """
+    批量修改 status / is_public（changes 为要设置的字段值）
+    已经是目标值的博客不写入，结果为 unchanged
+    """
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic():
+        owned = _lock_owned(user, ids)
+        changed = [pk for pk, row in owned.items() if any(row[field] != value for field, value in changes.items())]
+        if changed:
+            # update() 不会自动刷新 auto_now 字段，手动带上 updated_at（ETag / 条件请求依赖它）
+            Blog.objects.filter(pk__in=changed).update(**changes, updated_at=timezone.now())
+            transaction.on_commit(lambda: search.sync_blogs(changed))
+            affects_list = False
+            for pk in changed:
+                row = owned[pk]
+                before = is_listed(row['is_public'], row['status'])
+                after = is_listed(changes.get('is_public', row['is_public']), changes.get('status', row['status']))
+                sync_timeline(pk, before, after)
+                affects_list = affects_list or before or after
+            if affects_list:
+                transaction.on_commit(list_cache.bump_generation)
+            if 'status' in changes:
+                published = changes['status'] == 'published'
+                user_stats.incr(user.id, published_count=sum(
+                    published - (owned[pk]['status'] == 'published') for pk in changed
+                ))
+    return _results(ids, owned, set(changed), UPDATED)
+
+
+def delete(user, ids):
+    """批量删除（点赞/转发/评论等关联数据按外键级联，以集合 DELETE 删除）"""
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic(), user_stats.batch():
+        owned = _lock_owned(user, ids)
+        if owned:
+            # 未合并的分片增量一次查出并扣减（逐篇的 pre_delete 在批量模式下跳过）
+            user_stats.incr(user.id, **user_stats.received_deltas(counters.pending(list(owned))))
+            # 只加载信号需要的列（post_delete 据此判断是否影响公开列表、扣减作者统计、删除封面版本文件）
+            Blog.objects.filter(pk__in=list(owned)).only(
+                'id', 'author_id', 'is_public', 'status', 'like_count', 'share_count', 'comment_count', 'view_count',
+                'cover_renditions',
+            ).delete()
+    return _results(ids, owned, set(owned), DELETED)
@@ -0,0 +1,92 @@
+# blog/cache.py
+"""
+公开博客列表（匿名 GET /api/blogs/）的版本化响应缓存
+
+- 缓存键 = 版本号 + 协议/主机/路径 + 查询参数（过滤/搜索/排序/分页）的摘要
+  （响应体里的 next/previous 是绝对地址，不同域名访问不能共用缓存）
+- 公开博客发生新增/修改/发布/撤回/删除时 bump_generation() 递增版本号，
+  旧版本的缓存键不再被访问，随 TTL 自然过期，因此不会返回过期页面
+- 基于 Django 缓存框架，本地内存（LocMemCache）、Redis、Memcached 后端均可使用
+- 命中/未命中次数记在缓存计数器中，可通过 get_stats() 查看
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'blog:list:generation'
+HITS_KEY = 'blog:list:hits'
+MISSES_KEY = 'blog:list:misses'
+
+
+def _timeout():
+    return getattr(settings, 'BLOG_LIST_CACHE_TIMEOUT', 60)
+
+
+def _fresh_generation():
+    # 版本号键被淘汰后用当前毫秒时间戳重新起步，保证不会与淘汰前的旧版本号重复
+    return int(time.time() * 1000)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _fresh_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY, _fresh_generation())
+    return generation
+
+
+def bump_generation():
+    """使当前所有列表缓存失效"""
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        # 版本号键不存在（首次或被淘汰）
+        generation = _fresh_generation()
+        cache.set(GENERATION_KEY, generation, timeout=None)
+        return generation
+
+
+def _incr_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def make_key(request, generation):
+    """版本号 + 协议/主机/路径 + 排序后的查询参数 → 缓存键"""
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{params}"
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f"blog:list:page:v{generation}:{digest}"
+
+
+def lookup(request):
+    """
+    查询缓存，返回 (key, data)：命中时 data 为缓存的条目（响应体 + ETag），未命中时为 None
+    key 在查询前就带上了当前版本号，回源期间若版本号递增，写回的旧版本数据不会被读到
+    """
+    key = make_key(request, get_generation())
+    data = cache.get(key)
+    _incr_counter(HITS_KEY if data is not None else MISSES_KEY)
+    return key, data
+
+
+def store(key, data):
+    cache.set(key, data, timeout=_timeout())
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'generation': get_generation(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+    }
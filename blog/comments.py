@@ -0,0 +1,89 @@
+# blog/comments.py
+"""
+楼中楼评论（物化路径）
+
+- path：从顶层评论到本评论的 id 链，每段 10 位补零加 "/"，如 0000000012/0000000034/；
+  id 自增，按 path 升序即为楼层内“先父后子、同级按时间”的树形顺序
+- 子树：path 落在 [p, p + '~') 内（'~' 大于数字和 '/'），走 (blog, path) 索引的一次范围扫描
+- 楼层列表：顶层评论一页 + 每层前 N 条回复，后者用 ROW_NUMBER() OVER (PARTITION BY root ORDER BY path)
+  一条查询取回，不逐层、逐条查询
+- reply_count：子树中的回复总数（与 Blog.comment_count 一样反规范化保存）；
+  新增回复时从 path 解析出全部祖先，一条 UPDATE 累加
+- 超过 BLOG_COMMENT_MAX_DEPTH 层的回复挂到最深一层的父评论下，path 长度有上限
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import BlogComment
+
+SEGMENT = 10
+PATH_END = '~'
+
+
+def max_depth():
+    # path 最长 255：每层 11 个字符，最多 23 层
+    return min(getattr(settings, 'BLOG_COMMENT_MAX_DEPTH', 20), 22)
+
+
+def make_path(parent_path, pk):
+    return f"{parent_path}{pk:0{SEGMENT}d}/"
+
+
+def path_of(comment):
+    # 未经 create() 写入的评论（如 bulk_create 导入）还没有 path，只可能是顶层评论
+    return comment.path or make_path('', comment.pk)
+
+
+def ancestor_ids(path):
+    """path 中除自身以外的各级祖先 id（从顶层评论开始）"""
+    return [int(part) for part in path.split('/')[:-2]]
+
+
+def create(blog, author, content, parent=None):
+    """发表评论或回复 parent，返回新评论；parent 须属于同一篇博客（由调用方校验）"""
+    with transaction.atomic():
+        if parent is None:
+            comment = BlogComment.objects.create(blog=blog, author=author, content=content)
+            comment.path = make_path('', comment.pk)
+        else:
+            parent_id, parent_path, depth = parent.pk, path_of(parent), parent.depth + 1
+            if depth > max_depth():
+                # 层级已满：挂到 parent 的父评论下，与 parent 同级
+                parent_id, parent_path, depth = parent.parent_id, parent_path[:-(SEGMENT + 1)], parent.depth
+            comment = BlogComment.objects.create(
+                blog=blog, author=author, content=content,
+                parent_id=parent_id, root_id=parent.root_id or parent.pk, depth=depth,
+            )
+            comment.path = make_path(parent_path, comment.pk)
+        BlogComment.objects.filter(pk=comment.pk).update(path=comment.path)
+        ancestors = ancestor_ids(comment.path)
+        if ancestors:
+            BlogComment.objects.filter(pk__in=ancestors).update(reply_count=F('reply_count') + 1)
+    return comment
+
+
+def subtree(comment):
+    """comment 及其全部回复（按树形顺序），一次索引范围查询"""
+    path = path_of(comment)
+    return BlogComment.objects.filter(
+        blog_id=comment.blog_id, path__gte=path, path__lt=path + PATH_END
+    ).order_by('path')
+
+
+def preview_replies(root_ids, limit):
+    """每个楼层（顶层评论）按树形顺序的前 limit 条回复：{顶层评论 id: [回复, ...]}"""
+    grouped = {pk: [] for pk in root_ids}
+    if not grouped or limit <= 0:
+        return grouped
+    replies = (
+        BlogComment.objects.filter(root_id__in=list(grouped))
+        .annotate(position=Window(RowNumber(), partition_by=[F('root_id')], order_by=F('path').asc()))
+        .filter(position__lte=limit)
+        .select_related('author')
+        .order_by('root_id', 'path')
+    )
+    for reply in replies:
+        grouped[reply.root_id].append(reply)
+    return grouped
@@ -0,0 +1,97 @@
+# blog/conditional.py
+"""
+条件请求（ETag）
+
+- 校验值不做整表聚合，也不加载正文、不做序列化：
+  详情：一条只取少量列的查询（updated_at + 计数 + 封面版本 + 正文渲染摘要）；
+  列表：分页器已取回的当前页各行 (id, updated_at) + 分页信息（总数/前后页链接）+ 列表缓存版本号；
+  评论：分页器已取回的当前页各行 (id, reply_count)（楼层模式另加回复预览各行）+ 分页信息；
+  回复会累加祖先的 reply_count，评论行并非只增删不修改，不能只看 max(id) + 条数
+- ETag 还混入查询参数（分页/过滤/?fields=）与当前用户，不同的响应不会共用 ETag；
+  登录用户另混入其点赞/转发状态的版本号（is_liked / is_shared 变化时 ETag 随之变化）
+- 不发送 Last-Modified：计数用 F() 原子更新、删除数据都不会改变任何时间戳，
+  按 If-Modified-Since 判断会返回过期的 304；只按 If-None-Match 返回 304，跳过序列化
+- Cache-Control：匿名请求 public + s-maxage，反向代理可缓存并用 ETag 回源校验；
+  登录用户的响应为 private，只允许浏览器缓存，且每次都要校验
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from . import interactions
+from .cache import get_generation
+
+COUNTER_FIELDS = ('like_count', 'share_count', 'comment_count')
+
+
+def _etag(request, *parts):
+    user_id = request.user.id if request.user.is_authenticated else 0
+    seed = '|'.join(str(part) for part in (
+        *parts, user_id, interactions.version(request.user), request.get_full_path()
+    ))
+    # 弱 ETag：语义相同即可复用（压缩等传输层差异不影响）
+    return f'W/"{hashlib.md5(seed.encode()).hexdigest()}"'
+
+
+def detail_validators(request, queryset, pk):
+    """详情：一条只取少量列的查询；博客不存在时返回 None（交给后续正常的 404 处理）"""
+    row = queryset.filter(pk=pk).values('updated_at', 'cover_renditions', 'content_digest', *COUNTER_FIELDS).first()
+    if row is None:
+        return None
+    cover_source = (row['cover_renditions'] or {}).get('source', '')
+    counters = [row[field] for field in COUNTER_FIELDS]
+    # content_digest：批量回填渲染结果不改 updated_at，也要让 ETag 变化
+    return _etag(
+        request, 'detail', pk, row['updated_at'].isoformat(), cover_source, row['content_digest'], *counters
+    )
+
+
+def list_validators(request, rows, *extra):
+    """
+    列表：由分页器已经取回的当前页计算，不再额外查询
+    rows：当前页的博客（需加载 updated_at）；extra：分页信息、热门排行版本等其它影响响应内容的值
+    列表缓存版本号在公开博客增删改时递增，覆盖作者等关联数据之外的可见性变化
+    """
+    page = [(row.pk, row.updated_at.isoformat()) for row in rows]
+    return _etag(request, 'list', get_generation(), *extra, *page)
+
+
+def comment_validators(request, rows, replies=None, *extra):
+    """
+    评论列表：与 list_validators 一样由当前页已取回的行计算，不再额外查询
+    rows：当前页的评论；replies：楼层模式的回复预览 {楼层 id: [回复, ...]}；extra：分页信息
+    """
+    page = [(row.pk, row.reply_count) for row in rows]
+    previews = [
+        (root_id, [(reply.pk, reply.reply_count) for reply in items])
+        for root_id, items in sorted((replies or {}).items())
+    ]
+    return _etag(request, 'comments', *extra, *page, *previews)
+
+
+def not_modified(request, etag):
+    """客户端缓存仍然有效时返回 304 响应（带上校验头），否则返回 None"""
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        return None
+    return add_validators(request, response, etag)
+
+
+def add_validators(request, response, etag):
+    """给响应加上 ETag / Cache-Control / Vary"""
+    if etag is None or response.status_code not in (200, 304):
+        return response
+    response['ETag'] = etag
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=getattr(settings, 'BLOG_HTTP_CACHE_S_MAXAGE', 30),
+        )
+    # 同一 URL 登录与否返回的内容可能不同，代理需要按 Authorization 区分缓存
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,101 @@
+# blog/counters.py
+"""
+博客互动计数器（点赞/转发/评论）
+
+- 写：incr() 只对随机分片执行 UPDATE delta = delta + n，不读也不重写 Blog 整行
+- 读：get_count() = Blog 中已合并的值 + 各分片尚未合并的增量（实时、精确）
+- 合并：flush() 由 Celery 定时任务调用，把分片增量原子地搬回 Blog 行
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Blog, BlogCounterShard
+
+COUNTER_FIELDS = tuple(name for name, _ in BlogCounterShard.FIELD_CHOICES)
+
+
+def _shard_count():
+    return getattr(settings, 'BLOG_COUNTER_SHARDS', 8)
+
+
+def _check_field(field):
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f"未知的计数字段：{field}")
+
+
+def incr(blog_id, field, amount=1):
+    """给博客的某项计数加 amount（可为负数），返回变更后的实时计数"""
+    _check_field(field)
+    lookup = {'blog_id': blog_id, 'field': field, 'shard': random.randrange(_shard_count())}
+    updated = BlogCounterShard.objects.filter(**lookup).update(delta=F('delta') + amount)
+    if not updated:
+        try:
+            with transaction.atomic():
+                BlogCounterShard.objects.create(delta=amount, **lookup)
+        except IntegrityError:
+            # 并发请求已抢先创建了同一分片，退回到原子 UPDATE
+            BlogCounterShard.objects.filter(**lookup).update(delta=F('delta') + amount)
+    return get_count(blog_id, field)
+
+
+def get_count(blog_id, field):
+    """返回某项计数的实时值（已合并值 + 未合并增量），不会小于 0"""
+    _check_field(field)
+    base = Blog.objects.filter(pk=blog_id).values_list(field, flat=True).first() or 0
+    pending = BlogCounterShard.objects.filter(
+        blog_id=blog_id, field=field
+    ).aggregate(total=Sum('delta'))['total'] or 0
+    return max(0, base + pending)
+
+
+def get_counts(blog_id):
+    """一次性返回三项计数的实时值：{'like_count': .., 'share_count': .., 'comment_count': ..}"""
+    counts = Blog.objects.filter(pk=blog_id).values(*COUNTER_FIELDS).first() or dict.fromkeys(COUNTER_FIELDS, 0)
+    pending = BlogCounterShard.objects.filter(blog_id=blog_id).values('field').annotate(total=Sum('delta'))
+    for row in pending:
+        counts[row['field']] += row['total'] or 0
+    return {field: max(0, value) for field, value in counts.items()}
+
+
+def pending(blog_ids):
+    """多篇博客尚未合并的分片增量之和（一条分组查询）：{字段: 增量}，没有增量的字段不出现"""
+    rows = (
+        BlogCounterShard.objects.filter(blog_id__in=blog_ids)
+        .exclude(delta=0)
+        .order_by()
+        .values_list('field')
+        .annotate(total=Sum('delta'))
+    )
+    return {field: total for field, total in rows}
+
+
+def flush(limit=1000):
+    """
+    把分片中的未合并增量搬回 Blog 行，返回本次合并的（博客, 字段）组数
+    每组在独立事务中完成：锁住该组分片 → Blog 字段加总增量 → 分片清零
+    """
+    pairs = list(
+        BlogCounterShard.objects.exclude(delta=0)
+        .values_list('blog_id', 'field')
+        .distinct()[:limit]
+    )
+    flushed = 0
+    for blog_id, field in pairs:
+        with transaction.atomic():
+            shards = list(
+                BlogCounterShard.objects.select_for_update()
+                .filter(blog_id=blog_id, field=field)
+                .exclude(delta=0)
+                .values_list('id', 'delta')
+            )
+            if not shards:
+                continue
+            total = sum(delta for _, delta in shards)
+            if total:
+                Blog.objects.filter(pk=blog_id).update(**{field: F(field) + total})
+            BlogCounterShard.objects.filter(pk__in=[pk for pk, _ in shards]).update(delta=0)
+        flushed += 1
+    return flushed
@@ -0,0 +1,155 @@
+# blog/covers.py
+"""
+博客封面图多尺寸版本（renditions）
+
+- 上传封面后由 Celery 任务 generate_cover_renditions 生成若干固定宽度的 WebP / JPEG 版本，
+  去掉元数据，并把原图与各版本的尺寸记录到 Blog.cover_renditions：
+  {
+      "source": "blog_covers/a.jpg",              # 生成时对应的原图，与当前 cover_image 不一致即视为过期
+      "width": 3000, "height": 2000,              # 原图尺寸（按 EXIF 方向转正后）
+      "webp": [{"path": ..., "width": 320, "height": 213}, ...],
+      "jpeg": [{"path": ..., "width": 320, "height": 213}, ...]
+  }
+- 序列化器通过 cover_images_payload() 输出 cover_images（含 srcset），列表页可以只加载小图
+- 封面被替换、博客被删除后（事务提交时）由信号调用 discard_stale() / discard() 删除不再使用的版本文件
+"""
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from utils import images
+from . import cache as list_cache
+from .models import Blog
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'blog_covers/renditions'
+
+
+def rendition_widths():
+    return sorted(set(getattr(settings, 'BLOG_COVER_RENDITION_WIDTHS', [320, 640, 1280])))
+
+
+def rendition_quality(fmt):
+    return getattr(settings, 'BLOG_COVER_RENDITION_QUALITY', {}).get(fmt, 80)
+
+
+def is_current(blog):
+    """cover_renditions 是否对应当前的封面图"""
+    renditions = blog.cover_renditions or {}
+    return bool(blog.cover_image) and renditions.get('source') == blog.cover_image.name
+
+
+def _stored_paths(renditions):
+    return {item['path'] for fmt in images.FORMATS for item in (renditions or {}).get(fmt, [])}
+
+
+def discard(renditions, keep=None):
+    """删除 renditions 中记录的版本文件（keep 中仍在使用的除外），返回删除的文件数"""
+    removed = 0
+    for path in _stored_paths(renditions) - _stored_paths(keep):
+        try:
+            default_storage.delete(path)
+            removed += 1
+        except OSError:
+            logger.warning("删除过期封面版本失败：%s", path)
+    return removed
+
+
+def discard_stale(blog_id, renditions):
+    """
+    封面被替换后删除旧封面的版本文件；新封面的版本可能已经生成，按库里当前记录保留
+    （库里仍是旧封面的记录时，例如 update_fields 只含 cover_image 的保存，不保留）
+    """
+    current = Blog.objects.filter(pk=blog_id).values_list('cover_renditions', flat=True).first()
+    if current and current.get('source') == (renditions or {}).get('source'):
+        current = None
+    return discard(renditions, keep=current)
+
+
+def build_renditions(blog_id, source_name, file):
+    """
+    读取原图，生成并保存各尺寸版本，返回 cover_renditions 数据
+    每次生成都写到带新版本号的文件名，不覆盖库里仍在引用的旧文件；旧文件由 generate() 在更新成功后删除
+    """
+    image, (width, height) = images.open_image(file)
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    version = uuid.uuid4().hex[:8]
+    # 不放大：超过原图宽度的档位合并为一档原图宽度
+    widths = sorted({min(target, width) for target in rendition_widths()})
+    renditions = {'source': source_name, 'width': width, 'height': height}
+    for fmt, spec in images.FORMATS.items():
+        items = []
+        for target in widths:
+            resized = images.resize_to_width(image, target)
+            path = f"{RENDITION_DIR}/{blog_id}/{stem}-{version}-{target}w.{spec['ext']}"
+            saved = default_storage.save(path, ContentFile(images.encode(resized, fmt, rendition_quality(fmt))))
+            items.append({'path': saved, 'width': resized.width, 'height': resized.height})
+        renditions[fmt] = items
+    return renditions
+
+
+def generate(blog_id):
+    """
+    为博客当前封面生成多尺寸版本；已是最新则跳过
+    返回 True 表示生成了新版本
+    """
+    blog = Blog.objects.only('id', 'cover_image', 'cover_renditions', 'is_public', 'status').filter(pk=blog_id).first()
+    if blog is None or not blog.cover_image or is_current(blog):
+        return False
+
+    source_name = blog.cover_image.name
+    with default_storage.open(source_name, 'rb') as file:
+        renditions = build_renditions(blog.pk, source_name, file)
+
+    # 生成期间封面又被替换时不覆盖（新封面会触发新的任务），并清理刚生成的文件
+    updated = Blog.objects.filter(pk=blog.pk, cover_image=source_name).update(cover_renditions=renditions)
+    if not updated:
+        discard(renditions)
+        return False
+    discard(blog.cover_renditions, keep=renditions)
+
+    # update() 不触发 post_save，公开博客需要手动让列表缓存失效
+    if blog.is_public and blog.status == 'published':
+        list_cache.bump_generation()
+    return True
+
+
+def cover_images_payload(blog, request):
+    """
+    序列化器使用的 cover_images：
+    {"original": {url, width, height}, "webp": {src, srcset, sources}, "jpeg": {...}}
+    版本尚未生成（或已过期）时只返回 original；没有封面返回 None
+    """
+    if not blog.cover_image:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request else url
+
+    renditions = blog.cover_renditions if is_current(blog) else {}
+    payload = {
+        'original': {
+            'url': absolute(blog.cover_image.url),
+            'width': renditions.get('width'),
+            'height': renditions.get('height'),
+        }
+    }
+    for fmt in images.FORMATS:
+        items = renditions.get(fmt)
+        if not items:
+            continue
+        sources = [
+            {'url': absolute(default_storage.url(item['path'])), 'width': item['width'], 'height': item['height']}
+            for item in items
+        ]
+        payload[fmt] = {
+            'src': sources[0]['url'],
+            'srcset': ', '.join(f"{source['url']} {source['width']}w" for source in sources),
+            'sources': sources,
+        }
+    return payload
@@ -0,0 +1,150 @@
+# blog/hot.py
+"""
+热门排行（GET /api/blogs/?ordering=hot）
+
+- 热度 = Σ 权重 × 2^(-距今时长 / 半衰期)，互动事件为点赞 / 转发 / 评论（权重见 BLOG_HOT_WEIGHTS）
+- 由 Celery 定时任务 recompute_hot_ranking 增量计算：
+  上次的热度整体按经过的时间衰减一次，再加上新事件的贡献，
+  衰减与按博客聚合都用 NumPy 向量化完成；热度低于 BLOG_HOT_MIN_SCORE 的博客被移出
+- 新事件按 created_at 水位线读取，并回看上次计算前 BLOG_HOT_OVERLAP_SECONDS 秒：created_at 在事务提交前就已写入，
+  提交较晚的事件（id 也可能小于已读到的事件）在下一次计算时仍能读到；回看区间内已计入的事件 id 记在状态里，不重复计分
+- 首次计算（或状态丢失、停摆超过窗口）时只读取最近 BLOG_HOT_WINDOW_HOURS 小时的事件
+- 计算状态与结果（排好序的博客 id 列表）存在 JobState 表（见 blog/jobs.py），worker 算出的排行
+  Web 进程直接可见；列表接口按它分页，请求时不做任何热度计算；多个 worker 用数据库租约互斥
+- 取消点赞等删除不回扣热度（衰减后自然淡出）
+"""
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from . import cache as list_cache
+from . import jobs
+from .models import Blog, BlogComment, BlogLike, BlogShare
+
+# JobState 行名：增量计算状态（同时作为租约）、发布的排行
+STATE_JOB = 'blog.hot.state'
+RANKING_JOB = 'blog.hot.ranking'
+
+EVENT_MODELS = {'like': BlogLike, 'share': BlogShare, 'comment': BlogComment}
+DEFAULT_WEIGHTS = {'like': 1.0, 'share': 3.0, 'comment': 2.0}
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'BLOG_HOT_WEIGHTS', {})}
+
+
+def decay_rate():
+    """每秒的衰减系数 λ：score × e^(-λt)，t 等于半衰期时热度减半"""
+    return math.log(2) / (getattr(settings, 'BLOG_HOT_HALF_LIFE_HOURS', 12) * 3600)
+
+
+def window_seconds():
+    return getattr(settings, 'BLOG_HOT_WINDOW_HOURS', 72) * 3600
+
+
+def overlap_seconds():
+    return getattr(settings, 'BLOG_HOT_OVERLAP_SECONDS', 600)
+
+
+def _load_events(model, since, seen, horizon):
+    """
+    读取 created_at >= since 的事件，跳过已计入的 id（seen），
+    返回 (blog_ids, 时间戳, created_at >= horizon 的事件 id，即下次回看区间内已计入的事件)
+    """
+    rows = model.objects.filter(
+        created_at__gte=datetime.fromtimestamp(since, tz=dt_timezone.utc)
+    ).order_by().values_list('id', 'blog_id', 'created_at')
+    blog_ids, stamps, recent = [], [], []
+    for pk, blog_id, created_at in rows.iterator(chunk_size=5000):
+        stamp = created_at.timestamp()
+        if stamp >= horizon:
+            recent.append(pk)
+        if pk not in seen:
+            blog_ids.append(blog_id)
+            stamps.append(stamp)
+    return np.asarray(blog_ids, dtype=np.int64), np.asarray(stamps, dtype=np.float64), recent
+
+
+def aggregate(blog_ids, scores):
+    """按博客 id 合并热度：相同 id 的分数相加，返回 (唯一 id, 分数)"""
+    unique, inverse = np.unique(blog_ids, return_inverse=True)
+    return unique, np.bincount(inverse, weights=scores, minlength=len(unique))
+
+
+def load_state():
+    """读取增量计算状态（各博客热度、计算时间、回看区间内已计入的事件 id），没有时返回 None"""
+    state = jobs.load(STATE_JOB)
+    if state is None:
+        return None
+    return {
+        **state,
+        'ids': np.asarray(state['ids'], dtype=np.int64),
+        'scores': np.asarray(state['scores'], dtype=np.float64),
+    }
+
+
+def recompute(now=None):
+    """增量更新热度并生成排行，返回排行中的博客数"""
+    now = now or time.time()
+    rate = decay_rate()
+    state = load_state()
+    if state is None or 'seen' not in state or now - state['computed_at'] > window_seconds():
+        # 冷启动（含旧版按 id 水位线保存的状态）：从窗口起点开始读事件
+        since = now - window_seconds()
+        state = {'computed_at': now, 'seen': {}, 'ids': np.empty(0, dtype=np.int64), 'scores': np.empty(0)}
+    else:
+        since = max(state['computed_at'] - overlap_seconds(), now - window_seconds())
+
+    # 旧热度整体衰减到当前时刻
+    ids = [state['ids']]
+    scores = [state['scores'] * math.exp(-rate * (now - state['computed_at']))]
+    seen = {}
+    for name, model in EVENT_MODELS.items():
+        blog_ids, stamps, seen[name] = _load_events(
+            model, since, set(state['seen'].get(name, ())), now - overlap_seconds()
+        )
+        if len(blog_ids):
+            ids.append(blog_ids)
+            scores.append(weights()[name] * np.exp(-rate * np.maximum(now - stamps, 0)))
+
+    ids, scores = aggregate(np.concatenate(ids), np.concatenate(scores))
+    keep = scores >= getattr(settings, 'BLOG_HOT_MIN_SCORE', 0.01)
+    ids, scores = ids[keep], scores[keep]
+    jobs.save(STATE_JOB, {'computed_at': now, 'seen': seen, 'ids': ids.tolist(), 'scores': scores.tolist()})
+    return _publish_ranking(ids, scores, now)
+
+
+def _publish_ranking(ids, scores, now):
+    """按热度降序（同分按 id 降序）取前 BLOG_HOT_MAX_ITEMS 篇公开博客，发布到 JobState"""
+    limit = getattr(settings, 'BLOG_HOT_MAX_ITEMS', 1000)
+    order = np.lexsort((-ids, -scores))
+    # 多取一些候选，过滤掉已撤回/私密/删除的博客后仍能凑满
+    candidates = [int(pk) for pk in ids[order[:limit * 2]]]
+    listed = set(
+        Blog.objects.filter(pk__in=candidates, is_public=True, status='published').values_list('id', flat=True)
+    ) if candidates else set()
+    ranking = [pk for pk in candidates if pk in listed][:limit]
+
+    previous = jobs.load(RANKING_JOB)
+    jobs.save(RANKING_JOB, {'ids': ranking, 'version': int(now)})
+    # 排行变化时让匿名列表缓存失效（?ordering=hot 的页面也在其中）
+    if previous is None or previous['ids'] != ranking:
+        list_cache.bump_generation()
+    return len(ranking)
+
+
+def run_locked():
+    """定时任务入口：同一时间只有一个 worker 在计算；返回排行博客数，未拿到锁返回 None"""
+    with jobs.lease(STATE_JOB, getattr(settings, 'BLOG_HOT_LOCK_TIMEOUT', 600)) as acquired:
+        return recompute() if acquired else None
+
+
+def ranked_ids():
+    """返回 (排好序的博客 id 列表, 版本号)；尚未计算过时为 ([], 0)"""
+    ranking = jobs.load(RANKING_JOB)
+    if ranking is None:
+        return [], 0
+    return ranking['ids'], ranking['version']
@@ -0,0 +1,54 @@
+# blog/interactions.py
+"""
+当前用户对博客的互动状态（is_liked / is_shared）
+
+- viewer_state()：整页博客只用一条 UNION 查询取回当前用户点赞过、转发过的博客 id，
+  分别走 BlogLike 的 (blog, user) 唯一索引与 BlogShare 的 (user, blog) 索引，不随页内条数增加查询
+- 匿名用户不查询，两项均为 False
+- 用户点赞、取消点赞、转发后 bump_version()：版本号参与登录用户的列表/详情 ETag，
+  避免计数尚未合并时条件请求返回过期的 is_liked
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import CharField, Value
+
+from .models import BlogLike, BlogShare
+
+VERSION_KEY = 'blog:viewer:{user_id}:version'
+
+EMPTY_STATE = (frozenset(), frozenset())
+
+
+def viewer_state(user, blog_ids):
+    """返回 (点赞过的博客 id 集合, 转发过的博客 id 集合)"""
+    blog_ids = list(blog_ids)
+    if user is None or not user.is_authenticated or not blog_ids:
+        return EMPTY_STATE
+    likes = BlogLike.objects.filter(user_id=user.id, blog_id__in=blog_ids).values_list(
+        'blog_id', Value('like', output_field=CharField())
+    ).order_by()
+    shares = BlogShare.objects.filter(user_id=user.id, blog_id__in=blog_ids).values_list(
+        'blog_id', Value('share', output_field=CharField())
+    ).order_by()
+    liked, shared = set(), set()
+    # 转发允许重复，UNION 会去重
+    for blog_id, kind in likes.union(shares):
+        (liked if kind == 'like' else shared).add(blog_id)
+    return liked, shared
+
+
+def version(user):
+    """登录用户互动状态的版本号（匿名用户为 0）"""
+    if user is None or not user.is_authenticated:
+        return 0
+    return cache.get(VERSION_KEY.format(user_id=user.id), 0)
+
+
+def bump_version(user_id):
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 键不存在（首次或被淘汰）：用毫秒时间戳起步，不会与淘汰前的版本号重复
+        cache.set(key, int(time.time() * 1000), timeout=None)
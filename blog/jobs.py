@@ -0,0 +1,58 @@
+# blog/jobs.py
+"""
+定时任务的共享状态与互斥租约（JobState 表）
+
+- load() / save() / clear()：任务状态以 JSON 存在 JobState 行中，多进程、多机读到的是同一份，
+  也不会像缓存一样被淘汰（热门排行、计数对账检查点）
+- lease()：用一条带条件的 UPDATE 抢占租约（没有租约或租约已到期才能抢到），
+  同一时刻只有一个 worker 执行；持有者崩溃时租约到期后自动失效，释放时只清除自己的租约
+"""
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import JobState
+
+
+def load(name):
+    """返回任务状态，没有记录（或已清除）时返回 None"""
+    return JobState.objects.filter(pk=name).values_list('data', flat=True).first()
+
+
+def save(name, data):
+    if JobState.objects.filter(pk=name).update(data=data, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            JobState.objects.create(name=name, data=data)
+    except IntegrityError:
+        # 并发的首次写入：行已被别的进程建好
+        JobState.objects.filter(pk=name).update(data=data, updated_at=timezone.now())
+
+
+def clear(name):
+    JobState.objects.filter(pk=name).update(data=None, updated_at=timezone.now())
+
+
+@contextmanager
+def lease(name, timeout):
+    """
+    抢占名为 name 的租约（timeout 秒后自动到期），yield 是否抢到：
+        with jobs.lease('blog.hot', 600) as acquired:
+            if acquired: ...
+    """
+    JobState.objects.get_or_create(pk=name)
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    acquired = JobState.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=now), pk=name
+    ).update(locked_until=now + timedelta(seconds=timeout), locked_by=token)
+    try:
+        yield bool(acquired)
+    finally:
+        if acquired:
+            JobState.objects.filter(pk=name, locked_by=token).update(locked_until=None, locked_by='')
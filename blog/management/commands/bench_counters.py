@@ -0,0 +1,93 @@
+# blog/management/commands/bench_counters.py
+"""
+博客计数器并发压测：多线程同时给同一篇博客点赞计数，最后校验总数是否精确
+
+用法：python manage.py bench_counters --threads 16 --increments 200 [--legacy]
+"""
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from blog import counters
+from blog.models import Blog
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = "并发压测博客点赞计数：多线程对同一篇博客递增，校验最终计数是否精确"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='并发线程数')
+        parser.add_argument('--increments', type=int, default=200, help='每个线程的递增次数')
+        parser.add_argument('--legacy', action='store_true', help='同时压测旧的读改写 save() 方式作对比')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        increments = options['increments']
+        expected = threads * increments
+
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        author = User.objects.create_user(username=name, email=f"{name}@bench.local", password=uuid.uuid4().hex)
+        try:
+            blog = Blog.objects.create(title=name, content="x" * 20000, author=author, status='published')
+
+            def sharded():
+                counters.incr(blog.id, 'like_count')
+
+            elapsed = self._hammer(sharded, threads, increments)
+            counters.flush()
+            final = Blog.objects.values_list('like_count', flat=True).get(pk=blog.pk)
+            self.stdout.write(
+                f"[分片计数] 线程={threads} 期望={expected} 实际={final} "
+                f"耗时={elapsed:.2f}s 吞吐={expected / elapsed:.0f} 次/秒"
+            )
+
+            if options['legacy']:
+                legacy_blog = Blog.objects.create(title=name, content="x" * 20000, author=author, status='published')
+
+                def read_modify_write():
+                    obj = Blog.objects.get(pk=legacy_blog.pk)
+                    obj.like_count += 1
+                    obj.save()
+
+                elapsed = self._hammer(read_modify_write, threads, increments)
+                legacy_final = Blog.objects.values_list('like_count', flat=True).get(pk=legacy_blog.pk)
+                self.stdout.write(
+                    f"[旧版 save()] 线程={threads} 期望={expected} 实际={legacy_final} "
+                    f"丢失={expected - legacy_final} 耗时={elapsed:.2f}s"
+                )
+        finally:
+            author.delete()  # 级联删除压测博客及计数分片
+
+        if final != expected:
+            raise CommandError(f"计数不精确：期望 {expected}，实际 {final}")
+        self.stdout.write(self.style.SUCCESS("计数精确，压测通过"))
+
+    def _hammer(self, func, threads, increments):
+        """启动 threads 个线程，每个线程调用 func increments 次，返回总耗时（秒）"""
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(increments):
+                    func()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()  # 每个线程各自持有数据库连接，结束时释放
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise CommandError(f"压测线程异常：{errors[0]}")
+        return elapsed
@@ -0,0 +1,78 @@
+# blog/management/commands/bench_pagination.py
+"""
+分页性能对比：OFFSET 页码分页 vs (created_at, id) 游标分页，分别测第 1 页和第 N 页
+
+用法：python manage.py bench_pagination --depth 10000 --page-size 20
+"""
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.utils import timezone
+
+from blog.models import Blog
+from blog.pagination import keyset_slice
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = "对比公开博客列表在第 1 页与第 N 页时 OFFSET 分页和游标分页的耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=10000, help='对比的深页页码')
+        parser.add_argument('--page-size', type=int, default=20, help='每页条数')
+        parser.add_argument('--repeat', type=int, default=5, help='每种情况重复次数（取中位数）')
+        parser.add_argument('--keep', action='store_true', help='压测结束后保留生成的数据')
+
+    def handle(self, *args, **options):
+        depth = options['depth']
+        page_size = options['page_size']
+        rows = depth * page_size
+
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        author = User.objects.create_user(username=name, email=f"{name}@bench.local", password=uuid.uuid4().hex)
+        try:
+            self._seed(author, rows)
+            queryset = Blog.objects.filter(is_public=True, status='published')
+
+            # 深页游标：第 depth-1 页最后一条的位置（不计入耗时）
+            anchor = queryset.order_by('-created_at', '-id').values_list('created_at', 'id')[rows - page_size - 1]
+
+            results = [
+                ("OFFSET 第 1 页", lambda: list(Paginator(queryset.order_by('-created_at', '-id'), page_size).page(1))),
+                (f"OFFSET 第 {depth} 页", lambda: list(Paginator(queryset.order_by('-created_at', '-id'), page_size).page(depth))),
+                ("游标 第 1 页", lambda: keyset_slice(queryset, page_size)),
+                (f"游标 第 {depth} 页", lambda: keyset_slice(queryset, page_size, anchor)),
+            ]
+            for label, func in results:
+                self.stdout.write(f"{label:<16} 中位耗时 {self._measure(func, options['repeat']) * 1000:.2f} ms")
+        finally:
+            if not options['keep']:
+                author.delete()  # 级联删除压测博客
+
+    def _seed(self, author, rows):
+        """批量生成 rows 篇已发布的公开博客，发布时间依次递减 1 秒"""
+        now = timezone.now()
+        batch = []
+        for i in range(rows):
+            batch.append(Blog(
+                title=f"bench {i}", content="bench", author=author,
+                status='published', is_public=True, created_at=now - timedelta(seconds=i),
+            ))
+            if len(batch) >= 5000:
+                Blog.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Blog.objects.bulk_create(batch)
+        self.stdout.write(f"已生成 {rows} 篇压测博客")
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
@@ -0,0 +1,77 @@
+# blog/management/commands/bench_viewer_state.py
+"""
+列表页 is_liked / is_shared 性能对比：逐条查询（每张卡片各查一次点赞、转发）vs 整页一条 UNION 查询，
+分别测每页 20 条和 100 条（可用 --page-sizes 调整），输出查询数与中位耗时
+
+用法：python manage.py bench_viewer_state [--page-sizes 20 100] [--likes 5000]
+"""
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from blog import interactions
+from blog.models import Blog, BlogLike, BlogShare
+from user.models import User
+
+
+def per_item_state(user, blog_ids):
+    """对照组：序列化每条博客时各查一次"""
+    liked = {pk for pk in blog_ids if BlogLike.objects.filter(user_id=user.id, blog_id=pk).exists()}
+    shared = {pk for pk in blog_ids if BlogShare.objects.filter(user_id=user.id, blog_id=pk).exists()}
+    return liked, shared
+
+
+class Command(BaseCommand):
+    help = "对比列表页逐条查询与整页一次查询当前用户点赞/转发状态的查询数和耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[20, 100], help='每页条数')
+        parser.add_argument('--likes', type=int, default=5000, help='压测用户点赞过的博客总数（点赞表规模）')
+        parser.add_argument('--repeat', type=int, default=5, help='每种情况重复次数（取中位数）')
+        parser.add_argument('--keep', action='store_true', help='压测结束后保留生成的数据')
+
+    def handle(self, *args, **options):
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        author = User.objects.create_user(username=name, email=f"{name}@bench.local", password=uuid.uuid4().hex)
+        viewer = User.objects.create_user(username=f"{name}_v", email=f"{name}_v@bench.local", password=uuid.uuid4().hex)
+        try:
+            blog_ids = self._seed(author, viewer, max(options['likes'], max(options['page_sizes'])))
+            for page_size in options['page_sizes']:
+                # 取点赞表中间的一页，一半点过赞
+                page = blog_ids[len(blog_ids) // 2:len(blog_ids) // 2 + page_size]
+                for label, func in (
+                    ("逐条查询", lambda: per_item_state(viewer, page)),
+                    ("整页一次查询", lambda: interactions.viewer_state(viewer, page)),
+                ):
+                    queries, elapsed = self._measure(func, options['repeat'])
+                    self.stdout.write(f"每页 {page_size:<4} {label:<8} 查询 {queries:>4} 条  中位耗时 {elapsed * 1000:.2f} ms")
+        finally:
+            if not options['keep']:
+                author.delete()  # 级联删除压测博客与点赞/转发
+                viewer.delete()
+
+    def _seed(self, author, viewer, rows):
+        """生成 rows 篇博客，压测用户给偶数位的博客点赞、每 5 篇转发一篇"""
+        Blog.objects.bulk_create(
+            Blog(title=f"bench {i}", content="bench", author=author, status='published', is_public=True)
+            for i in range(rows)
+        )
+        blog_ids = list(Blog.objects.filter(author=author).order_by('pk').values_list('pk', flat=True))
+        BlogLike.objects.bulk_create(BlogLike(blog_id=pk, user=viewer) for pk in blog_ids[::2])
+        BlogShare.objects.bulk_create(BlogShare(blog_id=pk, user=viewer) for pk in blog_ids[::5])
+        self.stdout.write(f"已生成 {rows} 篇压测博客")
+        return blog_ids
+
+    def _measure(self, func, repeat):
+        timings = []
+        with CaptureQueriesContext(connection) as captured:
+            func()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return len(captured), statistics.median(timings)
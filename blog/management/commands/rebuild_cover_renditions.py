@@ -0,0 +1,31 @@
+# blog/management/commands/rebuild_cover_renditions.py
+"""
+为已有封面图补生成多尺寸版本（跳过已是最新的博客）
+
+用法：python manage.py rebuild_cover_renditions [--async]
+    --async  投递到 Celery 异步生成；默认在当前进程内同步生成
+"""
+from django.core.management.base import BaseCommand
+
+from blog import covers
+from blog.models import Blog
+from blog.tasks import generate_cover_renditions
+
+
+class Command(BaseCommand):
+    help = "为已有的博客封面图生成 WebP/JPEG 多尺寸版本"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--async', dest='use_async', action='store_true', help='投递到 Celery 异步执行')
+
+    def handle(self, *args, **options):
+        blog_ids = Blog.objects.exclude(cover_image='').exclude(cover_image__isnull=True).order_by('pk').values_list('pk', flat=True)
+        generated = 0
+        for blog_id in blog_ids.iterator():
+            if options['use_async']:
+                generate_cover_renditions.delay(blog_id)
+                generated += 1
+            elif covers.generate(blog_id):
+                generated += 1
+        action = '投递' if options['use_async'] else '生成'
+        self.stdout.write(self.style.SUCCESS(f"封面图版本{action}完成，共 {generated} 篇博客"))
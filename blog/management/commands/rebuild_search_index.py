@@ -0,0 +1,32 @@
+# blog/management/commands/rebuild_search_index.py
+"""
+重建博客全文搜索索引：清空后按主键分批索引所有公开且已发布的博客
+
+用法：python manage.py rebuild_search_index [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from blog.models import Blog
+from blog.search import get_index
+
+
+class Command(BaseCommand):
+    help = "清空并重建博客全文搜索索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批读取的博客数')
+
+    def handle(self, *args, **options):
+        index = get_index()
+        index.clear()
+        rows = (
+            Blog.objects.filter(is_public=True, status='published')
+            .order_by('pk')
+            .values_list('id', 'title', 'content')
+            .iterator(chunk_size=options['batch_size'])
+        )
+        total = 0
+        for blog_id, title, content in rows:
+            index.index(blog_id, title, content)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"搜索索引重建完成，共索引 {total} 篇博客"))
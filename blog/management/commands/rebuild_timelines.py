@@ -0,0 +1,18 @@
+# blog/management/commands/rebuild_timelines.py
+"""
+按数据库重建所有用户的好友时间线（更换 BLOG_TIMELINE_STORE、进程内存储重启、调整推送阈值后使用）
+
+用法：python manage.py rebuild_timelines
+"""
+from django.core.management.base import BaseCommand
+
+from blog import timeline
+
+
+class Command(BaseCommand):
+    help = "重建好友动态时间线"
+
+    def handle(self, *args, **options):
+        authors = timeline.rebuild()
+        celebrities = len(timeline.get_store().celebrities())
+        self.stdout.write(self.style.SUCCESS(f"时间线重建完成：处理 {authors} 位作者，其中 {celebrities} 位改为读取时合并"))
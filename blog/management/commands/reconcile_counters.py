@@ -0,0 +1,26 @@
+# blog/management/commands/reconcile_counters.py
+"""
+手动执行博客互动计数对账（与定时任务 reconcile_blog_counters 相同的逻辑）
+
+用法：python manage.py reconcile_counters [--dry-run] [--chunk-size 1000] [--all]
+    --dry-run  只统计偏差，不写库
+    --all      一次扫描到末尾（不受 BLOG_RECONCILE_MAX_CHUNKS 限制）
+"""
+from django.core.management.base import BaseCommand
+
+from blog import reconcile
+
+
+class Command(BaseCommand):
+    help = "按明细表对账博客的点赞/转发/评论计数"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计偏差，不写库')
+        parser.add_argument('--chunk-size', type=int, default=None, help='每块扫描的博客数')
+        parser.add_argument('--all', action='store_true', help='一次扫描全部博客')
+
+    def handle(self, *args, **options):
+        report = reconcile.run(
+            dry_run=options['dry_run'], size=options['chunk_size'], limit=0 if options['all'] else None
+        )
+        self.stdout.write(self.style.SUCCESS(reconcile.describe(report)))
@@ -0,0 +1,50 @@
+# blog/management/commands/render_blog_content.py
+"""
+批量回填博客的预渲染字段（content_html / excerpt / word_count / reading_time）
+
+只处理正文摘要与当前渲染版本不一致的博客（从未渲染过，或 RENDER_VERSION 已升级）；
+按主键分批读取、bulk_update 写回，不触发 save() 信号，也不修改 updated_at
+
+用法：python manage.py render_blog_content [--batch-size 500] [--force]
+    --force  忽略摘要，全部重新渲染
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import cache as list_cache
+from blog import rendering
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    help = "批量渲染博客正文的 HTML、摘要、字数与阅读时长"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的博客数')
+        parser.add_argument('--force', action='store_true', help='全部重新渲染')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        queryset = Blog.objects.only('id', 'content', 'content_digest').order_by('pk')
+        last_pk, scanned, rendered = 0, 0, 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            scanned += len(batch)
+            changed = []
+            for blog in batch:
+                if options['force'] or blog.content_digest != rendering.digest(blog.content):
+                    for field, value in rendering.render(blog.content).items():
+                        setattr(blog, field, value)
+                    changed.append(blog)
+            if changed:
+                with transaction.atomic():
+                    Blog.objects.bulk_update(changed, rendering.RENDERED_FIELDS)
+                rendered += len(changed)
+
+        # bulk_update 不触发信号，列表缓存里的摘要需要手动失效
+        if rendered:
+            list_cache.bump_generation()
+        self.stdout.write(self.style.SUCCESS(f"正文渲染完成：扫描 {scanned} 篇，重新渲染 {rendered} 篇"))
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='标题')),
+                ('content', models.TextField(verbose_name='内容')),
+                ('cover_image', models.ImageField(blank=True, null=True, upload_to='blog_covers/', verbose_name='封面图')),
+                ('status', models.CharField(choices=[('draft', '草稿'), ('published', '已发布')], default='draft', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='发布时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_public', models.BooleanField(default=True, verbose_name='是否公开')),
+                ('like_count', models.IntegerField(default=0, verbose_name='点赞数')),
+                ('share_count', models.IntegerField(default=0, verbose_name='转发数')),
+                ('comment_count', models.IntegerField(default=0, verbose_name='评论数')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blogs', to=settings.AUTH_USER_MODEL, verbose_name='作者')),
+            ],
+            options={
+                'verbose_name': '博客',
+                'verbose_name_plural': '博客',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BlogComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(verbose_name='评论内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='评论时间')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blog_comments', to=settings.AUTH_USER_MODEL, verbose_name='评论作者')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='blog.blog', verbose_name='关联博客')),
+            ],
+            options={
+                'verbose_name': '博客评论',
+                'verbose_name_plural': '博客评论',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BlogShare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='转发时间')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='blog.blog', verbose_name='关联博客')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shared_blogs', to=settings.AUTH_USER_MODEL, verbose_name='转发用户')),
+            ],
+            options={
+                'verbose_name': '博客转发',
+                'verbose_name_plural': '博客转发',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BlogCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('like_count', '点赞数'), ('share_count', '转发数'), ('comment_count', '评论数')], max_length=20, verbose_name='计数字段')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='分片编号')),
+                ('delta', models.IntegerField(default=0, verbose_name='未合并增量')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='blog.blog', verbose_name='关联博客')),
+            ],
+            options={
+                'verbose_name': '博客计数分片',
+                'verbose_name_plural': '博客计数分片',
+                'unique_together': {('blog', 'field', 'shard')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BlogLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='点赞时间')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='blog.blog', verbose_name='关联博客')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='liked_blogs', to=settings.AUTH_USER_MODEL, verbose_name='点赞用户')),
+            ],
+            options={
+                'verbose_name': '博客点赞',
+                'verbose_name_plural': '博客点赞',
+                'ordering': ['-created_at'],
+                'unique_together': {('blog', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_blog_cover_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='content_digest',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='渲染时的正文摘要'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='content_html',
+            field=models.TextField(blank=True, default='', verbose_name='渲染后的正文'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', max_length=300, verbose_name='摘要'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, verbose_name='阅读时长（分钟）'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='字数'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_blog_rendered_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='浏览量'),
+        ),
+        migrations.CreateModel(
+            name='BlogViewDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='浏览次数')),
+                ('visitors_sketch', models.BinaryField(default=b'', verbose_name='访客草图')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='blog.blog', verbose_name='关联博客')),
+            ],
+            options={
+                'verbose_name': '博客每日浏览',
+                'verbose_name_plural': '博客每日浏览',
+                'unique_together': {('blog', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_blog_view_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='blogshare',
+            index=models.Index(fields=['user', 'blog'], name='blog_share_user_blog_idx'),
+        ),
+    ]
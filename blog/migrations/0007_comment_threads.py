@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # 已有评论都是顶层评论：物化路径即自身 id
+    BlogComment = apps.get_model('blog', 'BlogComment')
+    last_pk = 0
+    while True:
+        batch = list(BlogComment.objects.filter(pk__gt=last_pk).order_by('pk').only('id')[:1000])
+        if not batch:
+            break
+        for comment in batch:
+            comment.path = f"{comment.pk:010d}/"
+        BlogComment.objects.bulk_update(batch, ['path'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_share_user_blog_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogcomment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='层级'),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.blogcomment', verbose_name='回复的评论'),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='path',
+            field=models.CharField(default='', max_length=255, verbose_name='物化路径'),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='回复数'),
+        ),
+        migrations.AddField(
+            model_name='blogcomment',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_replies', to='blog.blogcomment', verbose_name='所在楼层'),
+        ),
+        migrations.AddIndex(
+            model_name='blogcomment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['blog', '-created_at'], name='blog_comment_toplevel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogcomment',
+            index=models.Index(fields=['blog', 'path'], name='blog_comment_blog_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogcomment',
+            index=models.Index(fields=['root', 'path'], name='blog_comment_root_path_idx'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
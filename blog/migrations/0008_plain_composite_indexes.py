@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_comment_threads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='blog',
+            name='blog_public_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blog',
+            name='blog_published_feed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='blogcomment',
+            name='blog_comment_toplevel_idx',
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['status', '-created_at', '-id', 'is_public'], name='blog_public_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blogcomment',
+            index=models.Index(fields=['blog', 'parent', '-created_at'], name='blog_comment_toplevel_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_plain_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobState',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='任务名')),
+                ('data', models.JSONField(blank=True, null=True, verbose_name='任务状态')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='租约到期时间')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=32, verbose_name='租约持有者')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '任务状态',
+                'verbose_name_plural': '任务状态',
+            },
+        ),
+    ]
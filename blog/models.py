@@ -4,6 +4,7 @@ from django.conf import settings  # 新增：导入 settings
 from django.utils import timezone
 
 from user.models import User
+from .rendering import RENDERED_FIELDS, refresh
 
 
 class Blog(models.Model):
@@ -14,7 +15,15 @@ class Blog(models.Model):
     )
     title = models.CharField(max_length=200, verbose_name="标题")
     content = models.TextField(verbose_name="内容")
+    # 以下字段由 blog.rendering 在保存时根据 content 预渲染，正文不变时不重新渲染
+    content_html = models.TextField(blank=True, default='', verbose_name="渲染后的正文")
+    excerpt = models.CharField(max_length=300, blank=True, default='', verbose_name="摘要")
+    word_count = models.PositiveIntegerField(default=0, verbose_name="字数")
+    reading_time = models.PositiveIntegerField(default=0, verbose_name="阅读时长（分钟）")
+    content_digest = models.CharField(max_length=32, blank=True, default='', verbose_name="渲染时的正文摘要")
     cover_image = models.ImageField(upload_to='blog_covers/', null=True, blank=True, verbose_name="封面图")
+    # 封面多尺寸版本（WebP/JPEG）与尺寸信息，由 blog.covers 在后台生成
+    cover_renditions = models.JSONField(default=dict, blank=True, verbose_name="封面图版本")
     # 关键修复：用 settings.AUTH_USER_MODEL 替代 'auth.User'
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,  # 动态引用用户模型
@@ -29,14 +38,31 @@ class Blog(models.Model):
     like_count = models.IntegerField(default=0, verbose_name="点赞数")
     share_count = models.IntegerField(default=0, verbose_name="转发数")
     comment_count = models.IntegerField(default=0, verbose_name="评论数")
+    # 浏览量：先在进程内缓冲，由 blog.viewcounts 批量合并写入
+    view_count = models.PositiveBigIntegerField(default=0, verbose_name="浏览量")
 
     class Meta:
         verbose_name = "博客"
         verbose_name_plural = "博客"
         ordering = ['-created_at']
+        indexes = [
+            # 公开列表 / 游标翻页：WHERE is_public AND status [AND (created_at, id) < (?, ?)] ORDER BY created_at DESC, id DESC
+            # SQLite 把 is_public=True 生成为裸列条件，无法作为等值前缀定位，放在排序列之后只用于索引内过滤
+            models.Index(fields=['status', '-created_at', '-id', 'is_public'], name='blog_public_feed_idx'),
+            # 我的博客：WHERE author_id ORDER BY created_at DESC
+            models.Index(fields=['author', '-created_at'], name='blog_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            if refresh(self) and update_fields is not None:
+                # 正文变了，渲染结果也要一起写回
+                kwargs['update_fields'] = {*update_fields, *RENDERED_FIELDS}
+        super().save(*args, **kwargs)
 class BlogLike(models.Model):
     blog = models.ForeignKey(
         Blog,
@@ -81,6 +107,10 @@ class BlogShare(models.Model):
         verbose_name = "博客转发"
         verbose_name_plural = "博客转发"
         ordering = ["-created_at"]
+        indexes = [
+            # 列表页的 is_shared：WHERE user_id AND blog_id IN (...)
+            models.Index(fields=["user", "blog"], name="blog_share_user_blog_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} 转发 {self.blog.title}"
@@ -100,11 +130,111 @@ class BlogComment(models.Model):
     )
     content = models.TextField(verbose_name="评论内容")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="评论时间")
+    # 楼中楼回复（见 blog/comments.py）：parent 为直接回复的评论，root 为所在楼层的顶层评论
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="replies",
+        verbose_name="回复的评论"
+    )
+    root = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="thread_replies",
+        verbose_name="所在楼层"
+    )
+    # 物化路径：从顶层评论到本评论的 id 链，每段 10 位补零 + "/"，按 path 排序即为楼层内的树形顺序
+    path = models.CharField(max_length=255, default='', verbose_name="物化路径")
+    depth = models.PositiveSmallIntegerField(default=0, verbose_name="层级")
+    reply_count = models.PositiveIntegerField(default=0, verbose_name="回复数")  # 子树中的全部回复
 
     class Meta:
         verbose_name = "博客评论"
         verbose_name_plural = "博客评论"
         ordering = ["-created_at"]  # 按评论时间倒序
+        indexes = [
+            # 评论列表：WHERE blog_id ORDER BY created_at DESC
+            models.Index(fields=["blog", "-created_at"], name="blog_comment_blog_created_idx"),
+            # 楼层列表：WHERE blog_id AND parent_id IS NULL ORDER BY created_at DESC
+            models.Index(fields=["blog", "parent", "-created_at"], name="blog_comment_toplevel_idx"),
+            # 子树：WHERE blog_id AND path >= ? AND path < ? ORDER BY path
+            models.Index(fields=["blog", "path"], name="blog_comment_blog_path_idx"),
+            # 各楼层的前 N 条回复：WHERE root_id IN (...) ORDER BY path
+            models.Index(fields=["root", "path"], name="blog_comment_root_path_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.author.username} 评论 {self.blog.title}: {self.content[:20]}"
+
+class BlogCounterShard(models.Model):
+    """
+    博客互动计数分片：点赞/转发/评论的增量先写入随机分片，
+    再由定时任务合并回 Blog 行，避免热门博客的整行读改写与锁竞争
+    """
+    FIELD_CHOICES = (
+        ('like_count', '点赞数'),
+        ('share_count', '转发数'),
+        ('comment_count', '评论数'),
+    )
+    blog = models.ForeignKey(
+        Blog,
+        on_delete=models.CASCADE,
+        related_name="counter_shards",
+        verbose_name="关联博客"
+    )
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES, verbose_name="计数字段")
+    shard = models.PositiveSmallIntegerField(verbose_name="分片编号")
+    delta = models.IntegerField(default=0, verbose_name="未合并增量")
+
+    class Meta:
+        verbose_name = "博客计数分片"
+        verbose_name_plural = "博客计数分片"
+        unique_together = ("blog", "field", "shard")
+
+    def __str__(self):
+        return f"{self.blog_id}.{self.field}[{self.shard}] {self.delta:+d}"
+
+
+class BlogViewDaily(models.Model):
+    """博客每日浏览统计：浏览次数 + 访客 HyperLogLog 草图（用于估算去重访客数）"""
+    blog = models.ForeignKey(
+        Blog,
+        on_delete=models.CASCADE,
+        related_name="daily_views",
+        verbose_name="关联博客"
+    )
+    day = models.DateField(verbose_name="日期")
+    views = models.PositiveIntegerField(default=0, verbose_name="浏览次数")
+    visitors_sketch = models.BinaryField(default=b'', verbose_name="访客草图")
+
+    class Meta:
+        verbose_name = "博客每日浏览"
+        verbose_name_plural = "博客每日浏览"
+        # 唯一约束的 (blog, day) 索引同时服务按博客、按日期范围的统计查询
+        unique_together = ("blog", "day")
+
+    def __str__(self):
+        return f"{self.blog_id}@{self.day}: {self.views}"
+
+
+class JobState(models.Model):
+    """
+    后台任务的共享状态（热门排行、计数对账检查点等）与互斥租约
+    存在数据库中，所有 Web / worker 进程读写同一行，不依赖缓存后端是否跨进程共享
+    """
+    name = models.CharField(max_length=64, primary_key=True, verbose_name="任务名")
+    data = models.JSONField(null=True, blank=True, verbose_name="任务状态")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="租约到期时间")
+    locked_by = models.CharField(max_length=32, blank=True, default='', verbose_name="租约持有者")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "任务状态"
+        verbose_name_plural = "任务状态"
 
     def __str__(self):
-        return f"{self.author.username} 评论 {self.blog.title}: {self.content[:20]}"
\ No newline at end of file
+        return self.name
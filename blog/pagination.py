@@ -0,0 +1,183 @@
+# blog/pagination.py
+"""
+键集（游标）分页：按 (created_at, id) 倒序翻页
+
+- 游标是 base64 编码后的位置信息，对客户端不透明，只需原样带回 next/previous 链接
+- 每页只执行一条 WHERE (created_at, id) < (?, ?) ORDER BY ... LIMIT n+1 查询，不做 COUNT(*)
+- 页面延迟与翻页深度无关（OFFSET 分页越往后越慢）
+- 只适用于按 (created_at, id) 倒序的结果：带 ?ordering= 或搜索相关度排序时退回页码分页，
+  此时再带 ?cursor= 视为无效游标（游标只在默认排序下生成）
+"""
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at, pk, reverse=False):
+    """把位置 (created_at, id, 方向) 编码为不透明游标"""
+    payload = json.dumps({'t': created_at.isoformat(), 'i': pk, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id, reverse)；游标非法时抛 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        created_at = parse_datetime(data['t'])
+        pk = int(data['i'])
+    except (TypeError, KeyError, ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    if created_at is None:
+        raise ValueError("invalid cursor")
+    return created_at, pk, bool(data.get('r'))
+
+
+def keyset_compatible(queryset, time_field='created_at'):
+    """查询集的排序能否按游标翻页：未显式排序（模型默认按 -created_at）或本就按 (time_field, id) 倒序"""
+    return tuple(queryset.query.order_by) in ((), (f'-{time_field}',), (f'-{time_field}', '-id'))
+
+
+def keyset_slice(queryset, page_size, position=None, reverse=False, time_field='created_at'):
+    """
+    取出紧邻 position 的一页数据（按 time_field、id 倒序），返回 (rows, has_more)
+    - position=None：第一页
+    - reverse=False：position 之后（更旧）的一页
+    - reverse=True：position 之前（更新）的一页，返回结果仍是倒序
+    """
+    if position is None:
+        queryset = queryset.order_by(f'-{time_field}', '-id')
+    else:
+        created_at, pk = position
+        op = 'gt' if reverse else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__{op}': created_at}) | Q(**{time_field: created_at, f'id__{op}': pk})
+        )
+        queryset = queryset.order_by(time_field, 'id') if reverse else queryset.order_by(f'-{time_field}', '-id')
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+    return rows, has_more
+
+
+class KeysetPagination(BasePagination):
+    """基于 (created_at, id) 的游标分页，用法与 DRF 自带分页类一致"""
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    time_field = 'created_at'
+    invalid_cursor_message = '无效的分页游标'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.fallback = None
+
+        raw_cursor = request.query_params.get(self.cursor_query_param)
+        if not keyset_compatible(queryset, self.time_field):
+            # 其它排序（?ordering=、搜索相关度）下游标无法定位，退回页码分页
+            if raw_cursor:
+                raise NotFound(self.invalid_cursor_message)
+            self.fallback = RankingPagination()
+            return self.fallback.paginate_queryset(queryset, request, view)
+        if raw_cursor:
+            try:
+                created_at, pk, reverse = decode_cursor(raw_cursor)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            rows, has_more = keyset_slice(queryset, self.page_size, (created_at, pk), reverse, self.time_field)
+            # 往前翻时：has_more 表示前面还有；往后翻时：has_more 表示后面还有
+            self.has_previous = has_more if reverse else True
+            self.has_next = True if reverse else has_more
+        else:
+            rows, has_more = keyset_slice(queryset, self.page_size, time_field=self.time_field)
+            self.has_previous = False
+            self.has_next = has_more
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        cursor = encode_cursor(getattr(last, self.time_field), last.pk)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        first = self.page[0]
+        cursor = encode_cursor(getattr(first, self.time_field), first.pk, reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        # 与 PageNumberPagination 的返回结构保持一致，只是没有 count（不做 COUNT(*)）
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RankingPagination(PageNumberPagination):
+    """预先排好序的 id 列表（如热门排行）或不能游标翻页的排序的页码分页，不依赖全局 PAGE_SIZE 配置"""
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def is_keyset_request(request):
+    """请求是否要求游标分页：带 cursor 参数，或显式 pagination=cursor"""
+    params = request.query_params
+    return bool(params.get(KeysetPagination.cursor_query_param)) or params.get('pagination') == 'cursor'
+
+
+class KeysetPaginationMixin:
+    """
+    视图混入：请求要求游标分页时改用 KeysetPagination，
+    否则仍使用视图原有的 pagination_class（兼容老客户端的 ?page= 翻页）
+    """
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if is_keyset_request(self.request):
+                self._paginator = self.keyset_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def pagination_state(self, page):
+        """影响分页响应内容的分页信息：总数（页码分页）与前后页链接，用于计算 ETag"""
+        if page is None:
+            return ()
+        paginator = getattr(self.paginator, 'fallback', None) or self.paginator
+        count = paginator.page.paginator.count if hasattr(paginator.page, 'paginator') else None
+        return count, paginator.get_next_link(), paginator.get_previous_link()
+
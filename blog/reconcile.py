@@ -0,0 +1,131 @@
+# blog/reconcile.py
+"""
+博客互动计数对账（like_count / share_count / comment_count）
+
+- 真实值：BlogLike / BlogShare / BlogComment 的行数；当前值：Blog 行上已合并的计数 + 计数分片中未合并的增量
+- 按主键分块扫描博客，每块固定 5 条查询（锁定博客行、三张明细表各一条分组计数、分片增量一条分组求和），
+  只对有偏差的博客 bulk_update（修正已合并的值，使“已合并 + 未合并 = 真实值”），不逐行 save()
+- 检查点：扫描位置与累计统计存在 JobState 行中（所有 worker 共用），与每块的修正在同一事务里提交；
+  任务中断或单次达到 BLOG_RECONCILE_MAX_CHUNKS 块后，下一次从检查点继续；扫描到末尾后清除检查点，下一轮从头开始
+- 互斥：定时任务通过同一行上的租约保证同一时间只有一个 worker 在对账
+- dry_run：只统计偏差（偏差博客数、各字段的偏差行数 / 绝对偏差之和 / 最大偏差），不写库也不记录检查点
+- 计数只出现在详情和 ETag 中，不影响公开列表内容，修正后不需要让列表缓存失效
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import jobs
+from .models import Blog, BlogComment, BlogCounterShard, BlogLike, BlogShare
+
+RECONCILE_JOB = 'blog.reconcile'
+
+SOURCES = {
+    'like_count': BlogLike,
+    'share_count': BlogShare,
+    'comment_count': BlogComment,
+}
+COUNTER_FIELDS = tuple(SOURCES)
+
+
+def chunk_size():
+    return getattr(settings, 'BLOG_RECONCILE_CHUNK_SIZE', 1000)
+
+
+def max_chunks():
+    return getattr(settings, 'BLOG_RECONCILE_MAX_CHUNKS', 50)
+
+
+def empty_stats():
+    return {
+        'scanned': 0,
+        'drifted': 0,
+        'fields': {field: {'rows': 0, 'total': 0, 'max': 0} for field in COUNTER_FIELDS},
+    }
+
+
+def _grouped_counts(model, blog_ids):
+    rows = model.objects.filter(blog_id__in=blog_ids).order_by().values_list('blog_id').annotate(total=Count('id'))
+    return dict(rows)
+
+
+def reconcile_chunk(blog_ids, stats, dry_run=False):
+    """对一块博客计算偏差并（非 dry_run 时）修正，统计累加到 stats 中，返回修正的博客数"""
+    with transaction.atomic():
+        stored = {
+            row['id']: row
+            for row in Blog.objects.select_for_update().filter(pk__in=blog_ids).order_by().values('id', *COUNTER_FIELDS)
+        }
+        actual = {field: _grouped_counts(model, blog_ids) for field, model in SOURCES.items()}
+        pending = {
+            (blog_id, field): total
+            for blog_id, field, total in BlogCounterShard.objects.filter(blog_id__in=blog_ids)
+            .order_by().values_list('blog_id', 'field').annotate(total=Sum('delta'))
+        }
+        fixed = []
+        for pk, row in stored.items():
+            targets = {
+                field: actual[field].get(pk, 0) - pending.get((pk, field), 0) for field in COUNTER_FIELDS
+            }
+            drift = {field: targets[field] - row[field] for field in COUNTER_FIELDS if targets[field] != row[field]}
+            if not drift:
+                continue
+            for field, amount in drift.items():
+                field_stats = stats['fields'][field]
+                field_stats['rows'] += 1
+                field_stats['total'] += abs(amount)
+                field_stats['max'] = max(field_stats['max'], abs(amount))
+            fixed.append(Blog(pk=pk, **targets))
+        stats['scanned'] += len(stored)
+        stats['drifted'] += len(fixed)
+        if fixed and not dry_run:
+            Blog.objects.bulk_update(fixed, COUNTER_FIELDS)
+    return len(fixed)
+
+
+def run(dry_run=False, size=None, limit=None):
+    """
+    从检查点开始按主键分块对账，最多处理 limit 块（默认 BLOG_RECONCILE_MAX_CHUNKS，0 表示扫描到末尾）
+    返回 {'scanned', 'drifted', 'fields', 'last_pk', 'finished'}，非 dry_run 时统计为本轮（跨多次任务）累计值
+    """
+    size = size or chunk_size()
+    limit = max_chunks() if limit is None else limit
+    checkpoint = None if dry_run else jobs.load(RECONCILE_JOB)
+    if checkpoint is None:
+        checkpoint = {'last_pk': 0, 'started_at': time.time(), 'stats': empty_stats()}
+    stats, last_pk = checkpoint['stats'], checkpoint['last_pk']
+
+    finished, done = False, 0
+    ids = Blog.objects.order_by('pk').values_list('pk', flat=True)
+    while not limit or done < limit:
+        blog_ids = list(ids.filter(pk__gt=last_pk)[:size])
+        if not blog_ids:
+            finished = True
+            break
+        with transaction.atomic():
+            reconcile_chunk(blog_ids, stats, dry_run)
+            last_pk, done = blog_ids[-1], done + 1
+            if not dry_run:
+                jobs.save(RECONCILE_JOB, {**checkpoint, 'last_pk': last_pk, 'stats': stats})
+
+    if finished and not dry_run:
+        jobs.clear(RECONCILE_JOB)
+    return {**stats, 'last_pk': last_pk, 'finished': finished}
+
+
+def run_locked(dry_run=False):
+    """定时任务入口：同一时间只有一个 worker 在对账；未拿到锁返回 None"""
+    with jobs.lease(RECONCILE_JOB, getattr(settings, 'BLOG_RECONCILE_LOCK_TIMEOUT', 3600)) as acquired:
+        return run(dry_run=dry_run) if acquired else None
+
+
+def describe(report):
+    """对账结果的单行摘要"""
+    fields = '，'.join(
+        f"{field} {item['rows']} 篇偏差（合计 {item['total']}，最大 {item['max']}）"
+        for field, item in report['fields'].items()
+    )
+    state = '已扫描完全部博客' if report['finished'] else f"进度 id≤{report['last_pk']}"
+    return f"扫描 {report['scanned']} 篇，{report['drifted']} 篇存在偏差：{fields}；{state}"
@@ -0,0 +1,194 @@
+# blog/rendering.py
+"""
+博客正文预渲染：保存时把 content 渲染成安全的 HTML、纯文本摘要、字数和阅读时长，存入 Blog 表
+
+- 正文可以是纯文本，也可以带少量 HTML；白名单外的标签、属性、javascript: 等链接全部去掉，
+  script/style 连同内容一起丢弃，其余文本一律转义
+- 没有段落级标签的正文先过滤再按空行分段（<p>），段内换行转为 <br>；跨空行的行内标签在段落边界处闭合、
+  下一段重新打开，每个 <p> 内的标签都完整配对
+- 字数：中日韩文字按字计，英文数字按词计；阅读时长按 BLOG_READING_SPEED（字/分钟）向上取整
+- 增量：content_digest 记录渲染时正文（及渲染版本）的摘要，正文未变的保存不重新渲染；
+  修改渲染规则时递增 RENDER_VERSION，再执行 render_blog_content 命令批量回填
+"""
+import hashlib
+import html
+import math
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.html import escape, normalize_newlines
+from django.utils.text import Truncator
+
+# 渲染规则变化时递增，已渲染的博客会被视为过期
+RENDER_VERSION = 1
+# Blog 上由渲染结果填充的字段
+RENDERED_FIELDS = ('content_html', 'excerpt', 'word_count', 'reading_time', 'content_digest')
+
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'strong', 'b', 'em', 'i', 'u', 's', 'del', 'code', 'pre', 'blockquote',
+    'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'a', 'img',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+BLOCK_TAGS = {'p', 'pre', 'blockquote', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'hr'}
+VOID_TAGS = {'br', 'hr', 'img'}
+# 整段丢弃（连同内容）的标签
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'}
+ALLOWED_ATTRS = {'a': {'href', 'title'}, 'img': {'src', 'alt', 'title'}}
+URL_ATTRS = {'href', 'src'}
+ALLOWED_SCHEMES = {'', 'http', 'https', 'mailto'}
+
+_WORD_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]|[0-9A-Za-z_]+')
+_PARAGRAPH_RE = re.compile(r'\n{2,}')
+_TAG_RE = re.compile(r'(<[^>]*>)')
+_TAG_NAME_RE = re.compile(r'</?(\w+)')
+
+
+def _safe_url(value):
+    value = (value or '').strip()
+    # 浏览器会忽略协议名中的空白/控制字符，先去掉再判断协议
+    scheme = urlsplit(re.sub(r'[\x00-\x20]', '', value)).scheme.lower()
+    return value if scheme in ALLOWED_SCHEMES else None
+
+
+class _Sanitizer(HTMLParser):
+    """按白名单重建 HTML：保留允许的标签和属性，其余标签去掉但保留文字"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self.dropping = 0
+        self.has_block = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        kept = []
+        for name, value in attrs:
+            if name not in ALLOWED_ATTRS.get(tag, ()):
+                continue
+            if name in URL_ATTRS:
+                value = _safe_url(value)
+                if value is None:
+                    continue
+            kept.append(f' {name}="{escape(value or "")}"')
+        if tag == 'a':
+            kept.append(' rel="nofollow noopener"')
+        self.parts.append(f"<{tag}{''.join(kept)}>")
+        self.has_block = self.has_block or tag in BLOCK_TAGS
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        # 补齐中间未闭合的标签，保证输出结构完整
+        while self.open_tags:
+            current = self.open_tags.pop()
+            self.parts.append(f"</{current}>")
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.parts.append(escape(data))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.parts.append(f"</{self.open_tags.pop()}>")
+        return ''.join(self.parts)
+
+
+def sanitize(content):
+    """返回 (安全的 HTML, 是否包含段落级标签)"""
+    parser = _Sanitizer()
+    parser.feed(content)
+    return parser.close(), parser.has_block
+
+
+def _paragraphs(content_html):
+    """
+    按空行分段；content_html 为 sanitize() 的输出（标签完整配对，文本中没有未转义的 <）
+    段落边界处依次闭合仍打开的行内标签，下一段开头按原样（含属性）重新打开
+    """
+    paragraphs, current, open_tags = [], [], []
+    for token in _TAG_RE.split(normalize_newlines(content_html).strip()):
+        if token.startswith('<'):
+            current.append(token)
+            if token.startswith('</'):
+                open_tags.pop()
+            elif _TAG_NAME_RE.match(token).group(1) not in VOID_TAGS:
+                open_tags.append(token)
+            continue
+        for index, piece in enumerate(_PARAGRAPH_RE.split(token)):
+            if index:
+                current.extend(f"</{_TAG_NAME_RE.match(tag).group(1)}>" for tag in reversed(open_tags))
+                paragraphs.append(''.join(current))
+                current = list(open_tags)
+            current.append(piece.replace('\n', '<br>'))
+    paragraphs.append(''.join(current))
+    # 只剩空标签的段落（例如只有空白的行内元素）不输出，图片段落保留
+    return ''.join(
+        f"<p>{paragraph.strip()}</p>" for paragraph in paragraphs
+        if _TAG_RE.sub('', paragraph).strip() or '<img' in paragraph
+    )
+
+
+def plain_text(content_html):
+    """HTML → 空白折叠后的纯文本"""
+    text = re.sub(r'<[^>]*>', ' ', content_html)
+    return ' '.join(html.unescape(text).split())
+
+
+def count_words(text):
+    return len(_WORD_RE.findall(text))
+
+
+def digest(content):
+    return hashlib.md5(f"{RENDER_VERSION}:{content}".encode()).hexdigest()
+
+
+def render(content):
+    """渲染正文，返回 RENDERED_FIELDS 对应的字段值"""
+    content = content or ''
+    content_html, has_block = sanitize(content)
+    if not has_block:
+        content_html = _paragraphs(content_html)
+    text = plain_text(content_html)
+    word_count = count_words(text)
+    speed = getattr(settings, 'BLOG_READING_SPEED', 300)
+    return {
+        'content_html': content_html,
+        'excerpt': Truncator(text).chars(getattr(settings, 'BLOG_EXCERPT_LENGTH', 140)),
+        'word_count': word_count,
+        'reading_time': math.ceil(word_count / speed) if word_count else 0,
+        'content_digest': digest(content),
+    }
+
+
+def refresh(blog):
+    """
+    正文变化（或渲染版本升级）时重新渲染并写到实例上，返回是否重新渲染
+    正文被 only()/defer() 延迟加载时不处理
+    """
+    if 'content' in blog.get_deferred_fields():
+        return False
+    if blog.content_digest == digest(blog.content):
+        return False
+    for field, value in render(blog.content).items():
+        setattr(blog, field, value)
+    return True
@@ -0,0 +1,231 @@
+# blog/search.py
+"""
+博客全文搜索：本地 SQLite 倒排索引 + BM25 排序
+
+- 分词：英文/数字按词切分并转小写；中日韩文字切成单字 + 二元组（n-gram），不依赖分词词典
+- 存储：独立的 SQLite 文件（settings.BLOG_SEARCH_INDEX_PATH），单机即可使用
+  postings(term, blog_id) 为主键，按词项查倒排表只走索引范围扫描，
+  文档总数、总长度维护在 meta 表中，查询耗时只与命中词的倒排表长度有关，与博客总量无关
+- 剪枝：常见词（如高频汉字单字/二元组）的倒排表很长，每个词只按词频从高到低读取前
+  BLOG_SEARCH_MAX_POSTINGS_PER_TERM 条参与打分（文档频率仍按完整倒排表计数，只在 SQLite 内部计数）
+- 更新：博客保存/删除时由 blog/signals.py 增量同步（只索引公开且已发布的博客）
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, When
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字（汉字、假名、谚文）连续片段 / 英文数字词
+_CJK_RE = r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]'
+_TOKEN_RE = re.compile(rf'({_CJK_RE}+)|([0-9a-z_]+)')
+MAX_TERM_LENGTH = 40
+TITLE_WEIGHT = 3  # 标题中的词按 3 倍词频计
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text, for_query=False):
+    """
+    把文本切成词项列表
+    - 英文数字：整词（小写）
+    - 中日韩片段：索引时输出单字 + 二元组；查询时片段长度 ≥2 只用二元组，单字查询用单字
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall((text or '').lower()):
+        if word:
+            if len(word) <= MAX_TERM_LENGTH:
+                tokens.append(word)
+            continue
+        bigrams = [cjk[i:i + 2] for i in range(len(cjk) - 1)]
+        if for_query:
+            tokens.extend(bigrams or [cjk])
+        else:
+            tokens.extend(cjk)
+            tokens.extend(bigrams)
+    return tokens
+
+
+class SearchIndex:
+    """基于 SQLite 的倒排索引，每个线程持有独立连接"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS docs (blog_id INTEGER PRIMARY KEY, length REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS postings ("
+        " term TEXT NOT NULL, blog_id INTEGER NOT NULL, tf REAL NOT NULL,"
+        " PRIMARY KEY (term, blog_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS postings_blog_id ON postings (blog_id)",
+        # 剪枝时按词频倒序读取一个词的前 N 条倒排记录
+        "CREATE INDEX IF NOT EXISTS postings_term_tf ON postings (term, tf DESC)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)",
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('doc_count', 0), ('total_length', 0)",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    # ---------- 写入 ----------
+    def index(self, blog_id, title, content):
+        """（重新）索引一篇博客"""
+        weights = Counter()
+        for term in tokenize(title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(content):
+            weights[term] += 1
+        length = sum(weights.values())
+
+        with self.conn as conn:
+            self._remove(conn, blog_id)
+            conn.executemany(
+                "INSERT INTO postings (term, blog_id, tf) VALUES (?, ?, ?)",
+                [(term, blog_id, tf) for term, tf in weights.items()]
+            )
+            conn.execute("INSERT INTO docs (blog_id, length) VALUES (?, ?)", (blog_id, length))
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'doc_count'")
+            conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_length'", (length,))
+
+    def remove(self, blog_id):
+        """从索引中移除一篇博客（不存在时忽略）"""
+        with self.conn as conn:
+            self._remove(conn, blog_id)
+
+    def _remove(self, conn, blog_id):
+        row = conn.execute("SELECT length FROM docs WHERE blog_id = ?", (blog_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute("DELETE FROM postings WHERE blog_id = ?", (blog_id,))
+        conn.execute("DELETE FROM docs WHERE blog_id = ?", (blog_id,))
+        conn.execute("UPDATE meta SET value = value - 1 WHERE key = 'doc_count'")
+        conn.execute("UPDATE meta SET value = value - ? WHERE key = 'total_length'", (row[0],))
+
+    def clear(self):
+        with self.conn as conn:
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM docs")
+            conn.execute("UPDATE meta SET value = 0")
+
+    # ---------- 查询 ----------
+    def search(self, query, limit=200, max_postings=None):
+        """按 BM25 得分返回 [(blog_id, score), ...]，得分从高到低；每个词最多读取 max_postings 条倒排记录"""
+        max_postings = max_postings or max_postings_per_term()
+        terms = set(tokenize(query, for_query=True))
+        if not terms:
+            return []
+        conn = self.conn
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        doc_count = meta.get('doc_count', 0)
+        if doc_count <= 0:
+            return []
+        avg_length = meta.get('total_length', 0) / doc_count or 1.0
+
+        scores = Counter()
+        for term in terms:
+            postings = conn.execute(
+                "SELECT p.blog_id, p.tf, d.length FROM postings p JOIN docs d ON d.blog_id = p.blog_id"
+                " WHERE p.term = ? ORDER BY p.tf DESC LIMIT ?", (term, max_postings)
+            ).fetchall()
+            if not postings:
+                continue
+            df = len(postings)
+            if df >= max_postings:
+                df = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for blog_id, tf, length in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[blog_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def max_postings_per_term():
+    return getattr(settings, 'BLOG_SEARCH_MAX_POSTINGS_PER_TERM', 5000)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index():
+    """按配置路径返回（并缓存）索引实例"""
+    path = getattr(settings, 'BLOG_SEARCH_INDEX_PATH', os.path.join(settings.BASE_DIR, 'search_index.sqlite3'))
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = SearchIndex(path)
+        return _indexes[path]
+
+
+def is_searchable(is_public, status):
+    """只有公开且已发布的博客才进入索引"""
+    return is_public and status == 'published'
+
+
+def sync_blog(blog_id):
+    """按数据库中的最新状态同步一篇博客：可搜索则（重新）索引，否则移出索引"""
+    sync_blogs([blog_id])
+
+
+def sync_blogs(blog_ids):
+    """批量同步：一次查询取回所有博客的最新状态（批量操作 update() 后使用）"""
+    from .models import Blog
+
+    try:
+        rows = {
+            row['id']: row
+            for row in Blog.objects.filter(pk__in=blog_ids).values('id', 'title', 'content', 'is_public', 'status')
+        }
+    except Exception:
+        logger.exception("读取博客 %s 失败，未同步搜索索引", blog_ids)
+        return
+    for blog_id in blog_ids:
+        row = rows.get(blog_id)
+        try:
+            if row and is_searchable(row['is_public'], row['status']):
+                get_index().index(blog_id, row['title'], row['content'])
+            else:
+                get_index().remove(blog_id)
+        except Exception:
+            # 索引失败不影响博客本身的保存，可用 rebuild_search_index 命令重建
+            logger.exception("同步博客 %s 的搜索索引失败", blog_id)
+
+
+class BlogSearchFilter(filters.SearchFilter):
+    """
+    用倒排索引替代 SearchFilter 的 LIKE '%q%' 全表扫描：
+    ?search= 命中的博客按 BM25 得分排序（再带 ?ordering= 时以 ordering 为准）
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        limit = getattr(settings, 'BLOG_SEARCH_MAX_RESULTS', 200)
+        ids = [blog_id for blog_id, _ in get_index().search(query, limit=limit)]
+        if not ids:
+            return queryset.none()
+        rank = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('search_rank')
@@ -1,35 +1,106 @@
 # blog/serializers.py
 from rest_framework import serializers
+from django.db import models
 from .models import Blog
+from . import interactions
 from django.conf import settings  # 新增：动态引用用户模型
 from django.contrib.auth import get_user_model  # 新增：获取实际用户模型
+from utils.sparse_fields import SparseFieldsetMixin
+from .covers import cover_images_payload
+from user import uploads
 
 User = get_user_model()  # 动态获取用户模型（兼容默认/自定义）
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User  # 用动态获取的User模型，而非硬编码
         fields = ['id', 'username', 'email']
 
 class BlogSerializer(serializers.ModelSerializer):
+    # 封面也可以先走分片上传（/uploads/），这里传 finalize 后的 upload_id 引用
+    cover_upload_id = serializers.UUIDField(write_only=True, required=False)
+
     class Meta:
         model = Blog
-        fields = ['id', 'title', 'content', 'cover_image', 'is_public', 'status']
+        fields = ['id', 'title', 'content', 'cover_image', 'cover_upload_id', 'is_public', 'status']
         read_only_fields = ['author', 'created_at', 'updated_at']
 
+    def validate(self, attrs):
+        upload_id = attrs.pop('cover_upload_id', None)
+        if upload_id:
+            try:
+                self._cover_upload = uploads.get_completed(self.context['request'].user, upload_id)
+            except uploads.UploadError as e:
+                raise serializers.ValidationError({'cover_upload_id': str(e)})
+            attrs['cover_image'] = uploads.open_file(self._cover_upload)
+        return attrs
+
+    def save(self, **kwargs):
+        cover_upload = getattr(self, '_cover_upload', None)
+        try:
+            instance = super().save(**kwargs)
+        finally:
+            if cover_upload is not None:
+                self.validated_data['cover_image'].close()
+        # 封面已存入媒体目录，删除分片上传会话和临时文件
+        if cover_upload is not None:
+            uploads.discard(cover_upload)
+        return instance
+
     def create(self, validated_data):
         # 增加request存在性判断
         if 'request' in self.context:
             validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
-class BlogListSerializer(serializers.ModelSerializer):
+VIEWER_STATE_FIELDS = ('is_liked', 'is_shared')
+VIEWER_STATE_SOURCES = {name: ('id',) for name in VIEWER_STATE_FIELDS}
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """整页序列化前用一条查询取回当前用户对本页博客的点赞/转发状态，逐条序列化时直接读取"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if any(name in self.child.fields for name in VIEWER_STATE_FIELDS):
+            request = self.context.get('request')
+            self.context['viewer_state'] = interactions.viewer_state(
+                getattr(request, 'user', None), [item.pk for item in items]
+            )
+        return super().to_representation(items)
+
+
+class ViewerStateMixin:
+    """is_liked / is_shared：当前用户是否点赞/转发过（匿名用户均为 False）"""
+
+    def _viewer_state(self, obj):
+        state = self.context.get('viewer_state')
+        if state is None:
+            # 单条序列化（详情）时只查这一篇
+            request = self.context.get('request')
+            state = self.context['viewer_state'] = interactions.viewer_state(getattr(request, 'user', None), [obj.pk])
+        return state
+
+    def get_is_liked(self, obj):
+        return obj.pk in self._viewer_state(obj)[0]
+
+    def get_is_shared(self, obj):
+        return obj.pk in self._viewer_state(obj)[1]
+
+
+class BlogListSerializer(ViewerStateMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     cover_image_url = serializers.SerializerMethodField()
+    cover_images = serializers.SerializerMethodField()
+    is_liked = serializers.SerializerMethodField()
+    is_shared = serializers.SerializerMethodField()
+    sparse_sources = {'cover_image_url': ('cover_image',), 'cover_images': ('cover_image', 'cover_renditions'), **VIEWER_STATE_SOURCES}
 
     class Meta:
         model = Blog
-        fields = ['id', 'title', 'author', 'created_at', 'cover_image_url', 'is_public', 'status']
+        # 列表只输出预渲染的摘要，不读取正文
+        fields = ['id', 'title', 'excerpt', 'word_count', 'reading_time', 'author', 'created_at', 'cover_image_url', 'cover_images', 'is_public', 'status', 'is_liked', 'is_shared']
+        list_serializer_class = ViewerStateListSerializer
 
     def get_cover_image_url(self, obj):
         # 关键修复：先判断request是否存在，避免KeyError
@@ -38,13 +109,23 @@ class BlogListSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.cover_image.url)
         return None
 
-class BlogDetailSerializer(serializers.ModelSerializer):
+    def get_cover_images(self, obj):
+        # 原图 + 后台生成的 WebP/JPEG 多尺寸版本（srcset），列表页按需取小图
+        return cover_images_payload(obj, self.context.get('request'))
+
+class BlogDetailSerializer(ViewerStateMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     cover_image_url = serializers.SerializerMethodField()
+    cover_images = serializers.SerializerMethodField()
+    is_liked = serializers.SerializerMethodField()
+    is_shared = serializers.SerializerMethodField()
+    sparse_sources = {'cover_image_url': ('cover_image',), 'cover_images': ('cover_image', 'cover_renditions'), **VIEWER_STATE_SOURCES}
 
     class Meta:
         model = Blog
-        fields = ['id', 'title', 'content', 'author', 'created_at', 'updated_at', 'cover_image_url', 'is_public', 'status']
+        fields = ['id', 'title', 'content', 'content_html', 'excerpt', 'word_count', 'reading_time', 'author', 'created_at', 'updated_at', 'cover_image_url', 'cover_images', 'is_public', 'status', 'is_liked', 'is_shared']
+        read_only_fields = ['content_html', 'excerpt', 'word_count', 'reading_time']
+        list_serializer_class = ViewerStateListSerializer
 
     def get_cover_image_url(self, obj):
         # 同样增加request存在性判断
@@ -53,6 +134,9 @@ class BlogDetailSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.cover_image.url)
         return None
 
+    def get_cover_images(self, obj):
+        return cover_images_payload(obj, self.context.get('request'))
+
     def create(self, validated_data):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
@@ -67,6 +151,23 @@ class BlogCreateUpdateSerializer(serializers.ModelSerializer):
             'status': {'default': 'draft', 'choices': Blog.STATUS_CHOICES}
         }
 
+class BlogBulkSerializer(serializers.Serializer):
+    """批量操作入参：博客 id 列表"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=getattr(settings, 'BLOG_BULK_MAX_IDS', 500), label="博客ID列表"
+    )
+
+class BlogBulkUpdateSerializer(BlogBulkSerializer):
+    """批量修改入参：status / is_public 至少提供一个"""
+    status = serializers.ChoiceField(choices=Blog.STATUS_CHOICES, required=False, label="状态")
+    is_public = serializers.BooleanField(required=False, label="是否公开")
+
+    def validate(self, attrs):
+        if 'status' not in attrs and 'is_public' not in attrs:
+            raise serializers.ValidationError('请至少提供 status 或 is_public')
+        return attrs
+
 
 from rest_framework import serializers
 from .models import Blog, BlogComment
@@ -77,13 +178,36 @@ class BlogCommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BlogComment
-        fields = ["id", "author_username", "content", "created_at"]
-        read_only_fields = ["id", "author", "created_at"]
+        fields = ["id", "author_username", "content", "created_at", "parent_id", "depth", "reply_count"]
+        read_only_fields = ["id", "author", "created_at", "parent_id", "depth", "reply_count"]
+
+# 楼层序列化器：顶层评论 + 前 N 条回复（回复由视图一次查出，放在 context["replies"] 中）
+class BlogCommentThreadSerializer(BlogCommentSerializer):
+    replies = serializers.SerializerMethodField()
+
+    class Meta(BlogCommentSerializer.Meta):
+        fields = BlogCommentSerializer.Meta.fields + ["replies"]
+
+    def get_replies(self, obj):
+        return BlogCommentSerializer(self.context.get("replies", {}).get(obj.pk, []), many=True).data
 
 # 发布评论的入参序列化器
 class AddBlogCommentSerializer(serializers.Serializer):
     blog_id = serializers.IntegerField(label="博客ID")
     content = serializers.CharField(label="评论内容", min_length=1, max_length=500)
+    parent_id = serializers.IntegerField(label="回复的评论ID", required=False, allow_null=True)
+
+    def validate(self, attrs):
+        """回复时验证被回复的评论属于同一篇博客"""
+        parent_id = attrs.get("parent_id")
+        if parent_id:
+            parent = BlogComment.objects.filter(id=parent_id, blog_id=attrs["blog_id"]).only(
+                "id", "blog_id", "parent_id", "root_id", "path", "depth"
+            ).first()
+            if parent is None:
+                raise serializers.ValidationError({"code": 400, "message": "回复的评论不存在"})
+            self.context["parent"] = parent
+        return attrs
 
     def validate_blog_id(self, value):
         """验证博客存在且公开"""
@@ -0,0 +1,230 @@
+# blog/signals.py
+"""
+博客模型信号：
+- 记录实例加载时的公开/发布状态，用于判断一次保存是否影响公开列表
+- 保存/删除后（事务提交时）同步搜索索引
+- 公开列表可见的博客发生变化时，递增列表缓存版本号
+- 封面图变化时（事务提交后）投递生成多尺寸版本的后台任务，并删除旧封面的版本文件；博客删除后删除其版本文件
+- 博客进入/离开公开列表、好友关系变化时（事务提交后）投递更新好友时间线的后台任务
+- 博客新建/发布状态变化/删除时，在同一事务内增量更新作者的用户统计（UserStats）
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache as list_cache
+from . import counters, covers, search
+from .models import Blog
+from user import stats as user_stats
+from user.models import Friend, User
+
+logger = logging.getLogger(__name__)
+
+# 这些字段变化才会影响搜索结果（计数类字段的 update_fields 保存不触发重建索引）
+SEARCH_FIELDS = {'title', 'content', 'is_public', 'status'}
+# 只改这些字段时不影响公开列表的内容
+COUNTER_FIELDS = {'like_count', 'share_count', 'comment_count'}
+
+
+def is_listed(is_public, status):
+    """是否出现在公开列表中"""
+    return bool(is_public) and status == 'published'
+
+
+def was_listed(instance):
+    """
+    实例加载（或上次保存）时是否出现在公开列表中
+    返回 None 表示未知（新建实例，或 is_public/status 被 only()/defer() 延迟加载）
+    """
+    return getattr(instance, '_was_listed', None)
+
+
+def _remember_listed(instance):
+    # post_init 在 from_db() 设置 _state.adding 之前触发，只能用主键是否为空区分新建实例
+    fields = instance.__dict__
+    if instance.pk is None or 'is_public' not in fields or 'status' not in fields:
+        instance._was_listed = None
+    else:
+        instance._was_listed = is_listed(fields['is_public'], fields['status'])
+
+
+def _remember_cover(instance):
+    # 封面图被 only()/defer() 延迟加载时记为未知（None）
+    cover = instance.__dict__.get('cover_image', None) if instance.pk is not None else ''
+    instance._loaded_cover = getattr(cover, 'name', cover)
+
+
+def _remember_status(instance):
+    # 新建实例、status 被延迟加载时记为未知（None）
+    instance._loaded_status = instance.__dict__.get('status') if instance.pk is not None else None
+
+
+@receiver(post_init, sender=Blog)
+def remember_listed_state(sender, instance, **kwargs):
+    _remember_listed(instance)
+    _remember_cover(instance)
+    _remember_status(instance)
+
+
+@receiver(post_save, sender=Blog)
+def sync_search_index_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    blog_id = instance.pk
+    transaction.on_commit(lambda: search.sync_blog(blog_id))
+
+
+def enqueue_task(name, *args):
+    """事务提交后投递 blog.tasks 中的任务；消息队列不可用时只记录日志，不影响保存"""
+    def enqueue():
+        from . import tasks
+        try:
+            getattr(tasks, name).delay(*args)
+        except Exception:
+            logger.exception("投递后台任务失败：%s%s", name, args)
+    transaction.on_commit(enqueue)
+
+
+def sync_timeline(blog_id, before, after):
+    """按保存前后是否在公开列表中推送/撤回时间线（状态未知时两种操作都是幂等的）"""
+    if after and before is not True:
+        enqueue_task('fan_out_blog', blog_id)
+    elif not after and before is not False:
+        enqueue_task('retract_blog', blog_id)
+
+
+# 须在 invalidate_list_cache_on_save 之前注册：后者会刷新实例上记录的 _was_listed
+@receiver(post_save, sender=Blog)
+def update_timeline_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) <= COUNTER_FIELDS):
+        return
+    sync_timeline(instance.pk, was_listed(instance), is_listed(instance.is_public, instance.status))
+
+
+@receiver(post_save, sender=Blog)
+def invalidate_list_cache_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= COUNTER_FIELDS:
+        return
+    before = was_listed(instance)
+    after = is_listed(instance.is_public, instance.status)
+    # 保存前后任一时刻在公开列表中（状态未知时保守处理），都要让列表缓存失效
+    if before or after or before is None:
+        transaction.on_commit(list_cache.bump_generation)
+    _remember_listed(instance)
+
+
+@receiver(post_save, sender=Blog)
+def update_user_stats_on_save(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'status' not in update_fields):
+        return
+    published = instance.status == 'published'
+    if created:
+        user_stats.incr(instance.author_id, blog_count=1, published_count=int(published))
+    elif instance._loaded_status is not None:
+        user_stats.incr(instance.author_id, published_count=published - (instance._loaded_status == 'published'))
+    _remember_status(instance)
+
+
+def _deleted_with_user(origin):
+    # 删除用户时级联删除的博客不用再扣减（统计行随用户一起删除）
+    return getattr(origin, 'model', type(origin)) is User
+
+
+@receiver(pre_delete, sender=Blog)
+def subtract_pending_counters_on_delete(sender, instance, origin=None, **kwargs):
+    # 分片随博客级联删除，须在删除前读出未合并的增量；批量删除时由 bulk.delete 一次性扣减
+    if user_stats.batching() or _deleted_with_user(origin) or 'author_id' not in instance.__dict__:
+        return
+    user_stats.incr(instance.author_id, **user_stats.received_deltas(counters.pending([instance.pk])))
+
+
+@receiver(post_delete, sender=Blog)
+def update_user_stats_on_delete(sender, instance, origin=None, **kwargs):
+    fields = instance.__dict__
+    if _deleted_with_user(origin) or 'author_id' not in fields:
+        return  # 作者被延迟加载时偏差交给 rebuild_user_stats
+    # 博客的点赞/转发/评论随之级联删除：这里扣减已合并到 Blog 行的部分
+    user_stats.incr(
+        fields['author_id'],
+        blog_count=-1,
+        published_count=-int(fields.get('status') == 'published'),
+        view_count=-fields.get('view_count', 0),
+        **user_stats.received_deltas(fields),
+    )
+
+
+@receiver(post_delete, sender=Blog)
+def remove_search_index_on_delete(sender, instance, **kwargs):
+    blog_id = instance.pk
+    transaction.on_commit(lambda: search.get_index().remove(blog_id))
+
+
+@receiver(post_delete, sender=Blog)
+def invalidate_list_cache_on_delete(sender, instance, **kwargs):
+    if was_listed(instance) is not False:
+        transaction.on_commit(list_cache.bump_generation)
+
+
+@receiver(post_delete, sender=Blog)
+def retract_timeline_on_delete(sender, instance, **kwargs):
+    if was_listed(instance) is not False:
+        enqueue_task('retract_blog', instance.pk)
+
+
+@receiver(post_save, sender=Friend)
+def merge_timelines_on_friend_approved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.is_approved:
+        enqueue_task('sync_friend_timelines', instance.user_id, instance.friend_id, True)
+
+
+@receiver(post_delete, sender=Friend)
+def unmerge_timelines_on_friend_deleted(sender, instance, **kwargs):
+    if instance.is_approved:
+        enqueue_task('sync_friend_timelines', instance.user_id, instance.friend_id, False)
+
+
+def _enqueue_cover_renditions(blog_id):
+    from .tasks import generate_cover_renditions
+    try:
+        generate_cover_renditions.delay(blog_id)
+    except Exception:
+        # 消息队列不可用时不影响保存，序列化器会回退到原图
+        logger.exception("投递封面图版本生成任务失败：blog_id=%s", blog_id)
+
+
+@receiver(pre_save, sender=Blog)
+def reset_cover_renditions_on_replace(sender, instance, raw=False, update_fields=None, **kwargs):
+    # 完整保存会把实例上旧封面的 cover_renditions 一并写回：封面被替换或清空时先置空，不再引用旧版本文件
+    instance._stale_renditions = None
+    if raw or update_fields is not None or instance._loaded_cover is None:
+        return
+    name = instance.cover_image.name if instance.cover_image else ''
+    if name != instance._loaded_cover and instance.__dict__.get('cover_renditions'):
+        instance._stale_renditions, instance.cover_renditions = instance.cover_renditions, {}
+
+
+@receiver(post_save, sender=Blog)
+def generate_cover_renditions_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'cover_image' not in update_fields):
+        return
+    name = instance.cover_image.name if instance.cover_image else ''
+    blog_id = instance.pk
+    if name and name != instance._loaded_cover:
+        transaction.on_commit(lambda: _enqueue_cover_renditions(blog_id))
+    # 封面被替换或清空：旧封面的版本文件不再被引用（封面加载状态未知时不处理，交给下次生成时清理）
+    stale = getattr(instance, '_stale_renditions', None) or instance.__dict__.get('cover_renditions')
+    if stale and instance._loaded_cover is not None and name != instance._loaded_cover:
+        transaction.on_commit(lambda: covers.discard_stale(blog_id, stale))
+    instance._stale_renditions = None
+    _remember_cover(instance)
+
+
+@receiver(post_delete, sender=Blog)
+def discard_cover_renditions_on_delete(sender, instance, **kwargs):
+    renditions = instance.__dict__.get('cover_renditions')
+    if renditions:
+        transaction.on_commit(lambda: covers.discard(renditions))
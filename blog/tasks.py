@@ -0,0 +1,131 @@
+# blog/tasks.py
+from celery import shared_task
+
+from . import counters, covers, hot, reconcile, timeline, viewcounts
+
+
+@shared_task
+def flush_blog_counters():
+    """
+    定时合并博客互动计数：
+    - 把点赞/转发/评论计数分片中的增量合并回 Blog 行
+    """
+    try:
+        flushed = counters.flush()
+        print(f"成功合并{flushed}组博客计数")
+        return f"合并完成，共处理{flushed}组计数"
+    except Exception as e:
+        print(f"合并博客计数失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def reconcile_blog_counters(dry_run=False):
+    """
+    定时对账博客互动计数：
+    - 按主键分块用分组计数重算点赞/转发/评论数，只修正有偏差的博客，从检查点续跑
+    - dry_run=True 时只统计偏差，不写库
+    """
+    try:
+        report = reconcile.run_locked(dry_run=dry_run)
+        if report is None:
+            print("计数对账正在由其它任务执行，跳过本次")
+            return "跳过"
+        print(f"计数对账{'（演练）' if dry_run else ''}：{reconcile.describe(report)}")
+        return report
+    except Exception as e:
+        print(f"计数对账失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def flush_blog_views(rows):
+    """
+    合并 Web 进程缓冲的浏览量：
+    - 浏览次数累加，访客草图按寄存器取最大值合并
+    """
+    try:
+        merged = viewcounts.apply(rows)
+        print(f"成功合并{merged}组博客浏览量")
+        return merged
+    except Exception as e:
+        print(f"合并博客浏览量失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def recompute_hot_ranking():
+    """
+    定时增量计算热门排行：
+    - 旧热度按时间衰减，再加上新的点赞/转发/评论事件
+    """
+    try:
+        ranked = hot.run_locked()
+        if ranked is None:
+            print("热门排行正在由其它任务计算，跳过本次")
+            return "跳过"
+        print(f"热门排行更新完成，共{ranked}篇博客")
+        return f"排行更新完成，共{ranked}篇博客"
+    except Exception as e:
+        print(f"热门排行计算失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def generate_cover_renditions(blog_id):
+    """
+    封面图上传后生成多尺寸版本：
+    - 固定宽度的 WebP / JPEG，去掉元数据，记录尺寸
+    """
+    try:
+        generated = covers.generate(blog_id)
+        print(f"博客{blog_id}封面版本{'生成完成' if generated else '无需生成'}")
+        return generated
+    except Exception as e:
+        print(f"生成博客{blog_id}封面版本失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def fan_out_blog(blog_id):
+    """
+    博客进入公开列表后推送到好友时间线：
+    - 作者好友数超过阈值时改为读扩散，不推送
+    """
+    try:
+        pushed = timeline.fan_out(blog_id)
+        print(f"博客{blog_id}已推送到{pushed}位好友的时间线")
+        return pushed
+    except Exception as e:
+        print(f"推送博客{blog_id}到时间线失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def retract_blog(blog_id):
+    """博客撤回/转为私密/删除后从所有时间线移除"""
+    try:
+        timeline.retract(blog_id)
+        print(f"博客{blog_id}已从时间线移除")
+    except Exception as e:
+        print(f"从时间线移除博客{blog_id}失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def sync_friend_timelines(user_id, friend_id, approved):
+    """
+    好友关系变化后同步双方的时间线：
+    - 成为好友：补入对方最近的公开博客
+    - 解除好友：移除对方的博客
+    """
+    try:
+        for owner, other in ((user_id, friend_id), (friend_id, user_id)):
+            if approved:
+                timeline.merge_friend(owner, other)
+            else:
+                timeline.unmerge_friend(owner, other)
+        print(f"用户{user_id}与{friend_id}的时间线已同步")
+    except Exception as e:
+        print(f"同步用户{user_id}与{friend_id}的时间线失败：{str(e)}")
+        raise e
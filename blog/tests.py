@@ -1,3 +1,1035 @@
-from django.test import TestCase
+import base64
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user import stats as user_stats
+from user.models import Friend, User
+from utils.hyperloglog import HyperLogLog
+from utils.query_budget import QueryBudgetExceeded, QueryBudgetTestMixin, get_budget
+from utils.query_plan import QueryPlanAssertionsMixin
+from . import comments, counters, covers, hot, jobs, reconcile, rendering, search, timeline, viewcounts
+from .models import Blog, BlogComment, BlogCounterShard, BlogLike, BlogShare, BlogViewDaily
+from .views import BlogViewSet
+
+
+class BlogHotQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """blog 热点接口的执行计划回归测试：捕获视图实际执行的 SQL 逐条 EXPLAIN，任何一条退化成全表扫描即失败"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='plan_author', email='plan_author@test.com', password='pass123456')
+        cls.reader = User.objects.create_user(username='plan_reader', email='plan_reader@test.com', password='pass123456')
+        blogs = [
+            Blog(
+                title=f'博客 {i}', content='内容', author=cls.author if i % 2 else cls.reader,
+                status='published' if i % 5 else 'draft', is_public=bool(i % 7),
+            )
+            for i in range(60)
+        ]
+        Blog.objects.bulk_create(blogs)
+        cls.blog = Blog.objects.filter(is_public=True, status='published', author=cls.author).first()
+        BlogComment.objects.bulk_create(
+            BlogComment(blog=blog, author=cls.reader, content='评论') for blog in Blog.objects.all()[:30]
+        )
+        cls.root = comments.create(cls.blog, cls.author, '楼层')
+        comments.create(cls.blog, cls.reader, '回复', parent=cls.root)
+        BlogLike.objects.create(blog=cls.blog, user=cls.reader)
+        # bulk_create 不触发信号：先建好统计行，否则首次增量会回退到按作者全量重算
+        user_stats.rebuild([cls.author.id, cls.reader.id])
+
+    def setUp(self):
+        cache.clear()
+        viewcounts._take_buffer()
+        self.addCleanup(viewcounts._take_buffer)
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def test_public_blog_list(self):
+        with self.assertQueriesUseIndexes('blog_public_feed_idx'):
+            response = self.client.get('/api/blogs/', {'pagination': 'cursor', 'page_size': 5})
+        # 游标翻页：(created_at, id) < (?, ?) 同样在索引上定位
+        with self.assertQueriesUseIndexes('blog_public_feed_idx'):
+            self.client.get(response.data['next'])
+
+    def test_my_blogs(self):
+        self.login(self.author)
+        with self.assertQueriesUseIndexes('blog_author_created_idx'):
+            self.client.get('/api/blogs/my_blogs/', {'pagination': 'cursor'})
+
+    def test_owner_scoped_actions(self):
+        self.login(self.author)
+        with self.assertQueriesUseIndexes():
+            response = self.client.patch(f'/api/blogs/{self.blog.pk}/unpublish/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_blog_comment_list(self):
+        url = f'/api/blogs/{self.blog.pk}/comment/list/'
+        with self.assertQueriesUseIndexes('blog_comment_blog_created_idx'):
+            self.client.get(url)
+        with self.assertQueriesUseIndexes('blog_comment_toplevel_idx', 'blog_comment_root_path_idx'):
+            self.client.get(url, {'threaded': 1})
+
+    def test_comment_thread(self):
+        with self.assertQueriesUseIndexes('blog_comment_blog_path_idx'):
+            response = self.client.get(f'/api/blogs/{self.blog.pk}/comment/{self.root.pk}/thread/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_like_toggle_and_counter_shards(self):
+        self.login(self.reader)
+        with self.assertQueriesUseIndexes():
+            response = self.client.post(f'/api/blogs/{self.blog.pk}/like/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BlogCounterTests(TestCase):
+    """分片计数器：增量写入分片、实时读取、合并回 Blog 行"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='counter_author', email='counter_author@test.com', password='pass123456')
+        cls.blog = Blog.objects.create(title='计数', content='内容', author=cls.author, status='published', like_count=2)
+
+    def pending_deltas(self, field='like_count'):
+        return list(BlogCounterShard.objects.filter(blog=self.blog, field=field).values_list('delta', flat=True))
+
+    def test_incr_and_get_count(self):
+        for _ in range(5):
+            counters.incr(self.blog.id, 'like_count')
+        self.assertEqual(counters.incr(self.blog.id, 'like_count', -1), 6)
+        self.assertEqual(sum(self.pending_deltas()), 4)
+        # 分片增量未合并前 Blog 行不变
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).like_count, 2)
+        self.assertEqual(counters.get_counts(self.blog.id), {'like_count': 6, 'share_count': 0, 'comment_count': 0})
+        # 扣减不会得到负数
+        counters.incr(self.blog.id, 'share_count', -3)
+        self.assertEqual(counters.get_count(self.blog.id, 'share_count'), 0)
+        with self.assertRaises(ValueError):
+            counters.incr(self.blog.id, 'view_count')
+
+    def test_concurrent_shard_creation(self):
+        # 另一个请求在本请求的 UPDATE（0 行）之后、INSERT 之前创建了同一分片：INSERT 唯一约束冲突，退回原子 UPDATE
+        BlogCounterShard.objects.create(blog=self.blog, field='like_count', shard=0, delta=3)
+        real_update, calls = QuerySet.update, []
+
+        def racing_update(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with override_settings(BLOG_COUNTER_SHARDS=1), mock.patch.object(QuerySet, 'update', racing_update):
+            self.assertEqual(counters.incr(self.blog.id, 'like_count'), 6)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.pending_deltas(), [4])
+
+    def test_flush_zeroes_shards(self):
+        with override_settings(BLOG_COUNTER_SHARDS=4):
+            for _ in range(8):
+                counters.incr(self.blog.id, 'like_count')
+        counters.incr(self.blog.id, 'comment_count', 2)
+        self.assertEqual(counters.flush(), 2)
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.like_count, self.blog.comment_count), (10, 2))
+        # 分片保留、增量清零，实时计数不变；再次合并没有可处理的增量
+        self.assertTrue(self.pending_deltas())
+        self.assertEqual(set(self.pending_deltas()) | set(self.pending_deltas('comment_count')), {0})
+        self.assertEqual(counters.get_count(self.blog.id, 'like_count'), 10)
+        self.assertEqual(counters.pending([self.blog.id]), {})
+        self.assertEqual(counters.flush(), 0)
+
+
+class BlogKeysetPaginationTests(TestCase):
+    """游标分页：next/previous 链接各走一遍时每条记录恰好出现一次；其它排序下退回页码分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='page_author', email='page_author@test.com', password='pass123456')
+        now = timezone.now()
+        # 每两篇共用同一个 created_at，翻页边界必须靠 id 区分
+        Blog.objects.bulk_create(
+            Blog(title=f'分页 {i}', content='内容', author=cls.author, status='published',
+                 created_at=now - timedelta(minutes=i // 2))
+            for i in range(11)
+        )
+        cls.expected = list(
+            Blog.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([blog['id'] for blog in response.data['results']['data']])
+            url = response.data[link]
+        return pages
+
+    def test_cursor_walk_visits_every_row_once(self):
+        pages = self.walk('/api/blogs/?pagination=cursor&page_size=3', 'next')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        # 从最后一页沿 previous 链接往回翻，同样不重不漏
+        last = self.client.get('/api/blogs/?pagination=cursor&page_size=3').data['next']
+        while True:
+            response = self.client.get(last)
+            if response.data['next'] is None:
+                break
+            last = response.data['next']
+        backwards = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(sum(reversed(backwards), []) + pages[-1], self.expected)
+
+    def test_other_orderings_fall_back_to_page_numbers(self):
+        response = self.client.get('/api/blogs/', {'pagination': 'cursor', 'ordering': 'created_at', 'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 11)
+        self.assertEqual({blog['id'] for blog in response.data['results']['data']}, set(self.expected[-5:]))
+        # 游标只在默认排序下生成，与其它排序同时出现时视为无效
+        next_link = self.client.get('/api/blogs/?pagination=cursor&page_size=3').data['next']
+        cursor = parse_qs(urlsplit(next_link).query)['cursor'][0]
+        response = self.client.get('/api/blogs/', {'cursor': cursor, 'ordering': 'created_at'})
+        self.assertEqual(response.status_code, 404)
+
+
+class BlogListCacheTests(TestCase):
+    """匿名列表响应缓存：公开博客保存/删除后失效，不同 Host 不共用缓存（响应体里有绝对翻页链接）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='cache_author', email='cache_author@test.com', password='pass123456')
+        cls.blogs = [
+            Blog.objects.create(title=f'缓存 {i}', content='内容', author=cls.author, status='published')
+            for i in range(3)
+        ]
+        cls.draft = Blog.objects.create(title='缓存草稿', content='内容', author=cls.author, status='draft')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_list(self, **extra):
+        response = self.client.get('/api/blogs/', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_save_and_delete_invalidate_cached_page(self):
+        self.assertEqual(self.get_list()['X-Cache'], 'MISS')
+        self.assertEqual(self.get_list()['X-Cache'], 'HIT')
+
+        blog = Blog.objects.get(pk=self.blogs[0].pk)
+        blog.title = '改过的标题'
+        with self.captureOnCommitCallbacks(execute=True):
+            blog.save()
+        response = self.get_list()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('改过的标题', [item['title'] for item in response.data['data']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Blog.objects.get(pk=self.blogs[1].pk).delete()
+        response = self.get_list()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotIn(self.blogs[1].pk, [item['id'] for item in response.data['data']])
+
+    def test_unlisted_save_keeps_cached_page(self):
+        self.get_list()
+        # 从库里加载的实例记得自己原本就不在公开列表中（post_init 不能依赖 _state.adding）
+        draft = Blog.objects.get(pk=self.draft.pk)
+        draft.title = '草稿改标题'
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.save()
+        self.assertEqual(self.get_list()['X-Cache'], 'HIT')
+
+    @override_settings(ALLOWED_HOSTS=['a.example.com', 'b.example.com'])
+    def test_cache_key_includes_host(self):
+        params = {'pagination': 'cursor', 'page_size': 2}
+        response = self.client.get('/api/blogs/', params, HTTP_HOST='a.example.com')
+        self.assertTrue(response.data['next'].startswith('http://a.example.com/'))
+        response = self.client.get('/api/blogs/', params, HTTP_HOST='b.example.com')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.data['next'].startswith('http://b.example.com/'))
+
+
+@override_settings(BLOG_COVER_RENDITION_WIDTHS=[320, 640, 1280])
+class BlogCoverTests(TestCase):
+    """封面图多尺寸版本：生成（不放大）、接口输出 cover_images、替换封面/删除博客后清理版本文件"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='cover_author', email='cover_author@test.com', password='pass123456')
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=tmp))
+        self.client = APIClient()
+
+    def upload(self, name, size=(800, 400)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 80, 40)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def create_blog(self):
+        blog = Blog.objects.create(
+            title='有封面', content='内容', author=self.author, status='published', cover_image=self.upload('cover.jpg')
+        )
+        self.assertTrue(covers.generate(blog.pk))
+        blog.refresh_from_db()
+        return blog
+
+    def paths(self, renditions):
+        return [item['path'] for fmt in ('webp', 'jpeg') for item in renditions[fmt]]
+
+    def test_generate_and_expose_renditions(self):
+        blog = self.create_blog()
+        renditions = blog.cover_renditions
+        self.assertEqual((renditions['source'], renditions['width'], renditions['height']), (blog.cover_image.name, 800, 400))
+        # 1280 超过原图宽度，合并为原图宽度一档
+        self.assertEqual([item['width'] for item in renditions['webp']], [320, 640, 800])
+        self.assertEqual([item['height'] for item in renditions['jpeg']], [160, 320, 400])
+        self.assertTrue(all(default_storage.exists(path) for path in self.paths(renditions)))
+        self.assertFalse(covers.generate(blog.pk))  # 已是最新
+
+        item = self.client.get('/api/blogs/').data['data'][0]
+        images = item['cover_images']
+        self.assertEqual(images['original']['width'], 800)
+        self.assertTrue(images['webp']['src'].endswith('-320w.webp'))
+        self.assertEqual(images['webp']['srcset'].count('w, '), 2)
+        self.assertEqual([source['width'] for source in images['jpeg']['sources']], [320, 640, 800])
+        self.assertTrue(item['cover_image_url'].endswith('.jpg'))
+        detail = self.client.get(f'/api/blogs/{blog.pk}/').data['data']
+        self.assertEqual(detail['cover_images'], images)
+
+    def test_pending_renditions_fall_back_to_original(self):
+        blog = Blog.objects.create(
+            title='未生成', content='内容', author=self.author, status='published', cover_image=self.upload('raw.jpg')
+        )
+        images = self.client.get(f'/api/blogs/{blog.pk}/').data['data']['cover_images']
+        self.assertEqual(set(images), {'original'})
+        self.assertIsNone(images['original']['width'])
+
+    def test_renditions_removed_on_replace_and_delete(self):
+        blog = self.create_blog()
+        old = self.paths(blog.cover_renditions)
+        blog.cover_image = self.upload('new.jpg', size=(400, 400))
+        with self.captureOnCommitCallbacks(execute=True):
+            blog.save()
+        self.assertFalse(any(default_storage.exists(path) for path in old))
+        # 完整保存没有把旧封面的版本记录写回库里
+        self.assertFalse(covers._stored_paths(Blog.objects.get(pk=blog.pk).cover_renditions) & set(old))
+
+        covers.generate(blog.pk)
+        blog = Blog.objects.get(pk=blog.pk)
+        current = self.paths(blog.cover_renditions)
+        self.assertTrue(all(default_storage.exists(path) for path in current))
+        with self.captureOnCommitCallbacks(execute=True):
+            blog.delete()
+        self.assertFalse(any(default_storage.exists(path) for path in current))
+
+    def test_regenerate_keeps_old_files_until_update(self):
+        blog = self.create_blog()
+        old = self.paths(blog.cover_renditions)
+        # 让库里的记录过期（例如调整了档位），强制重新生成同一张封面
+        Blog.objects.filter(pk=blog.pk).update(cover_renditions={**blog.cover_renditions, 'source': 'stale.jpg'})
+        build = covers.build_renditions
+
+        def checked_build(*args):
+            renditions = build(*args)
+            # 新版本写到了新文件名，更新数据库之前旧文件仍然完好
+            self.assertFalse(set(self.paths(renditions)) & set(old))
+            self.assertTrue(all(default_storage.exists(path) for path in old))
+            return renditions
+
+        with mock.patch.object(covers, 'build_renditions', checked_build):
+            self.assertTrue(covers.generate(blog.pk))
+        current = self.paths(Blog.objects.get(pk=blog.pk).cover_renditions)
+        self.assertTrue(all(default_storage.exists(path) for path in current))
+        self.assertFalse(any(default_storage.exists(path) for path in old))
+
+
+class BlogSearchTests(TestCase):
+    """倒排索引搜索：分词、BM25 排序、随博客保存/删除增量更新、常见词剪枝"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='search_author', email='search_author@test.com', password='pass123456')
+        cls.in_title = Blog.objects.create(title='缓存设计', content='正文', author=cls.author, status='published')
+        cls.in_content = Blog.objects.create(title='杂谈', content='聊一聊缓存设计', author=cls.author, status='published')
+        cls.mixed = Blog.objects.create(title='Redis 缓存', content='redis 做缓存', author=cls.author, status='published')
+        cls.unrelated = Blog.objects.create(title='其它', content='和搜索无关', author=cls.author, status='published')
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.enterContext(override_settings(BLOG_SEARCH_INDEX_PATH=os.path.join(tmp, 'index.sqlite3')))
+        # 夹具在 setUpTestData 的事务中创建，提交回调不会执行：用重建命令建立索引
+        call_command('rebuild_search_index', stdout=StringIO())
+        cache.clear()
+
+    def ids(self, query, **kwargs):
+        return [blog_id for blog_id, _ in search.get_index().search(query, **kwargs)]
+
+    def test_tokenize(self):
+        self.assertEqual(search.tokenize('Django 博客搜索'), ['django', '博', '客', '搜', '索', '博客', '客搜', '搜索'])
+        # 查询时长片段只用二元组，单字查询用单字
+        self.assertEqual(search.tokenize('Django 博客搜索', for_query=True), ['django', '博客', '客搜', '搜索'])
+        self.assertEqual(search.tokenize('博', for_query=True), ['博'])
+
+    def test_bm25_ranking(self):
+        # 标题中的词按 3 倍词频计，排在只在正文出现的博客前面；只命中部分二元组的排在最后，无关博客不出现
+        expected = [self.in_title.id, self.in_content.id, self.mixed.id]
+        self.assertEqual(self.ids('缓存设计'), expected)
+        response = self.client.get('/api/blogs/', {'search': '缓存设计'})
+        self.assertEqual([blog['id'] for blog in response.data['data']], expected)
+
+    def test_cjk_and_latin_query(self):
+        # 同时命中英文词与中文二元组的博客排在最前，英文不区分大小写
+        self.assertEqual(self.ids('REDIS 缓存')[0], self.mixed.id)
+        self.assertEqual(self.ids('redis'), [self.mixed.id])
+        self.assertEqual(set(self.ids('缓存')), {self.in_title.id, self.in_content.id, self.mixed.id})
+
+    def test_incremental_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_content.content = '换了个话题'
+            self.in_content.save()
+        self.assertEqual(self.ids('缓存设计'), [self.in_title.id, self.mixed.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = Blog.objects.create(title='新的缓存设计', content='正文', author=self.author, status='published')
+            Blog.objects.create(title='缓存设计草稿', content='正文', author=self.author, status='draft')
+        self.assertEqual(set(self.ids('缓存设计')), {self.in_title.id, self.mixed.id, created.id})
+
+        # 撤回或删除后移出索引
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_title.status = 'draft'
+            self.in_title.save()
+            self.mixed.delete()
+        self.assertNotIn(self.in_title.id, self.ids('缓存设计'))
+        self.assertEqual(self.ids('redis'), [])
+
+    def test_postings_pruned_per_term(self):
+        full = dict(search.get_index().search('缓存'))
+        pruned = dict(search.get_index().search('缓存', max_postings=2))
+        # 只读取词频最高的 2 条倒排记录，文档频率仍按完整倒排表计算，保留下来的得分不变
+        self.assertEqual(len(pruned), 2)
+        self.assertNotIn(self.in_content.id, pruned)
+        for blog_id, score in pruned.items():
+            self.assertAlmostEqual(score, full[blog_id])
+
+
+def named_routes(patterns):
+    """递归列出 urlpatterns 中所有带 name 的路由"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from named_routes(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=3600)
+class BlogAPITestCase(QueryBudgetTestMixin, TestCase):
+    """各组 blog 接口测试共用的夹具：8 篇公开博客、1 篇草稿、3 条评论"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='budget_author', email='budget_author@test.com', password='pass123456')
+        cls.readers = [
+            User.objects.create_user(username=f'budget_reader_{i}', email=f'budget_reader_{i}@test.com', password='pass123456')
+            for i in range(3)
+        ]
+        cls.admin = User.objects.create_superuser(username='budget_admin', email='budget_admin@test.com', password='pass123456')
+        authors = [cls.author] + cls.readers
+        # 逐条 create()：保存时才会预渲染正文摘要
+        for i in range(8):
+            Blog.objects.create(title=f'预算 {i}', content='内容', author=authors[i % len(authors)], status='published', is_public=True)
+        cls.blog = Blog.objects.filter(author=cls.author).first()
+        cls.draft = Blog.objects.create(title='草稿', content='内容', author=cls.author, status='draft', is_public=True)
+        BlogComment.objects.bulk_create(
+            BlogComment(blog=cls.blog, author=reader, content='评论') for reader in cls.readers
+        )
+
+    def setUp(self):
+        cache.clear()
+        # 丢弃其他用例留下的浏览缓冲（测试库回滚后博客 id 会被复用），用例结束时也清空，
+        # 以免进程退出时刷到已销毁的测试库
+        viewcounts._take_buffer()
+        self.addCleanup(viewcounts._take_buffer)
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+
+class BlogRenderingTests(TestCase):
+    """正文预渲染：白名单过滤 HTML（危险标签、链接、事件属性）、属性转义、按空行分段时标签配对"""
+
+    def html(self, content):
+        return rendering.render(content)['content_html']
+
+    def test_drops_script_and_style_content(self):
+        html = self.html('<p>前<script>alert(1)</script>中<style>p { color: red }</style>后</p><SCRIPT>x()</SCRIPT>')
+        self.assertEqual(html, '<p>前中后</p>')
+
+    def test_removes_dangerous_urls(self):
+        for url in [
+            'javascript:alert(1)', 'JaVaScRiPt:alert(1)', '  javascript:alert(1)', 'java\tscript:alert(1)',
+            '\x01javascript:alert(1)', 'data:text/html;base64,PHNjcmlwdD4=', ' DATA:text/html,<script>',
+        ]:
+            html = self.html(f'<p><a href="{url}">链接</a><img src="{url}"></p>')
+            self.assertNotIn('href=', html, url)
+            self.assertNotIn('src=', html, url)
+            self.assertIn('链接', html)
+        html = self.html('<p><a href="https://example.com/">安全</a><a href="/blogs/1/">站内</a></p>')
+        self.assertIn('href="https://example.com/"', html)
+        self.assertIn('href="/blogs/1/"', html)
+
+    def test_removes_event_handlers(self):
+        html = self.html(
+            '<p onclick="x()"><a href="https://example.com/" onmouseover="x()" ONCLICK="x()">a</a>'
+            '<img src="a.png" onerror="x()"></p>'
+        )
+        self.assertNotIn('on', html.replace('nofollow noopener', ''))
+        self.assertEqual(
+            html, '<p><a href="https://example.com/" rel="nofollow noopener">a</a><img src="a.png"></p>'
+        )
+
+    def test_escapes_attribute_values_and_text(self):
+        html = self.html('<p><a title=\'"><script>alert(1)</script>\' href="https://x.com/?a=1&b=2">t</a> 1 < 2 & 3</p>')
+        self.assertEqual(
+            html,
+            '<p><a title="&quot;&gt;&lt;script&gt;alert(1)&lt;/script&gt;" href="https://x.com/?a=1&amp;b=2"'
+            ' rel="nofollow noopener">t</a> 1 &lt; 2 &amp; 3</p>',
+        )
+
+    def test_inline_tags_balanced_across_paragraphs(self):
+        html = self.html('甲 <strong>乙\n\n丙</strong> 丁\n戊\n\n<a href="https://x.com/">己\n\n\n庚</a>')
+        self.assertEqual(html, (
+            '<p>甲 <strong>乙</strong></p><p><strong>丙</strong> 丁<br>戊</p>'
+            '<p><a href="https://x.com/" rel="nofollow noopener">己</a></p>'
+            '<p><a href="https://x.com/" rel="nofollow noopener">庚</a></p>'
+        ))
+        # 有段落级标签时不再分段
+        self.assertEqual(self.html('<p>一\n\n二</p>'), '<p>一\n\n二</p>')
+
+
+class BlogQueryBudgetTests(BlogAPITestCase):
+    """blog/urls.py 各路由的单请求查询预算：列表类接口的查询数不得随条数增长（N+1）"""
+
+    def test_budget_per_method(self):
+        # 删除的级联清理不放宽详情 GET 的预算；HEAD 沿用 GET，未声明的方法按最小预算
+        self.assertLess(get_budget('blog-detail', 'GET'), get_budget('blog-detail', 'DELETE'))
+        self.assertEqual(get_budget('blog-detail', 'HEAD'), get_budget('blog-detail', 'GET'))
+        self.assertEqual(get_budget('blog-detail', 'OPTIONS'), get_budget('blog-detail', 'GET'))
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'blog-detail': {'GET': 1, 'DELETE': 15}}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(f'/api/blogs/{self.blog.id}/')
+
+    def test_every_route_has_budget(self):
+        from blog import urls
+        missing = [name for name in named_routes(urls.urlpatterns) if get_budget(name) is None]
+        self.assertFalse(missing, f"以下路由没有声明查询预算：{missing}")
+
+    def test_list(self):
+        with self.assertQueryBudget('blog-list') as captured:
+            response = self.client.get('/api/blogs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 8)
+        # 列表输出预渲染的摘要，不读取正文
+        self.assertEqual(response.data['data'][0]['excerpt'], '内容')
+        self.assertNotIn('"content"', captured.captured_queries[-1]['sql'])
+
+    def test_list_authenticated_cursor(self):
+        self.login(self.readers[0])
+        with self.assertQueryBudget('blog-list'):
+            response = self.client.get('/api/blogs/', {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_sparse_fields(self):
+        # 只取部分字段时查询列随之收窄，且不能因延迟加载的列逐行回表
+        with self.assertQueryBudget('blog-list') as captured:
+            response = self.client.get('/api/blogs/', {'fields': 'id,title,author.username', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results']['data'][0]), {'id', 'title', 'author'})
+        self.assertEqual(set(response.data['results']['data'][0]['author']), {'username'})
+        self.assertNotIn('"content"', captured.captured_queries[-1]['sql'])
+
+    def test_detail_omit(self):
+        with self.assertQueryBudget('blog-detail'):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/', {'omit': 'content,author.email'})
+        self.assertNotIn('content', response.data['data'])
+        self.assertEqual(set(response.data['data']['author']), {'id', 'username'})
+
+    def test_create(self):
+        self.login(self.author)
+        with self.assertQueryBudget('blog-list', 'POST'):
+            response = self.client.post('/api/blogs/', {'title': '新博客', 'content': '内容', 'status': 'published'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail(self):
+        with self.assertQueryBudget('blog-detail'):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_and_destroy(self):
+        self.login(self.author)
+        with self.assertQueryBudget('blog-detail', 'PATCH'):
+            response = self.client.patch(f'/api/blogs/{self.blog.id}/', {'title': '改标题'})
+        self.assertEqual(response.status_code, 200)
+        with self.assertQueryBudget('blog-detail', 'DELETE'):
+            response = self.client.delete(f'/api/blogs/{self.draft.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_my_blogs(self):
+        self.login(self.author)
+        with self.assertQueryBudget('blog-my-blogs'):
+            response = self.client.get('/api/blogs/my_blogs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(len(response.data['data']), 3)
+
+    def test_publish_and_unpublish(self):
+        self.login(self.author)
+        with self.assertQueryBudget('blog-publish', 'PATCH'):
+            response = self.client.patch(f'/api/blogs/{self.draft.id}/publish/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertQueryBudget('blog-unpublish', 'PATCH'):
+            response = self.client.patch(f'/api/blogs/{self.draft.id}/unpublish/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_stats(self):
+        self.login(self.admin)
+        with self.assertQueryBudget('blog-cache-stats'):
+            response = self.client.get('/api/blogs/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_like_and_share(self):
+        self.login(self.readers[0])
+        with self.assertQueryBudget('blog-like', 'POST'):
+            response = self.client.post(f'/api/blogs/{self.blog.id}/like/')
+        self.assertTrue(response.data['data']['is_liked'])
+        with self.assertQueryBudget('blog-like', 'POST'):
+            response = self.client.post(f'/api/blogs/{self.blog.id}/like/')
+        self.assertFalse(response.data['data']['is_liked'])
+        with self.assertQueryBudget('blog-share', 'POST'):
+            response = self.client.post(f'/api/blogs/{self.blog.id}/share/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_list(self):
+        with self.assertQueryBudget('blog-comment-list'):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/comment/list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 3)
+
+    def test_comment_add(self):
+        self.login(self.readers[1])
+        with self.assertQueryBudget('blog-comment-add', 'POST'):
+            response = self.client.post(f'/api/blogs/{self.blog.id}/comment/add/', {'blog_id': self.blog.id, 'content': '好文'})
+        self.assertEqual(response.status_code, 200)
+
+class BlogHotRankingTests(BlogAPITestCase):
+    """热门排行：按时间衰减的互动加权分数增量计算，?ordering=hot 按排行分页"""
+
+    def test_list_hot(self):
+        liked, shared = Blog.objects.filter(status='published').exclude(pk=self.blog.pk)[:2]
+        BlogLike.objects.bulk_create(BlogLike(blog=liked, user=reader) for reader in self.readers)
+        BlogShare.objects.create(blog=shared, user=self.readers[0])
+        BlogLike.objects.create(blog=shared, user=self.readers[0])
+        # 评论 3 条 × 2 = 6，转发 3 + 点赞 1 = 4，点赞 3 × 1 = 3
+        hot.recompute()
+        with self.assertQueryBudget('blog-list'):
+            response = self.client.get('/api/blogs/', {'ordering': 'hot'})
+        self.assertEqual([blog['id'] for blog in response.data['results']['data']], [self.blog.id, shared.id, liked.id])
+        self.assertEqual(response.data['count'], 3)
+
+        # 增量计算：只累加新事件，旧分数不重复计入
+        BlogShare.objects.create(blog=liked, user=self.readers[1])
+        hot.recompute()
+        state = hot.load_state()
+        self.assertAlmostEqual(float(state['scores'][list(state['ids']).index(liked.id)]), 6.0, places=3)
+        self.assertEqual(hot.ranked_ids()[0][0], liked.id)
+
+    def test_late_committed_events_scored_once(self):
+        early, late = Blog.objects.filter(status='published').exclude(pk=self.blog.pk)[:2]
+        first_id = BlogLike.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        # 后开始的事务先提交：id 较大的点赞先被读到
+        BlogLike.objects.create(id=first_id + 100, blog=early, user=self.readers[0])
+        hot.recompute()
+
+        # 先开始的事务晚提交：id 更小，created_at 早于上次计算
+        BlogLike.objects.create(id=first_id + 1, blog=late, user=self.readers[0])
+        BlogLike.objects.filter(pk=first_id + 1).update(created_at=timezone.now() - timedelta(seconds=30))
+        for _ in range(2):
+            # 第二次计算时两条点赞都在回看区间内，但都已计入，不重复计分
+            hot.recompute()
+            state = hot.load_state()
+            scores = dict(zip(state['ids'].tolist(), state['scores'].tolist()))
+            self.assertAlmostEqual(scores[early.id], 1.0, places=3)
+            self.assertAlmostEqual(scores[late.id], 1.0, places=3)
+
+    def test_ranking_shared_across_processes(self):
+        other = Blog.objects.filter(status='published').exclude(pk=self.blog.pk).first()
+        BlogLike.objects.bulk_create(BlogLike(blog=other, user=reader) for reader in self.readers)
+        hot.recompute()
+        # 模拟由另一个进程（Celery worker）计算：Web 进程的本地缓存里没有任何排行数据
+        cache.clear()
+        response = self.client.get('/api/blogs/', {'ordering': 'hot'})
+        self.assertEqual([blog['id'] for blog in response.data['results']['data']], [self.blog.id, other.id])
+
+    def test_lease_excludes_concurrent_runs(self):
+        with jobs.lease(hot.STATE_JOB, 60) as acquired:
+            self.assertTrue(acquired)
+            with jobs.lease(hot.STATE_JOB, 60) as again:
+                self.assertFalse(again)
+            self.assertIsNone(hot.run_locked())
+        with jobs.lease(hot.STATE_JOB, 60) as acquired:
+            self.assertTrue(acquired)
+
+
+class BlogConditionalRequestTests(BlogAPITestCase):
+    """条件请求：ETag 随内容、查看者的点赞/转发状态变化，命中时返回 304"""
+
+    def test_detail_not_modified(self):
+        response = self.client.get(f'/api/blogs/{self.blog.id}/')
+        etag = response['ETag']
+        self.assertIn('s-maxage', response['Cache-Control'])
+        # 校验值未变：只查一次校验列就返回 304，不再加载正文
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.login(self.author)
+        self.client.patch(f'/api/blogs/{self.blog.id}/', {'title': '改标题'})
+        self.client.credentials()
+        response = self.client.get(f'/api/blogs/{self.blog.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/api/blogs/')['ETag']
+        # 匿名列表命中响应缓存时，条件请求不查库
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # 不同的查询参数对应不同的 ETag
+        self.assertEqual(self.client.get('/api/blogs/', {'page': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.login(self.readers[0])
+        response = self.client.get('/api/blogs/')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_viewer_state(self):
+        reader = self.readers[0]
+        self.login(reader)
+        etag = self.client.get('/api/blogs/')['ETag']
+        self.client.post(f'/api/blogs/{self.blog.id}/like/')
+        self.client.post(f'/api/blogs/{self.blog.id}/share/')
+        self.client.post(f'/api/blogs/{self.blog.id}/share/')
+        # 计数还在分片里未合并，点赞状态的版本号让 ETag 失效
+        with self.assertQueryBudget('blog-list'):
+            response = self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        flags = {item['id']: (item['is_liked'], item['is_shared']) for item in response.data['data']}
+        self.assertEqual(flags.pop(self.blog.id), (True, True))
+        self.assertFalse(any(any(value) for value in flags.values()))
+
+        data = self.client.get(f'/api/blogs/{self.blog.id}/').data['data']
+        self.assertEqual((data['is_liked'], data['is_shared']), (True, True))
+        # 不输出这两个字段时不查询（校验值由已取回的行计算，不再单独聚合）
+        with self.assertNumQueries(2):
+            self.client.get('/api/blogs/', {'fields': 'id,title'})
+
+        self.client.credentials()
+        data = self.client.get(f'/api/blogs/{self.blog.id}/').data['data']
+        self.assertEqual((data['is_liked'], data['is_shared']), (False, False))
+
+    def test_list_etag_follows_rows(self):
+        self.login(self.readers[0])
+        response = self.client.get('/api/blogs/')
+        etag = response['ETag']
+        # 计数原子更新、删除都不改时间戳，不能按 If-Modified-Since 判断
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(
+            self.client.get('/api/blogs/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200
+        )
+        # 绕过信号与 auto_now 的批量更新：当前页行的 updated_at 变化即让 ETag 失效
+        Blog.objects.filter(pk=self.blog.pk).update(title='批量改标题', updated_at=timezone.now())
+        response = self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        Blog.objects.filter(pk=self.blog.pk).delete()
+        self.assertEqual(self.client.get('/api/blogs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_comment_list_not_modified(self):
+        url = f'/api/blogs/{self.blog.id}/comment/list/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        BlogComment.objects.create(blog=self.blog, author=self.readers[0], content='新评论')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # 楼层模式：校验值由当前页与回复预览计算，不对全部评论做 COUNT；新回复改变楼层的 reply_count
+        root = BlogComment.objects.filter(blog=self.blog).order_by('created_at').first()
+        etag = self.client.get(url, {'threaded': 1})['ETag']
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url, {'threaded': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse([q for q in captured.captured_queries if 'MAX(' in q['sql'].upper()])
+        comments.create(self.blog, self.readers[1], '回复', parent=root)
+        self.assertEqual(self.client.get(url, {'threaded': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_invalid_pk(self):
+        self.assertEqual(self.client.get('/api/blogs/abc/').status_code, 404)
+
+
+class BlogViewCountTests(BlogAPITestCase):
+    """浏览量：缓冲合并入库，单篇/作者的浏览次数与去重访客估计"""
+
+    def test_view_stats(self):
+        url = f'/api/blogs/{self.blog.id}/'
+        for _ in range(3):
+            self.client.get(url, HTTP_USER_AGENT='browser-a')
+        self.login(self.readers[0])
+        self.client.get(url)
+        self.client.credentials()
+        # 浏览只进缓冲，合并前数据库里没有记录
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).view_count, 0)
+        viewcounts.flush()
+
+        with self.assertQueryBudget('blog-view-stats'):
+            response = self.client.get(f'{url}views/')
+        data = response.data['data']
+        self.assertEqual(data['view_count'], 4)
+        self.assertEqual(data['unique_visitors'], 2)
+        self.assertEqual(data['daily'][-1]['views'], 4)
+
+        with self.assertQueryBudget('blog-author-view-stats'):
+            response = self.client.get(f'/api/blogs/authors/{self.author.id}/views/')
+        self.assertEqual(response.data['data']['view_count'], 4)
+        self.assertEqual(response.data['data']['unique_visitors'], 2)
+
+    def test_flushed_without_further_views(self):
+        self.client.get(f'/api/blogs/{self.blog.id}/')
+        self.assertTrue(viewcounts._flusher.is_alive())
+        # 间隔未到：定时线程检查时不刷出
+        self.assertEqual(viewcounts.flush_due(), 0)
+        viewcounts._last_flush -= 3600
+        self.assertEqual(viewcounts.flush_due(), 1)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).view_count, 1)
+
+    def test_forwarded_for_needs_trusted_proxy(self):
+        url = f'/api/blogs/{self.blog.id}/'
+        with self.settings(BLOG_TRUSTED_PROXIES=[]):
+            # 客户端直连时伪造的 X-Forwarded-For 被忽略，只算一个访客
+            for ip in ['1.1.1.1', '2.2.2.2', '3.3.3.3']:
+                self.client.get(url, HTTP_X_FORWARDED_FOR=ip, HTTP_USER_AGENT='browser')
+        with self.settings(BLOG_TRUSTED_PROXIES=['127.0.0.1', '10.0.0.1']):
+            # 经过代理：取最右边第一个不受信任的地址，客户端自己填的最左边的值不算
+            self.client.get(url, HTTP_X_FORWARDED_FOR='9.9.9.9, 4.4.4.4, 10.0.0.1', HTTP_USER_AGENT='browser')
+            self.client.get(url, HTTP_X_FORWARDED_FOR='8.8.8.8, 4.4.4.4', HTTP_USER_AGENT='browser')
+        viewcounts.flush()
+        self.assertEqual(viewcounts.blog_stats(Blog.objects.get(pk=self.blog.pk))['unique_visitors'], 2)
+
+
+    def test_apply_rolls_back_as_a_whole(self):
+        sketch = HyperLogLog()
+        sketch.add('u:1')
+        encoded = base64.b64encode(sketch.to_bytes()).decode()
+        day = timezone.localdate().isoformat()
+        rows = [[self.blog.id, day, 2, encoded], [self.draft.id, day, 1, encoded]]
+        # 每日明细与博客浏览量已写入后，作者统计写入失败：整个快照回滚
+        with mock.patch.object(user_stats, 'incr', side_effect=DatabaseError('统计写入失败')):
+            with self.assertRaises(DatabaseError):
+                viewcounts.apply(rows)
+        self.assertFalse(BlogViewDaily.objects.filter(blog__in=[self.blog, self.draft]).exists())
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).view_count, 0)
+
+        # 重试只累加一次
+        self.assertEqual(viewcounts.apply(rows), 2)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).view_count, 2)
+        self.assertEqual(BlogViewDaily.objects.get(blog=self.blog).views, 2)
+        self.assertEqual(Blog.objects.get(pk=self.draft.pk).view_count, 1)
+
+class BlogTimelineTests(BlogAPITestCase):
+    """好友动态：推送与读取时合并（大 V）两种来源按时间倒序翻页"""
+
+    @override_settings(BLOG_TIMELINE_STORE='blog.timeline.MemoryTimelineStore', BLOG_TIMELINE_FANOUT_LIMIT=2)
+    def test_timeline(self):
+        reader, celebrity, stranger = self.readers
+        Friend.objects.create(user=self.author, friend=reader, is_approved=True)
+        Friend.objects.create(user=celebrity, friend=reader, is_approved=True)
+        Friend.objects.create(user=celebrity, friend=stranger, is_approved=True)
+        Friend.objects.create(user=celebrity, friend=self.admin, is_approved=True)
+        Friend.objects.create(user=stranger, friend=reader, is_approved=False)
+        # celebrity 有 3 位好友，超过阈值 2，改为读取时合并；author 的博客推送到 reader 的时间线
+        timeline.rebuild()
+        self.assertEqual(timeline.get_store().celebrities(), {celebrity.id})
+
+        expected = list(
+            Blog.objects.filter(author__in=[self.author, celebrity], is_public=True, status='published')
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.login(reader)
+        seen, url = [], '/api/blogs/timeline/?page_size=2'
+        while url:
+            with self.assertQueryBudget('blog-timeline'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [blog['id'] for blog in response.data['results']['data']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+
+class BlogBulkOperationTests(BlogAPITestCase):
+    """批量发布/撤回/修改/删除：逐条返回结果，只处理自己的博客"""
+
+    def test_bulk_operations(self):
+        self.login(self.author)
+        own = list(Blog.objects.filter(author=self.author).values_list('id', flat=True))
+        other = Blog.objects.exclude(author=self.author).values_list('id', flat=True).first()
+        with self.assertQueryBudget('blog-bulk-unpublish', 'POST'):
+            response = self.client.post('/api/blogs/bulk/unpublish/', {'ids': own + [other, 999999]}, format='json')
+        results = {item['id']: item['result'] for item in response.data['data']}
+        self.assertEqual(results[self.draft.id], 'unchanged')
+        self.assertEqual(results[self.blog.id], 'updated')
+        self.assertEqual(results[other], 'not_found')
+        self.assertEqual(results[999999], 'not_found')
+        self.assertFalse(Blog.objects.filter(pk__in=own, status='published').exists())
+        self.assertEqual(Blog.objects.get(pk=other).status, 'published')
+
+        with self.assertQueryBudget('blog-bulk-publish', 'POST'):
+            self.client.post('/api/blogs/bulk/publish/', {'ids': own}, format='json')
+        with self.assertQueryBudget('blog-bulk-update', 'POST'):
+            response = self.client.post('/api/blogs/bulk/update/', {'ids': own, 'is_public': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Blog.objects.filter(pk__in=own, is_public=True).exists())
+        self.assertEqual(self.client.post('/api/blogs/bulk/update/', {'ids': own}, format='json').status_code, 400)
+
+        with self.assertQueryBudget('blog-bulk-delete', 'POST'):
+            response = self.client.post('/api/blogs/bulk/delete/', {'ids': own + [other]}, format='json')
+        self.assertEqual([item['result'] for item in response.data['data']], ['deleted'] * len(own) + ['not_found'])
+        self.assertFalse(Blog.objects.filter(pk__in=own).exists())
+        self.assertFalse(BlogComment.objects.filter(blog_id=self.blog.id).exists())
+
+
+class BlogReconcileTests(BlogAPITestCase):
+    """计数对账：按块扫描、检查点续跑，已合并 + 未合并的计数与明细行数一致"""
+
+    def test_reconcile_counters(self):
+        # 夹具评论由 bulk_create 写入，comment_count 仍为 0；再制造点赞数偏差和一条未合并的分片增量
+        other = Blog.objects.exclude(pk=self.blog.pk).filter(status='published').first()
+        Blog.objects.filter(pk=other.pk).update(like_count=5)
+        BlogLike.objects.create(blog=self.blog, user=self.readers[0])
+        BlogCounterShard.objects.create(blog=self.blog, field='like_count', shard=0, delta=1)
+
+        report = reconcile.run(dry_run=True)
+        self.assertTrue(report['finished'])
+        self.assertEqual(report['drifted'], 2)
+        self.assertEqual(report['fields']['like_count'], {'rows': 1, 'total': 5, 'max': 5})
+        self.assertEqual(report['fields']['comment_count']['total'], 3)
+        self.assertEqual(Blog.objects.get(pk=other.pk).like_count, 5)
+
+        report = reconcile.run(size=2, limit=1)
+        self.assertEqual(jobs.load(reconcile.RECONCILE_JOB)['last_pk'], report['last_pk'])
+        # 每块固定查询数，与块内博客数无关：读检查点、取 id、事务与保存点四条、
+        # 锁定博客 + 三张明细表 + 分片、一条批量更新、一条写检查点
+        with self.assertNumQueries(1 + 1 + 4 + 5 + 1 + 1):
+            report = reconcile.run(size=5, limit=1)
+        self.assertFalse(report['finished'])
+        self.assertEqual(jobs.load(reconcile.RECONCILE_JOB)['last_pk'], report['last_pk'])
+
+        report = reconcile.run()
+        self.assertTrue(report['finished'])
+        self.assertEqual(report['drifted'], 2)
+        self.assertIsNone(jobs.load(reconcile.RECONCILE_JOB))
+        self.blog.refresh_from_db()
+        # 已合并 + 未合并 = 明细行数
+        self.assertEqual((self.blog.like_count, self.blog.comment_count), (0, 3))
+        self.assertEqual(Blog.objects.get(pk=other.pk).like_count, 0)
+        self.assertEqual(reconcile.run(dry_run=True)['drifted'], 0)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--all', stdout=out)
+        self.assertIn('0 篇存在偏差', out.getvalue())
+
+    def test_concurrent_unlike_decrements_once(self):
+        reader = self.readers[0]
+        self.login(reader)
+        self.client.post(f'/api/blogs/{self.blog.id}/like/')
+        stale = BlogLike.objects.get(blog=self.blog, user=reader)
+        # 另一个取消点赞请求抢先删除了这一行，本请求的 get_or_create 仍拿到旧的实例
+        BlogLike.objects.filter(pk=stale.pk).delete()
+        counters.incr(self.blog.id, 'like_count', -1)
+        with mock.patch.object(BlogLike.objects, 'get_or_create', return_value=(stale, False)):
+            response = self.client.post(f'/api/blogs/{self.blog.id}/like/')
+        self.assertEqual(response.data['data'], {'is_liked': False, 'like_count': 0})
+        self.assertEqual(counters.get_count(self.blog.id, 'like_count'), 0)
+        self.assertEqual(reconcile.run(dry_run=True)['fields']['like_count']['rows'], 0)
+
+    def test_interaction_rolled_back_with_counter(self):
+        # 计数增量写入失败时，点赞 / 转发 / 评论行一起回滚，不会产生需要对账的偏差
+        self.login(self.readers[0])
+        with mock.patch.object(counters, 'incr', side_effect=DatabaseError('分片写入失败')):
+            for url, data in [
+                (f'/api/blogs/{self.blog.id}/like/', {}),
+                (f'/api/blogs/{self.blog.id}/share/', {}),
+                (f'/api/blogs/{self.blog.id}/comment/add/', {'blog_id': self.blog.id, 'content': '评论'}),
+            ]:
+                with self.assertRaises(DatabaseError):
+                    self.client.post(url, data)
+        self.assertFalse(BlogLike.objects.filter(blog=self.blog, user=self.readers[0]).exists())
+        self.assertFalse(BlogShare.objects.filter(blog=self.blog, user=self.readers[0]).exists())
+        self.assertEqual(BlogComment.objects.filter(blog=self.blog).count(), len(self.readers))
+
+
+class BlogCommentThreadTests(BlogAPITestCase):
+    """楼中楼评论：回复层级、楼层列表附带回复预览、单个楼层的子树"""
+
+    def test_comment_threads(self):
+        self.login(self.readers[0])
+        url = f'/api/blogs/{self.blog.id}/comment/add/'
+        top = BlogComment.objects.filter(blog=self.blog).order_by('pk').first()
+        reply = self.client.post(url, {'blog_id': self.blog.id, 'content': '回复', 'parent_id': top.id}).data['data']
+        nested = self.client.post(url, {'blog_id': self.blog.id, 'content': '楼中楼', 'parent_id': reply['id']}).data['data']
+        self.client.post(url, {'blog_id': self.blog.id, 'content': '回复 2', 'parent_id': top.id})
+        self.assertEqual((reply['depth'], nested['depth'], nested['parent_id']), (1, 2, reply['id']))
+        other = Blog.objects.exclude(pk=self.blog.pk).filter(status='published', is_public=True).first()
+        response = self.client.post(f'/api/blogs/{other.id}/comment/add/', {'blog_id': other.id, 'content': 'x', 'parent_id': top.id})
+        self.assertEqual(response.status_code, 400)
+        top.refresh_from_db()
+        self.assertEqual(top.reply_count, 3)
+
+        with self.assertQueryBudget('blog-comment-list'):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/comment/list/', {'threaded': 1, 'replies': 2})
+        threads = {item['id']: item for item in response.data['data']}
+        self.assertEqual(len(threads), 3)  # 只有顶层评论
+        self.assertEqual([item['content'] for item in threads[top.id]['replies']], ['回复', '楼中楼'])
+
+        with self.assertQueryBudget('blog-comment-thread'):
+            response = self.client.get(f'/api/blogs/{self.blog.id}/comment/{reply["id"]}/thread/')
+        self.assertEqual([item['id'] for item in response.data['data']], [reply['id'], nested['id']])
@@ -0,0 +1,357 @@
+# blog/timeline.py
+"""
+好友动态（首页时间线）：好友（Friend.is_approved）发布的公开博客，按 (created_at, id) 倒序
+
+- 写扩散（fan-out-on-write）：博客进入公开列表后，后台任务把 (时间, 博客) 推入每个好友的时间线；
+  每条时间线只保留最新的 BLOG_TIMELINE_MAX_LENGTH 条
+- 读扩散（fan-out-on-read）：好友数超过 BLOG_TIMELINE_FANOUT_LIMIT 的作者（大 V）不推送，
+  只记入大 V 集合；读取时从 Blog 表按作者取一页，与推送来的条目归并
+- 读取：时间线存储取一页 + 大 V 好友的博客取一页 + 一次回表，查询数固定，耗时只与页大小有关，
+  与好友总数无关；撤回/删除后尚未清理的条目在回表时过滤掉
+- 存储可替换：BLOG_TIMELINE_STORE 指定实现类，内置 MemoryTimelineStore（进程内）与
+  SQLiteTimelineStore（单机文件，多进程共享），多机部署可按 TimelineStore 的接口接入 Redis 等
+"""
+import bisect
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from user.models import Friend
+from .models import Blog
+from .pagination import keyset_slice
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def max_length():
+    return getattr(settings, 'BLOG_TIMELINE_MAX_LENGTH', 500)
+
+
+def fanout_limit():
+    return getattr(settings, 'BLOG_TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def to_score(created_at):
+    """发布时间 → 整数微秒时间戳（用浮点数会丢失微秒精度，游标与数据库比较时出现错位）"""
+    return (created_at - EPOCH) // timedelta(microseconds=1)
+
+
+def from_score(score):
+    return EPOCH + timedelta(microseconds=score)
+
+
+class TimelineStore:
+    """
+    时间线存储接口；条目为 (score, blog_id, author_id)，score 为发布时间戳，同一时间线内按 (score, blog_id) 倒序
+    所有写操作都是幂等的（重复推送同一篇博客不会产生重复条目）
+    """
+
+    def add(self, user_ids, score, blog_id, author_id):
+        """把一篇博客推入多个用户的时间线，并截断到 max_length()"""
+        raise NotImplementedError
+
+    def page(self, user_id, before=None, limit=20):
+        """取 before=(score, blog_id) 之后（更旧）的 limit 条，返回 [(score, blog_id), ...]"""
+        raise NotImplementedError
+
+    def remove_blog(self, blog_id):
+        """从所有时间线中删除一篇博客"""
+        raise NotImplementedError
+
+    def remove_author(self, user_id, author_id):
+        """从某个用户的时间线中删除某个作者的全部博客（解除好友时）"""
+        raise NotImplementedError
+
+    def set_celebrity(self, author_id, flag):
+        raise NotImplementedError
+
+    def celebrities(self):
+        """读扩散作者的 id 集合"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryTimelineStore(TimelineStore):
+    """进程内实现：适合单进程部署与测试，重启后需要用 rebuild_timelines 重建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lines = {}   # user_id -> 按 (score, blog_id) 升序的 [(score, blog_id, author_id)]
+        self._readers = {}  # blog_id -> 收到该博客的 user_id 集合
+        self._celebrities = set()
+
+    def add(self, user_ids, score, blog_id, author_id):
+        entry = (score, blog_id, author_id)
+        with self._lock:
+            for user_id in user_ids:
+                line = self._lines.setdefault(user_id, [])
+                index = bisect.bisect_left(line, (score, blog_id))
+                if index < len(line) and line[index][:2] == (score, blog_id):
+                    continue
+                line.insert(index, entry)
+                self._readers.setdefault(blog_id, set()).add(user_id)
+                for dropped in line[:max(0, len(line) - max_length())]:
+                    self._readers.get(dropped[1], set()).discard(user_id)
+                del line[:max(0, len(line) - max_length())]
+
+    def page(self, user_id, before=None, limit=20):
+        with self._lock:
+            line = self._lines.get(user_id, [])
+            end = bisect.bisect_left(line, before) if before is not None else len(line)
+            return [(score, blog_id) for score, blog_id, _ in reversed(line[max(0, end - limit):end])]
+
+    def remove_blog(self, blog_id):
+        with self._lock:
+            for user_id in self._readers.pop(blog_id, ()):
+                line = self._lines.get(user_id, [])
+                line[:] = [entry for entry in line if entry[1] != blog_id]
+
+    def remove_author(self, user_id, author_id):
+        with self._lock:
+            line = self._lines.get(user_id, [])
+            for entry in line:
+                if entry[2] == author_id:
+                    self._readers.get(entry[1], set()).discard(user_id)
+            line[:] = [entry for entry in line if entry[2] != author_id]
+
+    def set_celebrity(self, author_id, flag):
+        with self._lock:
+            (self._celebrities.add if flag else self._celebrities.discard)(author_id)
+
+    def celebrities(self):
+        with self._lock:
+            return set(self._celebrities)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+            self._readers.clear()
+            self._celebrities.clear()
+
+
+class SQLiteTimelineStore(TimelineStore):
+    """单机文件实现（BLOG_TIMELINE_PATH），Web 进程与 Celery worker 共享；每个线程持有独立连接"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS entries ("
+        " user_id INTEGER NOT NULL, score INTEGER NOT NULL, blog_id INTEGER NOT NULL, author_id INTEGER NOT NULL,"
+        " PRIMARY KEY (user_id, score, blog_id)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS entries_blog_id ON entries (blog_id)",
+        "CREATE INDEX IF NOT EXISTS entries_user_author ON entries (user_id, author_id)",
+        "CREATE TABLE IF NOT EXISTS celebrities (author_id INTEGER PRIMARY KEY)",
+    )
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'BLOG_TIMELINE_PATH', os.path.join(settings.BASE_DIR, 'timeline.sqlite3'))
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def add(self, user_ids, score, blog_id, author_id):
+        user_ids = list(user_ids)
+        with self.conn as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (user_id, score, blog_id, author_id) VALUES (?, ?, ?, ?)",
+                [(user_id, score, blog_id, author_id) for user_id in user_ids],
+            )
+            # 截断：按主键倒序跳过最新的 max_length() 条，其余删除
+            conn.executemany(
+                "DELETE FROM entries WHERE user_id = ? AND (score, blog_id) IN ("
+                " SELECT score, blog_id FROM entries WHERE user_id = ?"
+                " ORDER BY score DESC, blog_id DESC LIMIT -1 OFFSET ?)",
+                [(user_id, user_id, max_length()) for user_id in user_ids],
+            )
+
+    def page(self, user_id, before=None, limit=20):
+        if before is None:
+            rows = self.conn.execute(
+                "SELECT score, blog_id FROM entries WHERE user_id = ?"
+                " ORDER BY score DESC, blog_id DESC LIMIT ?", (user_id, limit)
+            )
+        else:
+            score, blog_id = before
+            rows = self.conn.execute(
+                "SELECT score, blog_id FROM entries WHERE user_id = ? AND (score < ? OR (score = ? AND blog_id < ?))"
+                " ORDER BY score DESC, blog_id DESC LIMIT ?", (user_id, score, score, blog_id, limit)
+            )
+        return rows.fetchall()
+
+    def remove_blog(self, blog_id):
+        with self.conn as conn:
+            conn.execute("DELETE FROM entries WHERE blog_id = ?", (blog_id,))
+
+    def remove_author(self, user_id, author_id):
+        with self.conn as conn:
+            conn.execute("DELETE FROM entries WHERE user_id = ? AND author_id = ?", (user_id, author_id))
+
+    def set_celebrity(self, author_id, flag):
+        with self.conn as conn:
+            if flag:
+                conn.execute("INSERT OR IGNORE INTO celebrities (author_id) VALUES (?)", (author_id,))
+            else:
+                conn.execute("DELETE FROM celebrities WHERE author_id = ?", (author_id,))
+
+    def celebrities(self):
+        return {row[0] for row in self.conn.execute("SELECT author_id FROM celebrities")}
+
+    def clear(self):
+        with self.conn as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM celebrities")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """按 BLOG_TIMELINE_STORE 返回（并缓存）存储实例"""
+    path = getattr(settings, 'BLOG_TIMELINE_STORE', 'blog.timeline.SQLiteTimelineStore')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_string(path)()
+        return _stores[path]
+
+
+# ---------- 好友关系 ----------
+def friends_query(user_id):
+    """双向好友关系（每个分支各走一个索引）"""
+    return Q(user_id=user_id, is_approved=True) | Q(friend_id=user_id, is_approved=True)
+
+
+def friend_ids(user_id):
+    """好友 id 列表（按块迭代，大 V 的好友很多时也不会一次性载入全部行）"""
+    rows = Friend.objects.filter(friends_query(user_id)).values_list('user_id', 'friend_id')
+    return [friend if user == user_id else user for user, friend in rows.iterator(chunk_size=2000)]
+
+
+def is_listed_blog(queryset):
+    return queryset.filter(is_public=True, status='published')
+
+
+# ---------- 写入 ----------
+def fan_out(blog_id):
+    """
+    把一篇公开博客推入作者所有好友的时间线；作者好友数超过阈值时改为读扩散
+    返回推送的好友数（读扩散或博客不可见时为 0）
+    """
+    blog = is_listed_blog(Blog.objects.filter(pk=blog_id)).values('author_id', 'created_at').first()
+    if blog is None:
+        return 0
+    followers = _followers_or_none(blog['author_id'])
+    if followers is None:
+        return 0
+    _push(followers, to_score(blog['created_at']), blog_id, blog['author_id'])
+    return len(followers)
+
+
+def _followers_or_none(author_id):
+    """返回作者的好友 id 列表；作者是大 V（改为读扩散）时返回 None，并同步大 V 标记"""
+    celebrity = Friend.objects.filter(friends_query(author_id)).count() > fanout_limit()
+    get_store().set_celebrity(author_id, celebrity)
+    return None if celebrity else friend_ids(author_id)
+
+
+def _push(followers, score, blog_id, author_id):
+    store = get_store()
+    batch_size = getattr(settings, 'BLOG_TIMELINE_FANOUT_BATCH', 500)
+    for start in range(0, len(followers), batch_size):
+        store.add(followers[start:start + batch_size], score, blog_id, author_id)
+
+
+def retract(blog_id):
+    """博客撤回/转为私密/删除后从所有时间线中移除"""
+    get_store().remove_blog(blog_id)
+
+
+def merge_friend(user_id, friend_id):
+    """新成为好友：把对方最近的公开博客补进自己的时间线（对方是大 V 时读取时自然会合并）"""
+    store = get_store()
+    if friend_id in store.celebrities():
+        return 0
+    blogs = is_listed_blog(Blog.objects.filter(author_id=friend_id)).order_by('-created_at', '-id')
+    rows = list(blogs.values_list('id', 'created_at')[:max_length()])
+    for blog_id, created_at in rows:
+        store.add([user_id], to_score(created_at), blog_id, friend_id)
+    return len(rows)
+
+
+def unmerge_friend(user_id, friend_id):
+    get_store().remove_author(user_id, friend_id)
+
+
+# ---------- 读取 ----------
+def celebrity_friends(user_id, store):
+    celebrities = store.celebrities()
+    if not celebrities:
+        return []
+    rows = Friend.objects.filter(
+        Q(user_id=user_id, friend_id__in=celebrities, is_approved=True)
+        | Q(friend_id=user_id, user_id__in=celebrities, is_approved=True)
+    ).values_list('user_id', 'friend_id')
+    return [friend if user == user_id else user for user, friend in rows]
+
+
+def read_page(user_id, queryset, page_size, position=None):
+    """
+    取时间线的一页：position 为上一页最后一条的 (created_at, id)
+    queryset 为回表用的博客查询（已限定公开 + 已发布，可带 select_related / only）
+    返回 (blogs, has_more, last_position)；last_position 是本页扫描到的最后位置，作为下一页游标
+    """
+    store = get_store()
+    before = (to_score(position[0]), position[1]) if position else None
+    # 推送来的条目：(created_at, id)
+    candidates = [(from_score(score), blog_id) for score, blog_id in store.page(user_id, before, page_size + 1)]
+
+    # 大 V 好友：一条查询按 (created_at, id) 游标取一页（大 V 集合很小，走 author + created_at 索引），再归并
+    authors = celebrity_friends(user_id, store)
+    if authors:
+        rows, _ = keyset_slice(
+            is_listed_blog(Blog.objects.filter(author_id__in=authors)).only('id', 'created_at'),
+            page_size + 1, position,
+        )
+        candidates.extend((blog.created_at, blog.pk) for blog in rows)
+
+    candidates = sorted(set(candidates), reverse=True)
+    has_more = len(candidates) > page_size
+    candidates = candidates[:page_size]
+    if not candidates:
+        return [], False, None
+
+    blogs = queryset.order_by().in_bulk([blog_id for _, blog_id in candidates])
+    ordered = [blogs[blog_id] for _, blog_id in candidates if blog_id in blogs]
+    return ordered, has_more, candidates[-1]
+
+
+def rebuild():
+    """按数据库重建全部时间线（更换存储、进程内存储重启后使用），返回处理的作者数"""
+    get_store().clear()
+    authors = is_listed_blog(Blog.objects.order_by()).values_list('author_id', flat=True).distinct()
+    count = 0
+    for author_id in authors.iterator():
+        followers = _followers_or_none(author_id)
+        if followers:
+            recent = is_listed_blog(Blog.objects.filter(author_id=author_id)).order_by('-created_at', '-id')
+            for blog_id, created_at in recent.values_list('id', 'created_at')[:max_length()]:
+                _push(followers, to_score(created_at), blog_id, author_id)
+        count += 1
+    return count
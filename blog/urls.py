@@ -22,6 +22,8 @@ urlpatterns = [
     path('<int:blogId>/share/', BlogShareView.as_view({'post': 'create'}), name='blog-share'),
     # 评论列表：主路由api/blog/ + 子路由comment/list/ = api/blog/comment/list/（匹配前端）
     path('<int:pk>/comment/list/', BlogCommentListView.as_view({'get': 'list'}), name='blog-comment-list'),
+    # 评论楼层：某条评论及其全部回复
+    path('<int:pk>/comment/<int:comment_id>/thread/', BlogCommentListView.as_view({'get': 'thread'}), name='blog-comment-thread'),
     # 发布评论（补充）
     path('<int:blogId>/comment/add/', AddBlogCommentView.as_view({'post': 'create'}), name='blog-comment-add'),
     # 原有BlogViewSet路由
@@ -0,0 +1,234 @@
+# blog/viewcounts.py
+"""
+博客浏览量统计
+
+- 记录：record_view() 只更新进程内缓冲（按 (博客, 日期) 累计浏览次数，并把访客标识加入当日的
+  HyperLogLog 草图），请求中不写数据库
+- 合并：缓冲超过 BLOG_VIEW_FLUSH_INTERVAL 秒或 BLOG_VIEW_BUFFER_SIZE 组时整体取出（后台定时线程按间隔检查，
+  之后没有新浏览也会按时刷出），
+  投递 Celery 任务 flush_blog_views 写库：Blog.view_count 与作者的 UserStats.view_count 原子累加，
+  BlogViewDaily 的浏览次数累加、  草图按寄存器取最大值合并（多个进程的缓冲可以任意顺序合并）；消息队列不可用时在当前进程直接写库；
+  一个快照的所有写入在同一个事务内完成，失败时整体回滚
+- 进程退出时尽量把缓冲刷出（atexit，数据库不可用时放弃），异常退出最多丢失一个合并周期内的浏览
+- 访客标识：只有请求来自 BLOG_TRUSTED_PROXIES 中的反向代理时才采信 X-Forwarded-For，
+  否则按连接地址区分（客户端可以随意伪造该请求头刷访客数）
+- 查询：blog_stats() / author_stats() 返回总浏览量与去重访客估计（误差约 3%）；
+  总浏览量为已合并的值，相对实时数据最多滞后一个合并周期
+"""
+import atexit
+import base64
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user import stats as user_stats
+from utils.hyperloglog import HyperLogLog
+from .models import Blog, BlogViewDaily
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_buffer = {}  # (blog_id, 'YYYY-MM-DD') -> [浏览次数, HyperLogLog]
+_last_flush = time.monotonic()
+_flusher = None
+_stopped = threading.Event()
+
+
+def flush_interval():
+    return getattr(settings, 'BLOG_VIEW_FLUSH_INTERVAL', 30)
+
+
+def buffer_size():
+    return getattr(settings, 'BLOG_VIEW_BUFFER_SIZE', 1000)
+
+
+def client_ip(request):
+    """
+    客户端 IP：连接来自受信任的代理时，从 X-Forwarded-For 末尾往前跳过受信任的代理，
+    取第一个不受信任的地址（最左边的值由客户端填写，不可信）；否则直接用连接地址
+    """
+    trusted = set(getattr(settings, 'BLOG_TRUSTED_PROXIES', []))
+    ip = request.META.get('REMOTE_ADDR', '')
+    if ip not in trusted:
+        return ip
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted:
+            return hop
+    return hops[0] if hops else ip
+
+
+def visitor_key(request):
+    """登录用户按用户 id，匿名访客按 IP + User-Agent 区分"""
+    if request.user.is_authenticated:
+        return f"u:{request.user.id}"
+    return f"a:{client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+
+
+def record_view(blog_id, visitor):
+    """记录一次浏览（只写进程内缓冲）"""
+    global _last_flush
+    day = timezone.localdate().isoformat()
+    with _lock:
+        entry = _buffer.get((blog_id, day))
+        if entry is None:
+            entry = _buffer[(blog_id, day)] = [0, HyperLogLog()]
+        entry[0] += 1
+        entry[1].add(visitor)
+        _start_flusher()
+        due = len(_buffer) >= buffer_size() or time.monotonic() - _last_flush >= flush_interval()
+        if not due:
+            return
+        snapshot = _take_buffer()
+    _dispatch(snapshot)
+
+
+def _start_flusher():
+    """首次记录浏览时启动后台定时线程（调用方持有 _lock）"""
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_run_flusher, name='blog-view-flusher', daemon=True)
+        _flusher.start()
+
+
+def _run_flusher():
+    while not _stopped.wait(max(_last_flush + flush_interval() - time.monotonic(), 1)):
+        try:
+            flush_due()
+        except Exception:
+            logger.exception("定时刷出浏览量缓冲失败")
+        finally:
+            # 投递失败时在本线程写库，用完归还连接
+            close_old_connections()
+
+
+def flush_due():
+    """缓冲不为空且距上次合并已超过间隔时刷出，返回刷出的组数"""
+    with _lock:
+        if not _buffer or time.monotonic() - _last_flush < flush_interval():
+            return 0
+        snapshot = _take_buffer()
+    _dispatch(snapshot)
+    return len(snapshot)
+
+
+def _take_buffer():
+    global _buffer, _last_flush
+    snapshot, _buffer = _buffer, {}
+    _last_flush = time.monotonic()
+    return snapshot
+
+
+def flush():
+    """立即刷出当前进程的缓冲，返回刷出的 (博客, 日期) 组数"""
+    with _lock:
+        snapshot = _take_buffer()
+    _dispatch(snapshot)
+    return len(snapshot)
+
+
+def _dispatch(snapshot):
+    if not snapshot:
+        return
+    # 任务参数需可 JSON 序列化：草图转成 base64 字符串
+    rows = [
+        [blog_id, day, views, base64.b64encode(sketch.to_bytes()).decode()]
+        for (blog_id, day), (views, sketch) in snapshot.items()
+    ]
+    from .tasks import flush_blog_views
+    try:
+        flush_blog_views.delay(rows)
+    except Exception:
+        logger.exception("投递浏览量合并任务失败，改为在当前进程写库")
+        try:
+            apply(rows)
+        except Exception:
+            logger.exception("浏览量写库失败，丢弃 %s 组缓冲", len(rows))
+
+
+def apply(rows):
+    """
+    把缓冲快照合并进数据库（由 flush_blog_views 任务调用），返回合并的组数
+    整个快照在一个事务内合并：中途失败时全部回滚，任务重试不会重复累加已写入的部分
+    """
+    with transaction.atomic():
+        authors = dict(Blog.objects.filter(pk__in={row[0] for row in rows}).values_list('id', 'author_id'))
+        totals = {}
+        merged = 0
+        for blog_id, day, views, sketch in sorted(rows):
+            if blog_id not in authors:
+                continue  # 博客已被删除
+            incoming = HyperLogLog.from_bytes(base64.b64decode(sketch))
+            daily, _ = BlogViewDaily.objects.select_for_update().get_or_create(blog_id=blog_id, day=day)
+            daily.views += views
+            daily.visitors_sketch = HyperLogLog.from_bytes(daily.visitors_sketch).merge(incoming).to_bytes()
+            daily.save(update_fields=['views', 'visitors_sketch'])
+            totals[blog_id] = totals.get(blog_id, 0) + views
+            merged += 1
+        # update() 只改浏览量，不触发 post_save（不影响列表缓存、搜索索引、updated_at）
+        # 按 id 顺序加锁，并发合并的事务之间不会死锁
+        by_author = {}
+        for blog_id, views in sorted(totals.items()):
+            Blog.objects.filter(pk=blog_id).update(view_count=F('view_count') + views)
+            by_author[authors[blog_id]] = by_author.get(authors[blog_id], 0) + views
+        for author_id, views in sorted(by_author.items()):
+            user_stats.incr(author_id, view_count=views)
+    return merged
+
+
+def _daily_rows(queryset, days):
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return list(queryset.filter(day__gte=since).order_by('day').values_list('day', 'views', 'visitors_sketch'))
+
+
+def blog_stats(blog, days=None):
+    """单篇博客：总浏览量、最近 days 天的去重访客估计与每日明细"""
+    days = days or getattr(settings, 'BLOG_VIEW_STATS_DAYS', 30)
+    rows = _daily_rows(BlogViewDaily.objects.filter(blog_id=blog.pk), days)
+    sketches = [HyperLogLog.from_bytes(sketch) for _, _, sketch in rows]
+    return {
+        'view_count': blog.view_count,
+        'unique_visitors': HyperLogLog.union(sketches).count(),
+        'days': days,
+        'daily': [
+            {'date': day.isoformat(), 'views': views, 'unique_visitors': sketch.count()}
+            for (day, views, _), sketch in zip(rows, sketches)
+        ],
+    }
+
+
+def author_stats(author_id, days=None):
+    """作者维度：全部博客的总浏览量，最近 days 天的浏览次数与去重访客估计（同一访客看多篇只算一次）"""
+    days = days or getattr(settings, 'BLOG_VIEW_STATS_DAYS', 30)
+    total = user_stats.get(author_id)['view_count']
+    rows = _daily_rows(BlogViewDaily.objects.filter(blog__author_id=author_id), days)
+    return {
+        'view_count': total,
+        'recent_views': sum(views for _, views, _ in rows),
+        'unique_visitors': HyperLogLog.union(HyperLogLog.from_bytes(sketch) for _, _, sketch in rows).count(),
+        'days': days,
+    }
+
+
+def _flush_at_exit():
+    _stopped.set()
+    if not _buffer:
+        return
+    try:
+        available = Blog._meta.db_table in connection.introspection.table_names()
+    except DatabaseError:
+        available = False
+    if not available:
+        # 例如测试结束后测试库已销毁：不能写到别的库里
+        logger.warning("数据库不可用，丢弃 %s 组浏览量缓冲", len(_buffer))
+        return
+    flush()
+
+
+atexit.register(_flush_at_exit)
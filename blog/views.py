@@ -21,21 +21,37 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
-from .serializers import BlogSerializer, BlogListSerializer, BlogDetailSerializer
+from .serializers import BlogSerializer, BlogListSerializer, BlogDetailSerializer, BlogBulkSerializer, BlogBulkUpdateSerializer
 from .permissions import IsAuthorOrReadOnly  # 确保导入自定义权限类
 from rest_framework import viewsets, status, generics
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from .models import Blog, BlogLike, BlogShare, BlogComment
-from .serializers import BlogCommentSerializer, AddBlogCommentSerializer
-
-class BlogViewSet(viewsets.ModelViewSet):
+from . import cache as list_cache
+from . import bulk, comments, conditional, counters, hot, interactions, timeline, viewcounts
+from .pagination import KeysetPagination, KeysetPaginationMixin, RankingPagination, decode_cursor, encode_cursor, is_keyset_request
+from .search import BlogSearchFilter
+from user import stats as user_stats
+from utils.sparse_fields import sparse_queryset
+from .serializers import BlogCommentSerializer, BlogCommentThreadSerializer, AddBlogCommentSerializer
+
+class BlogViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
+    """
+    博客视图集：列表默认页码分页（?page=），
+    带 ?cursor= 或 ?pagination=cursor 时改为按 (created_at, id) 的游标分页；
+    ?ordering=hot 按定时计算的热门排行返回（页码分页）；
+    列表/详情支持 ?fields= / ?omit= 稀疏字段集（见 utils/sparse_fields.py）
+    """
     authentication_classes = [JWTAuthentication]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BlogSearchFilter, filters.OrderingFilter]
     filterset_fields = ['author__username', 'is_public', 'status']
-    search_fields = ['title', 'content']
+    search_fields = ['title', 'content']  # 由 BlogSearchFilter 走倒排索引检索，不再 LIKE 扫表
     ordering_fields = ['created_at', 'updated_at']
 
     def get_queryset(self):
@@ -50,23 +66,32 @@ class BlogViewSet(viewsets.ModelViewSet):
             return Blog.objects.filter(author=user) if user.is_authenticated else Blog.objects.none()
         # 我的博客列表：当前用户所有博客
         elif self.action == 'my_blogs':
-            return Blog.objects.filter(author=user)
-        # 公开列表：仅公开+已发布
-        return Blog.objects.filter(is_public=True, status='published')
+            return self.sparse_queryset(Blog.objects.filter(author=user).select_related('author'))
+        # 公开列表：仅公开+已发布（作者随列表一次 JOIN 取回，避免逐条查询作者）
+        return self.sparse_queryset(Blog.objects.filter(is_public=True, status='published').select_related('author'))
+
+    def sparse_queryset(self, queryset):
+        """读接口只查询序列化器要输出的列（支持 ?fields= / ?omit=），列表不再读取博客正文"""
+        if self.action not in ['list', 'my_blogs', 'retrieve', 'timeline']:
+            return queryset
+        # created_at 是游标分页的排序键，updated_at 用于计算列表 ETag，始终加载
+        return sparse_queryset(queryset, self.get_serializer_class(), self.request, always=['created_at', 'updated_at'])
 
     def get_permissions(self):
         """权限控制：创建需登录，编辑/删除仅作者"""
-        if self.action in ['create']:
+        if self.action in ['create', 'timeline', 'bulk_publish', 'bulk_unpublish', 'bulk_update', 'bulk_delete']:
             permission_classes = [permissions.IsAuthenticated]
         elif self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly]
+        elif self.action == 'cache_stats':
+            permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.AllowAny]
         return [permission() for permission in permission_classes]
 
     def get_serializer_class(self):
         """动态序列化器：列表/我的文章用简化版，详情用完整版"""
-        if self.action == 'list' or self.action == 'my_blogs':
+        if self.action in ['list', 'my_blogs', 'timeline']:
             return BlogListSerializer
         elif self.action == 'retrieve':
             return BlogDetailSerializer
@@ -86,13 +111,27 @@ class BlogViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK, headers=headers)
 
     def retrieve(self, request, *args, **kwargs):
+        # 条件请求：updated_at/计数未变时直接 304，不加载正文、不序列化
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            raise NotFound('博客不存在')
+        etag = conditional.detail_validators(request, self.get_queryset(), pk)
+        if etag is not None:
+            # 浏览量只写进程内缓冲（304 也算一次浏览），由后台任务批量合并入库
+            viewcounts.record_view(pk, viewcounts.visitor_key(request))
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
         instance = self.get_object()
         serializer = self.get_serializer(instance)
-        return Response({
+        response = Response({
             'code': status.HTTP_200_OK,
             'message': '获取博客详情成功',
             'data': serializer.data
         }, status=status.HTTP_200_OK)
+        return conditional.add_validators(request, response, etag)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -120,21 +159,97 @@ class BlogViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK)
 
     def list(self, request, *args, **kwargs):
+        # 匿名访问走版本化响应缓存（键含过滤/搜索/排序/分页参数，公开博客变动即失效）
+        # 缓存条目里同时保存 ETag，命中时条件请求也不需要查库
+        cacheable = not request.user.is_authenticated
+        if cacheable:
+            cache_key, cached = list_cache.lookup(request)
+            if cached is not None:
+                etag = cached['etag']
+                response = conditional.not_modified(request, etag) or Response(cached['body'], status=status.HTTP_200_OK)
+                response['X-Cache'] = 'HIT'
+                return conditional.add_validators(request, response, etag)
+
         queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
+        # ?ordering=hot：按定时任务算好的热门排行分页（见 blog/hot.py），排行版本参与 ETag
+        ranking, ranking_version = hot.ranked_ids() if self.is_hot_request() else (None, None)
+        page = self.paginate_queryset(queryset) if ranking is None else self.paginate_hot(queryset, ranking)
+        rows = list(queryset) if page is None else page
+        # 校验值由当前页计算（分页本来就要取回这些行），不对整个结果集做聚合
+        etag = conditional.list_validators(
+            request, rows, *self.pagination_state(page), *([] if ranking is None else [ranking_version])
+        )
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        serializer = self.get_serializer(rows, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response({
+            response = self.get_paginated_response({
                 'code': status.HTTP_200_OK,
                 'message': '获取博客列表成功',
                 'data': serializer.data
             })
+        else:
+            response = Response({
+                'code': status.HTTP_200_OK,
+                'message': '获取博客列表成功',
+                'data': serializer.data
+            }, status=status.HTTP_200_OK)
+
+        if cacheable:
+            list_cache.store(cache_key, {'body': response.data, 'etag': etag})
+            response['X-Cache'] = 'MISS'
+        return conditional.add_validators(request, response, etag)
+
+    @action(detail=True, url_path='views')
+    def view_stats(self, request, pk=None):
+        """单篇博客的浏览统计：总浏览量、最近 ?days= 天（默认 30）的去重访客估计与每日明细"""
+        blog = self.get_object()
+        return Response({
+            'code': status.HTTP_200_OK,
+            'message': '获取浏览统计成功',
+            'data': viewcounts.blog_stats(blog, self.stats_days())
+        }, status=status.HTTP_200_OK)
 
-        serializer = self.get_serializer(queryset, many=True)
+    @action(detail=False, url_path=r'authors/(?P<author_id>[0-9]+)/views')
+    def author_view_stats(self, request, author_id=None):
+        """作者全部博客的浏览统计：总浏览量、最近 ?days= 天的浏览次数与去重访客估计"""
         return Response({
             'code': status.HTTP_200_OK,
-            'message': '获取博客列表成功',
-            'data': serializer.data
+            'message': '获取作者浏览统计成功',
+            'data': viewcounts.author_stats(int(author_id), self.stats_days())
+        }, status=status.HTTP_200_OK)
+
+    def stats_days(self):
+        try:
+            return max(1, min(int(self.request.query_params.get('days', 30)), 365))
+        except ValueError:
+            return 30
+
+    def is_hot_request(self):
+        return self.request.query_params.get('ordering') == 'hot'
+
+    def paginate_hot(self, queryset, ranking):
+        """
+        热门排行分页：先用一条主键查询按当前过滤条件（及可见性）筛掉排行中不符合的博客，
+        再对 id 列表做页码分页，只对当前页回表
+        """
+        allowed = set(queryset.filter(pk__in=ranking).values_list('id', flat=True)) if ranking else set()
+        ranked = [pk for pk in ranking if pk in allowed]
+        # 排行只支持页码分页（游标分页依赖 created_at 排序）
+        self._paginator = RankingPagination()
+        page_ids = self.paginator.paginate_queryset(ranked, self.request, view=self)
+        blogs = queryset.order_by().in_bulk(page_ids)
+        return [blogs[pk] for pk in page_ids if pk in blogs]
+
+    @action(detail=False, url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """公开列表缓存的命中/未命中统计（仅管理员）"""
+        return Response({
+            'code': status.HTTP_200_OK,
+            'message': '获取列表缓存统计成功',
+            'data': list_cache.get_stats()
         }, status=status.HTTP_200_OK)
 
     # ========== 自定义action保持并优化状态码 ==========
@@ -159,17 +274,33 @@ class BlogViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_401_UNAUTHORIZED)
 
         blogs = self.get_queryset()
-        serializer = self.get_serializer(blogs, many=True)
-        return Response({
-            'code': status.HTTP_200_OK,
-            'message': '我的博客列表获取成功',
-            'data': serializer.data
-        }, status=status.HTTP_200_OK)
+        # 游标分页模式下分页返回；不带游标参数时保持原来的全量返回
+        page = self.paginate_queryset(blogs) if is_keyset_request(request) else None
+        rows = list(blogs) if page is None else page
+        etag = conditional.list_validators(request, rows, *self.pagination_state(page))
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        serializer = self.get_serializer(rows, many=True)
+        if page is not None:
+            response = self.get_paginated_response({
+                'code': status.HTTP_200_OK,
+                'message': '我的博客列表获取成功',
+                'data': serializer.data
+            })
+        else:
+            response = Response({
+                'code': status.HTTP_200_OK,
+                'message': '我的博客列表获取成功',
+                'data': serializer.data
+            }, status=status.HTTP_200_OK)
+        return conditional.add_validators(request, response, etag)
 
     @action(detail=True, methods=['patch'], permission_classes=[permissions.IsAuthenticated], authentication_classes=[JWTAuthentication])
     def publish(self, request, pk=None):
         blog = self.get_object()
-        if blog.author != request.user:
+        if blog.author_id != request.user.id:
             return Response({
                 'code': status.HTTP_403_FORBIDDEN,
                 'message': '无权限发布他人博客',
@@ -187,7 +318,7 @@ class BlogViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['patch'], permission_classes=[permissions.IsAuthenticated], authentication_classes=[JWTAuthentication])
     def unpublish(self, request, pk=None):
         blog = self.get_object()
-        if blog.author != request.user:
+        if blog.author_id != request.user.id:
             return Response({
                 'code': status.HTTP_403_FORBIDDEN,
                 'message': '无权限操作他人博客',
@@ -202,6 +333,73 @@ class BlogViewSet(viewsets.ModelViewSet):
             'data': serializer.data
         }, status=status.HTTP_200_OK)
 
+    @action(detail=False)
+    def timeline(self, request):
+        """
+        好友动态：好友发布的公开博客，按发布时间倒序，只支持游标分页（?cursor= / ?page_size=）
+        读取开销与页大小有关，与好友数量无关（见 blog/timeline.py）
+        """
+        paginator = KeysetPagination()
+        position = None
+        raw_cursor = request.query_params.get(paginator.cursor_query_param)
+        if raw_cursor:
+            try:
+                created_at, pk, _ = decode_cursor(raw_cursor)
+            except ValueError:
+                raise NotFound(paginator.invalid_cursor_message)
+            position = (created_at, pk)
+
+        blogs, has_more, last = timeline.read_page(request.user.id, self.get_queryset(), paginator.get_page_size(request), position)
+        serializer = self.get_serializer(blogs, many=True)
+        next_link = None
+        if has_more:
+            next_link = replace_query_param(request.build_absolute_uri(), paginator.cursor_query_param, encode_cursor(*last))
+        return Response({
+            'next': next_link,
+            'previous': None,
+            'results': {
+                'code': status.HTTP_200_OK,
+                'message': '好友动态获取成功',
+                'data': serializer.data
+            }
+        }, status=status.HTTP_200_OK)
+
+    # ========== 批量操作：一个事务内集合 UPDATE / DELETE，返回逐个 id 的结果（见 blog/bulk.py） ==========
+    def _bulk_update(self, request, serializer_class, changes, message):
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = {**changes, **{field: serializer.validated_data[field] for field in ('status', 'is_public') if field in serializer.validated_data}}
+        results = bulk.update(request.user, serializer.validated_data['ids'], changes)
+        return Response({
+            'code': status.HTTP_200_OK,
+            'message': message,
+            'data': results
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk/publish')
+    def bulk_publish(self, request):
+        return self._bulk_update(request, BlogBulkSerializer, {'status': 'published'}, '批量发布完成')
+
+    @action(detail=False, methods=['post'], url_path='bulk/unpublish')
+    def bulk_unpublish(self, request):
+        return self._bulk_update(request, BlogBulkSerializer, {'status': 'draft'}, '批量撤回完成')
+
+    @action(detail=False, methods=['post'], url_path='bulk/update')
+    def bulk_update(self, request):
+        """批量修改状态 / 可见性：{"ids": [...], "status": "draft", "is_public": false}"""
+        return self._bulk_update(request, BlogBulkUpdateSerializer, {}, '批量修改完成')
+
+    @action(detail=False, methods=['post'], url_path='bulk/delete')
+    def bulk_delete(self, request):
+        serializer = BlogBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.delete(request.user, serializer.validated_data['ids'])
+        return Response({
+            'code': status.HTTP_200_OK,
+            'message': '批量删除完成',
+            'data': results
+        }, status=status.HTTP_200_OK)
+
 
 # 1. 博客点赞接口
 class BlogLikeView(viewsets.ModelViewSet):
@@ -209,30 +407,41 @@ class BlogLikeView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        blog_id = kwargs.get("pk")
-        blog = get_object_or_404(Blog, id=blog_id, is_public=True, status="published")
+        # 路由参数为 blogId（见 blog/urls.py），兼容 pk
+        blog_id = kwargs.get("blogId", kwargs.get("pk"))
+        # 只取主键与作者：计数走分片，不再读写 Blog 整行
+        blog = get_object_or_404(Blog.objects.only("id", "author_id"), id=blog_id, is_public=True, status="published")
         user = request.user
 
         # 判断是否已点赞：已点赞则取消，未点赞则添加
-        like, created = BlogLike.objects.get_or_create(blog=blog, user=user)
+        # 明细行与计数增量在同一事务中提交，中途失败不会留下对不上的计数
+        with transaction.atomic():
+            like, created = BlogLike.objects.get_or_create(blog=blog, user=user)
+            if created:
+                delta = 1
+            else:
+                # 并发的取消点赞请求只有一个真正删除了行，其余不再扣减计数
+                deleted, _ = BlogLike.objects.filter(pk=like.pk).delete()
+                delta = -1 if deleted else 0
+            if delta:
+                like_count = counters.incr(blog.id, "like_count", delta)
+                user_stats.incr(blog.author_id, likes_received=delta)
+            else:
+                like_count = counters.get_count(blog.id, "like_count")
+        interactions.bump_version(user.id)
         if not created:
             # 取消点赞
-            like.delete()
-            blog.like_count = max(0, blog.like_count - 1)
-            blog.save()
             return Response({
                 "code": 200,
                 "message": "取消点赞成功",
-                "data": {"is_liked": False, "like_count": blog.like_count}
+                "data": {"is_liked": False, "like_count": like_count}
             }, status=status.HTTP_200_OK)
         else:
             # 新增点赞
-            blog.like_count += 1
-            blog.save()
             return Response({
                 "code": 200,
                 "message": "点赞成功",
-                "data": {"is_liked": True, "like_count": blog.like_count}
+                "data": {"is_liked": True, "like_count": like_count}
             }, status=status.HTTP_200_OK)
 
 # 2. 博客转发接口
@@ -241,19 +450,21 @@ class BlogShareView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        blog_id = kwargs.get("pk")
-        blog = get_object_or_404(Blog, id=blog_id, is_public=True, status="published")
+        blog_id = kwargs.get("blogId", kwargs.get("pk"))
+        blog = get_object_or_404(Blog.objects.only("id", "author_id"), id=blog_id, is_public=True, status="published")
         user = request.user
 
-        # 记录转发行为（允许重复转发）
-        BlogShare.objects.create(blog=blog, user=user)
-        blog.share_count += 1
-        blog.save()
+        # 记录转发行为（允许重复转发），与计数增量在同一事务中提交
+        with transaction.atomic():
+            BlogShare.objects.create(blog=blog, user=user)
+            share_count = counters.incr(blog.id, "share_count", 1)
+            user_stats.incr(blog.author_id, shares_received=1)
+        interactions.bump_version(user.id)
 
         return Response({
             "code": 200,
             "message": "转发成功",
-            "data": {"share_count": blog.share_count}
+            "data": {"share_count": share_count}
         }, status=status.HTTP_200_OK)
 
 # 3. 发布评论接口
@@ -269,16 +480,13 @@ class AddBlogCommentView(viewsets.ModelViewSet):
         blog = serializer.context["blog"]
         content = serializer.validated_data["content"]
 
-        # 创建评论
-        comment = BlogComment.objects.create(
-            blog=blog,
-            author=request.user,
-            content=content
-        )
+        with transaction.atomic():
+            # 创建评论（带 parent_id 时为楼中楼回复，物化路径与祖先回复数见 blog/comments.py）
+            comment = comments.create(blog, request.user, content, parent=serializer.context.get("parent"))
 
-        # 更新博客评论数
-        blog.comment_count += 1
-        blog.save()
+            # 更新博客评论数（分片计数，不重写博客整行），与评论在同一事务中提交
+            counters.incr(blog.id, "comment_count", 1)
+            user_stats.incr(blog.author_id, comments_received=1)
 
         return Response({
             "code": 200,
@@ -291,7 +499,11 @@ class AddBlogCommentView(viewsets.ModelViewSet):
 from rest_framework.pagination import PageNumberPagination
 
 
-class BlogCommentListView(viewsets.ModelViewSet):
+class BlogCommentListView(KeysetPaginationMixin, viewsets.ModelViewSet):
+    """
+    评论列表：默认按时间倒序的平铺列表；
+    ?threaded=1 时只分页顶层评论，每个楼层附带前 ?replies=N 条回复（默认 BLOG_COMMENT_REPLY_PREVIEW）
+    """
     serializer_class = BlogCommentSerializer
     pagination_class = PageNumberPagination  # 启用分页
     queryset = Blog.objects.all()
@@ -310,23 +522,72 @@ class BlogCommentListView(viewsets.ModelViewSet):
             blog=blog,
             blog__is_public=True,
             blog__status='published'
-        ).order_by("-created_at")
+        ).select_related("author").order_by("-created_at")
 
-        # 分页处理
+        threaded = request.query_params.get("threaded") in ("1", "true")
+        if threaded:
+            queryset = queryset.filter(parent__isnull=True)
+
+        # 分页处理；校验值由当前页（及回复预览）已取回的行计算，新增回复会让楼层的 reply_count 变化
         page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        # 整页楼层的前 N 条回复一条查询取回
+        replies = comments.preview_replies([comment.pk for comment in rows], self.reply_preview_size()) if threaded else None
+        etag = conditional.comment_validators(request, rows, replies, *self.pagination_state(page))
+        not_modified = conditional.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response({
+            serializer = self.serialize_comments(page, replies)
+            data = {
                 "code": 200,
                 "message": "获取评论列表成功",
                 "data": serializer.data,
-                "total": queryset.count()
-            })
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
+            }
+            # 页码分页时总数复用分页器已算过的 COUNT，游标分页不统计总数
+            if not is_keyset_request(request):
+                data["total"] = self.paginator.page.paginator.count
+            return conditional.add_validators(request, self.get_paginated_response(data), etag)
+
+        serializer = self.serialize_comments(rows, replies)
+        response = Response({
             "code": 200,
             "message": "获取评论列表成功",
             "data": serializer.data,
-            "total": queryset.count()
+            "total": len(rows)
+        }, status=status.HTTP_200_OK)
+        return conditional.add_validators(request, response, etag)
+
+    def serialize_comments(self, page, replies=None):
+        if replies is None:
+            return self.get_serializer(page, many=True)
+        return BlogCommentThreadSerializer(page, many=True, context={"replies": replies})
+
+    def reply_preview_size(self):
+        default = getattr(settings, "BLOG_COMMENT_REPLY_PREVIEW", 3)
+        try:
+            size = int(self.request.query_params.get("replies", default))
+        except ValueError:
+            return default
+        return max(0, min(size, getattr(settings, "BLOG_COMMENT_REPLY_PREVIEW_MAX", 20)))
+
+    def thread(self, request, *args, **kwargs):
+        """某条评论及其全部回复（按树形顺序平铺，客户端按 parent_id / depth 组装），最多 BLOG_COMMENT_THREAD_LIMIT 条"""
+        comment = BlogComment.objects.filter(
+            pk=kwargs["comment_id"], blog_id=kwargs["pk"], blog__is_public=True, blog__status="published"
+        ).only("id", "blog_id", "path").first()
+        if comment is None:
+            return Response({
+                "code": 404,
+                "message": "评论不存在",
+                "data": None
+            }, status=status.HTTP_404_NOT_FOUND)
+        limit = getattr(settings, "BLOG_COMMENT_THREAD_LIMIT", 500)
+        rows = list(comments.subtree(comment).select_related("author")[:limit + 1])
+        return Response({
+            "code": 200,
+            "message": "获取评论楼层成功",
+            "data": BlogCommentSerializer(rows[:limit], many=True).data,
+            "has_more": len(rows) > limit
         }, status=status.HTTP_200_OK)
\ No newline at end of file
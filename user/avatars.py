@@ -0,0 +1,116 @@
+# user/avatars.py
+"""
+用户头像多尺寸版本（renditions）
+
+- 上传头像后由 Celery 任务 process_avatar 在后台处理：居中裁成正方形，
+  缩放到 AVATAR_RENDITION_SIZES（默认 32/64/128/256px）并重新编码（去掉元数据）
+- 所有尺寸的文件都写好后，用一条 UPDATE 把 User.avatar_renditions 整体替换，
+  读取方要么看到全部旧版本、要么看到全部新版本：
+  {"source": "avatars/2025/01/01/a.png", "format": "webp", "sizes": {"32": "avatars/renditions/1/a-3f2c9a1b-32.webp", ...}}
+- 序列化器用 avatar_url(user, size) 取不小于目标尺寸的最小版本；版本未生成时回退到原图
+"""
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from utils import images
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# 与原有接口返回的头像地址保持一致
+URL_PREFIX = "http://127.0.0.1:8000"
+DEFAULT_AVATAR = "avatars/default.png"
+RENDITION_DIR = "avatars/renditions"
+
+# 各场景使用的头像尺寸（px）
+SIZE_MESSAGE = 32   # 聊天消息气泡
+SIZE_LIST = 64      # 好友列表、好友申请列表
+
+
+def rendition_sizes():
+    return sorted(set(getattr(settings, "AVATAR_RENDITION_SIZES", [32, 64, 128, 256])))
+
+
+def rendition_format():
+    return getattr(settings, "AVATAR_RENDITION_FORMAT", "webp")
+
+
+def _source_name(user):
+    return user.avatar.name if user.avatar else ""
+
+
+def is_current(user):
+    """avatar_renditions 是否对应当前头像"""
+    renditions = user.avatar_renditions or {}
+    return bool(_source_name(user)) and renditions.get("source") == _source_name(user)
+
+
+def needs_processing(user):
+    name = _source_name(user)
+    return bool(name) and name != DEFAULT_AVATAR and not is_current(user)
+
+
+def avatar_url(user, size=None):
+    """返回头像完整地址：优先取不小于 size 的最小版本，其次原图，最后默认头像"""
+    if not user.avatar:
+        return f"{URL_PREFIX}{settings.MEDIA_URL}{DEFAULT_AVATAR}"
+    if size and is_current(user):
+        sizes = {int(key): path for key, path in user.avatar_renditions.get("sizes", {}).items()}
+        if sizes:
+            fitting = [key for key in sizes if key >= size]
+            path = sizes[min(fitting) if fitting else max(sizes)]
+            return f"{URL_PREFIX}{default_storage.url(path)}"
+    return f"{URL_PREFIX}{user.avatar.url}"
+
+
+def _stored_paths(renditions):
+    return set((renditions or {}).get("sizes", {}).values())
+
+
+def build_renditions(user_id, source_name, file):
+    """
+    读取原图，生成并保存各尺寸的正方形版本，返回 avatar_renditions 数据
+    文件名带本次生成的版本号，不覆盖仍在引用的旧文件；旧文件由 process() 在 UPDATE 成功后删除
+    """
+    image, _ = images.open_image(file)
+    square = images.center_crop_square(image)
+    fmt = rendition_format()
+    spec = images.FORMATS[fmt]
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    quality = getattr(settings, "AVATAR_RENDITION_QUALITY", 85)
+    version = uuid.uuid4().hex[:8]
+    sizes = {}
+    for size in rendition_sizes():
+        path = f"{RENDITION_DIR}/{user_id}/{stem}-{version}-{size}.{spec['ext']}"
+        content = images.encode(images.resize_square(square, size), fmt, quality)
+        sizes[str(size)] = default_storage.save(path, ContentFile(content))
+    return {"source": source_name, "format": fmt, "sizes": sizes}
+
+
+def process(user_id):
+    """
+    为用户当前头像生成多尺寸版本并原子替换；已是最新或使用默认头像时跳过
+    返回 True 表示生成了新版本
+    """
+    user = User.objects.only("id", "avatar", "avatar_renditions").filter(pk=user_id).first()
+    if user is None or not needs_processing(user):
+        return False
+
+    source_name = user.avatar.name
+    with default_storage.open(source_name, "rb") as file:
+        renditions = build_renditions(user.pk, source_name, file)
+
+    # 只有头像仍是本次处理的原图时才替换（处理期间又换了头像则丢弃本次结果）
+    updated = User.objects.filter(pk=user.pk, avatar=source_name).update(avatar_renditions=renditions)
+    stale = _stored_paths(user.avatar_renditions) - _stored_paths(renditions) if updated else _stored_paths(renditions)
+    for path in stale:
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning("删除过期头像版本失败：%s", path)
+    return bool(updated)
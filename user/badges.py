@@ -0,0 +1,248 @@
+# user/badges.py
+"""
+角标计数：未读消息数（unread）与待处理好友申请数（requests）
+
+- 客户端频繁轮询 /chat/unread-count/、/chat/pending-request-count/：读取直接从计数存储取值（O(1)），
+  不再对 ChatMessage / Friend 执行 COUNT(*)；存储中没有值时（冷启动、过期、被淘汰）按数据库计数一次并写回
+- 写：发消息 +1、标记已读 -n（user/conversations.py），收到申请 +1、同意/拒绝/取消 -1（Friend 信号）；
+  增量在事务提交后才写入存储，存储中没有该值时跳过（下次读取会重新计数）
+- 自愈：计数存储与数据库不在同一事务中，进程崩溃、并发的“读时计数”与增量交错都可能产生偏差；
+  定时任务 recount_badges 对最近活跃的用户分组重算后覆盖写回，缓存存储另有过期时间兜底
+- 存储可替换：USER_BADGE_STORE 指定实现类，内置 MemoryBadgeStore（进程内）、CacheBadgeStore（Django 缓存，默认）
+  与 SQLiteBadgeStore（单机文件，多进程共享，作为本地的 Redis 替身）；接入 Redis 时按 BadgeStore 的接口实现即可
+- CacheBadgeStore 只在默认缓存为跨进程共享的后端（Redis / Memcached 等）时启用：默认缓存是进程内的
+  LocMemCache / DummyCache 时，各 worker 的计数互不可见、增量会丢失，读取退回每次按数据库计数
+"""
+import os
+import sqlite3
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ChatMessage, Friend, User
+
+UNREAD = 'unread'
+REQUESTS = 'requests'
+NAMES = (UNREAD, REQUESTS)
+
+
+def ttl():
+    return getattr(settings, 'USER_BADGE_TTL', 24 * 3600)
+
+
+class BadgeStore:
+    """角标计数存储接口；键为 (user_id, name)，值为非负整数"""
+    # 为 False 时不读写存储，角标每次按数据库计数
+    enabled = True
+
+    def get(self, user_id, name):
+        """返回计数，不存在时返回 None"""
+        raise NotImplementedError
+
+    def set_many(self, values):
+        """values：{(user_id, name): 计数}，覆盖写入"""
+        raise NotImplementedError
+
+    def incr(self, user_id, name, delta):
+        """在已有计数上加 delta（结果不低于 0）；计数不存在时什么也不做"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBadgeStore(BadgeStore):
+    """进程内存储：单进程开发/测试用，多 worker 部署时各进程的计数互不可见"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, name):
+        return self._values.get((user_id, name))
+
+    def set_many(self, values):
+        with self._lock:
+            self._values.update(values)
+
+    def incr(self, user_id, name, delta):
+        with self._lock:
+            key = (user_id, name)
+            if key in self._values:
+                self._values[key] = max(self._values[key] + delta, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class CacheBadgeStore(BadgeStore):
+    """Django 缓存存储：cache.incr/decr 原子更新，键带过期时间（USER_BADGE_TTL）"""
+    KEY = 'user:badge:{user_id}:{name}'
+
+    @property
+    def enabled(self):
+        return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+    def _key(self, user_id, name):
+        return self.KEY.format(user_id=user_id, name=name)
+
+    def get(self, user_id, name):
+        return cache.get(self._key(user_id, name))
+
+    def set_many(self, values):
+        cache.set_many({self._key(*key): value for key, value in values.items()}, timeout=ttl())
+
+    def incr(self, user_id, name, delta):
+        key = self._key(user_id, name)
+        try:
+            value = cache.incr(key, delta)
+        except ValueError:
+            # 键不存在（未读取过或已过期）
+            return
+        if value < 0:
+            # 扣成负数说明已经偏差，删除后由下次读取重新计数
+            cache.delete(key)
+
+    def clear(self):
+        # 只用于测试；缓存中的角标键无法按前缀删除，整个缓存一并清空
+        cache.clear()
+
+
+class SQLiteBadgeStore(BadgeStore):
+    """单机文件存储（本地的 Redis 替身）：同一台机器上的多个 worker 共享计数，UPDATE 原子累加"""
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS badges ("
+        " user_id INTEGER NOT NULL, name TEXT NOT NULL, value INTEGER NOT NULL,"
+        " PRIMARY KEY (user_id, name)) WITHOUT ROWID",
+    )
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'USER_BADGE_PATH', os.path.join(settings.BASE_DIR, 'badges.sqlite3'))
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id, name):
+        row = self.conn.execute(
+            "SELECT value FROM badges WHERE user_id = ? AND name = ?", (user_id, name)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_many(self, values):
+        with self.conn as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO badges (user_id, name, value) VALUES (?, ?, ?)",
+                [(user_id, name, value) for (user_id, name), value in values.items()],
+            )
+
+    def incr(self, user_id, name, delta):
+        with self.conn as conn:
+            conn.execute(
+                "UPDATE badges SET value = MAX(value + ?, 0) WHERE user_id = ? AND name = ?", (delta, user_id, name)
+            )
+
+    def clear(self):
+        with self.conn as conn:
+            conn.execute("DELETE FROM badges")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """按 USER_BADGE_STORE 返回（并缓存）存储实例"""
+    path = getattr(settings, 'USER_BADGE_STORE', 'user.badges.CacheBadgeStore')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_string(path)()
+        return _stores[path]
+
+
+# ---------- 数据库计数 ----------
+def _querysets():
+    return {
+        UNREAD: (ChatMessage.objects.filter(is_read=False), 'receiver_id'),
+        REQUESTS: (Friend.objects.filter(is_approved=False), 'friend_id'),
+    }
+
+
+def count(user_id, name):
+    """按数据库计数（走 chat_unread_idx / friend_friend_approved_idx）"""
+    queryset, field = _querysets()[name]
+    return queryset.filter(**{field: user_id}).count()
+
+
+def compute(user_ids):
+    """一批用户的全部角标：每种计数一条分组查询，返回 {(user_id, name): 计数}"""
+    user_ids = list(user_ids)
+    values = {(user_id, name): 0 for user_id in user_ids for name in NAMES}
+    for name, (queryset, field) in _querysets().items():
+        rows = queryset.filter(**{f'{field}__in': user_ids}).order_by().values_list(field).annotate(total=Count('id'))
+        for user_id, total in rows:
+            values[(user_id, name)] = total
+    return values
+
+
+# ---------- 读写 ----------
+def get(user_id, name):
+    store = get_store()
+    if not store.enabled:
+        return count(user_id, name)
+    value = store.get(user_id, name)
+    if value is None:
+        value = count(user_id, name)
+        store.set_many({(user_id, name): value})
+    return value
+
+
+def incr(user_id, name, delta=1):
+    """事务提交后给用户的角标加上 delta（可为负数）"""
+    if not delta or not get_store().enabled:
+        return
+    transaction.on_commit(lambda: get_store().incr(user_id, name, delta))
+
+
+def recount(user_ids):
+    """按数据库重算一批用户的角标并覆盖写回，返回写入的用户数"""
+    user_ids = list(user_ids)
+    if user_ids and get_store().enabled:
+        get_store().set_many(compute(user_ids))
+    return len(user_ids)
+
+
+def recount_active(minutes=None, batch_size=None):
+    """重算最近 minutes 分钟内活跃（在轮询角标）的用户，返回重算的用户数"""
+    minutes = minutes or getattr(settings, 'USER_BADGE_RECOUNT_ACTIVE_MINUTES', 30)
+    batch_size = batch_size or getattr(settings, 'USER_BADGE_RECOUNT_BATCH_SIZE', 1000)
+    since = timezone.now() - timedelta(minutes=minutes)
+    user_ids = User.objects.filter(last_active__gte=since).order_by().values_list('id', flat=True)
+    total, batch = 0, []
+    for user_id in user_ids.iterator(chunk_size=batch_size):
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            total += recount(batch)
+            batch = []
+    return total + recount(batch)
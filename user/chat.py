@@ -0,0 +1,57 @@
+# user/chat.py
+"""
+聊天记录分页
+
+- 两人的消息按会话标识 conversation 聚在一起，翻页走 (conversation, send_time, id) 索引的一次范围扫描
+- 游标就是消息 id：before_id 取该消息之前（更早）的一页，after_id 取之后（更新）的一页，都不传取最新一页；
+  游标消息的 send_time 由子查询取得，每页始终只有一条 SQL，与会话长度、翻页深度无关
+- 游标消息不属于该会话时返回空页
+- 用 values() 取出字典直接输出，不实例化模型；发送者昵称由调用方传入（会话只有两个参与者），不再关联用户表
+"""
+from django.conf import settings
+from django.db.models import Q, Subquery
+
+from .models import ChatMessage, conversation_key
+
+HISTORY_FIELDS = ('id', 'sender_id', 'receiver_id', 'content', 'send_time', 'is_read')
+
+
+def page_size(requested=None):
+    default = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 30)
+    try:
+        size = int(requested) if requested not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, getattr(settings, 'CHAT_HISTORY_MAX_PAGE_SIZE', 100)))
+
+
+def history(user_id, friend_id, before_id=None, after_id=None, limit=None):
+    """
+    返回 (messages, has_more)，messages 按时间升序；
+    has_more 表示请求方向上（before_id / 最新一页为更早，after_id 为更新）还有消息
+    """
+    limit = page_size(limit)
+    messages = ChatMessage.objects.filter(conversation=conversation_key(user_id, friend_id))
+    anchor_id = after_id if after_id is not None else before_id
+    newer = after_id is not None
+    if anchor_id is not None:
+        anchor_time = Subquery(messages.filter(pk=anchor_id).values('send_time')[:1])
+        op = 'gt' if newer else 'lt'
+        messages = messages.filter(
+            Q(**{f'send_time__{op}': anchor_time}) | Q(send_time=anchor_time, **{f'id__{op}': anchor_id})
+        )
+    ordering = ('send_time', 'id') if newer else ('-send_time', '-id')
+    rows = list(messages.order_by(*ordering).values(*HISTORY_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not newer:
+        rows.reverse()
+    return rows, has_more
+
+
+def serialize(rows, names):
+    """names：{用户 id: 用户名}，即会话双方"""
+    for row in rows:
+        row['sender_name'] = names.get(row['sender_id'], '')
+        row['send_time'] = row['send_time'].strftime('%Y-%m-%d %H:%M:%S')
+    return rows
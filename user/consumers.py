@@ -1,12 +1,81 @@
 import json
+from urllib.parse import parse_qs
 from django.db.models import Q  # 直接导入Q，避免依赖本地models
+from asgiref.sync import async_to_sync
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.exceptions import TokenError
 # 导入模型（确保路径正确，适配你的项目结构）
 from .models import User, ChatMessage, Friend
+from . import conversations, writebehind
+
+
+# ---------------------- 两种连接共用 ----------------------
+def user_group(user_id):
+    """个人频道组：该用户的所有 ws/chat/ 连接（多端/多标签页）"""
+    return f"chat_user_{user_id}"
+
+
+def room_group(user_id, friend_id):
+    """两人房间组：旧的 ws/chat/<friend_id>/ 连接（用户ID升序拼接，A-B 与 B-A 相同）"""
+    return f"chat_group_chat_{min(user_id, friend_id)}_{max(user_id, friend_id)}"
+
+
+def token_from_scope(scope):
+    """前端通过 query 参数传递 Token：?token=xxx"""
+    values = parse_qs(scope['query_string'].decode()).get('token')
+    return values[0] if values else ''
+
+
+@database_sync_to_async
+def is_friend(user_id, friend_id):
+    # 双向好友条件：A是B的好友 或 B是A的好友，且都已通过
+    return Friend.objects.filter(
+        Q(user_id=user_id, friend_id=friend_id, is_approved=True) |
+        Q(friend_id=user_id, user_id=friend_id, is_approved=True)
+    ).exists()
+
+
+async def save_message(user, friend_id, content):
+    """保存一条消息，返回推送给前端的消息格式"""
+    if writebehind.enabled():
+        # 写后模式：雪花 id + 本地日志，立即广播，由缓冲按批落库
+        entry = await writebehind.submit(user.id, friend_id, content)
+        message_id, send_time = entry['id'], entry['send_time']
+    else:
+        # 同一事务中更新会话的最后一条消息与对方未读数
+        chat_message = await database_sync_to_async(conversations.send)(user, friend_id, content)
+        message_id, send_time = chat_message.id, chat_message.send_time
+    return {
+        'id': message_id,  # 消息ID（前端可用于去重）
+        'sender_id': user.id,
+        'sender_name': user.username,
+        'receiver_id': friend_id,
+        'content': content,
+        'send_time': send_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'is_read': False
+    }
+
+
+async def broadcast(channel_layer, message):
+    """推送给双方的个人频道组（ws/chat/），以及两人房间组（旧的 ws/chat/<friend_id>/ 连接）"""
+    sender_id, receiver_id = message['sender_id'], message['receiver_id']
+    event = {'type': 'user_message', 'message': message}
+    await channel_layer.group_send(user_group(receiver_id), event)
+    await channel_layer.group_send(user_group(sender_id), event)
+    await channel_layer.group_send(room_group(sender_id, receiver_id), {'type': 'chat_message', 'message': message})
+
+
+def notify_unfriended(user_id, friend_id):
+    """好友关系解除（删除或取消通过）：通知双方的个人频道组，清掉连接上缓存的好友校验与订阅（同步代码中调用）"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for owner, other in ((user_id, friend_id), (friend_id, user_id)):
+        async_to_sync(channel_layer.group_send)(user_group(owner), {'type': 'friend_removed', 'friend_id': other})
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -34,7 +103,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # 3. 验证Token并获取当前用户
             try:
                 access_token = AccessToken(token)
-                self.user_id = access_token['user_id']
+                self.user_id = int(access_token['user_id'])  # 新版 simplejwt 中为字符串
                 print(f"[WebSocket] Token解析成功，用户ID：{self.user_id}")
                 self.user = await database_sync_to_async(User.objects.get)(id=self.user_id)
             except TokenError:  # 捕获所有 Token 相关错误（无效、过期、格式错误）
@@ -48,12 +117,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             # 4. 验证双向好友关系（必须已通过）
             try:
-                is_friend = await database_sync_to_async(Friend.objects.filter(
-                    # 双向好友条件：A是B的好友 或 B是A的好友，且都已通过
-                    (Q(user=self.user, friend_id=self.friend_id, is_approved=True) |
-                     Q(friend=self.user, user_id=self.friend_id, is_approved=True))
-                ).exists)()
-                if not is_friend:
+                if not await is_friend(self.user_id, self.friend_id):
                     print(f"[WebSocket] 错误：用户 {self.user_id} 与 {self.friend_id} 不是双向好友（或未通过）")
                     await self.close(code=1013)
                     return
@@ -64,8 +128,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return
 
             # 5. 创建唯一聊天房间（用户ID升序拼接，确保A-B和B-A是同一个房间）
-            self.room_name = f"chat_{min(self.user_id, self.friend_id)}_{max(self.user_id, self.friend_id)}"
-            self.room_group_name = f"chat_group_{self.room_name}"
+            self.room_group_name = room_group(self.user_id, self.friend_id)
             print(f"[WebSocket] 加入聊天房间：{self.room_group_name}")
 
             # 6. 加入房间并同意连接
@@ -104,34 +167,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 print(f"[WebSocket] 忽略空消息 - 用户 {self.user_id}")
                 return
 
-            # 1. 异步保存消息到数据库
-            chat_message = await database_sync_to_async(ChatMessage.objects.create)(
-                sender=self.user,
-                receiver_id=self.friend_id,
-                content=content,
-                is_read=False
-            )
-            print(f"[WebSocket] 消息保存成功 - 消息ID：{chat_message.id}")
-
-            # 2. 构造前端需要的消息格式（时间格式化、字段完整）
-            message_data = {
-                'id': chat_message.id,  # 消息ID（前端可用于去重）
-                'sender_id': self.user_id,
-                'sender_name': self.user.username,
-                'receiver_id': self.friend_id,
-                'content': content,
-                'send_time': chat_message.send_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'is_read': False
-            }
-
-            # 3. 广播消息到房间（所有在线用户都会收到）
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',  # 对应下方 chat_message 方法
-                    'message': message_data
-                }
-            )
+            # 1. 保存消息（写后模式下只写缓冲），构造前端需要的消息格式
+            message_data = await save_message(self.user, self.friend_id, content)
+            print(f"[WebSocket] 消息保存成功 - 消息ID：{message_data['id']}")
+
+            # 2. 广播消息到房间（对应下方 chat_message 方法），同时推送给双方 ws/chat/ 连接
+            await broadcast(self.channel_layer, message_data)
             print(f"[WebSocket] 消息广播成功 - 房间 {self.room_group_name}")
 
         except Exception as e:
@@ -147,4 +188,137 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }))
             print(f"[WebSocket] 推送消息给用户 {self.user_id}：{message['content']}")
         except Exception as e:
-            print(f"[WebSocket] 推送消息异常 - {str(e)}")
\ No newline at end of file
+            print(f"[WebSocket] 推送消息异常 - {str(e)}")
+
+class UserChatConsumer(AsyncWebsocketConsumer):
+    """
+    每个用户一条 WebSocket（ws/chat/?token=xxx），替代“每个好友一条”的 ws/chat/<friend_id>/
+
+    - 建连时只解析一次 Token、查一次用户，加入个人频道组 chat_user_<用户ID>；同一用户的多个连接都在组内
+    - 帧按 friend_id 寻址，好友关系在每条连接上只校验一次（订阅或首次发消息时），之后不再查库
+    - 已订阅（正在查看）的会话推送完整消息 new_message，其余会话只推送轻量的 notify，前端据此更新角标/列表
+
+    客户端 → 服务端：
+        {"type": "subscribe", "friend_id": 2}
+        {"type": "unsubscribe", "friend_id": 2}
+        {"type": "message", "friend_id": 2, "content": "你好"}
+    服务端 → 客户端：
+        {"type": "subscribed" / "unsubscribed", "friend_id": 2}
+        {"type": "new_message", "friend_id": 2, "message": {...}}  # 格式同 ws/chat/<friend_id>/
+        {"type": "notify", "friend_id": 2, "message_id": 1, "preview": "你好"}
+        {"type": "error", "friend_id": 2, "message": "不是好友"}
+    自己发出的消息同样经个人频道组回推（new_message / notify），多端之间保持同步
+    """
+
+    async def connect(self):
+        """建立连接：验证用户身份 + 加入个人频道组"""
+        self.user = None
+        self.friends = set()  # 已校验过好友关系的好友ID
+        self.subscriptions = set()  # 已订阅（完整推送）的好友ID
+        try:
+            token = token_from_scope(self.scope)
+            if not token:
+                print(f"[WebSocket] 错误：Token为空")
+                await self.close(code=1013)
+                return
+            try:
+                self.user_id = int(AccessToken(token)['user_id'])
+                self.user = await database_sync_to_async(User.objects.get)(id=self.user_id)
+            except TokenError:
+                print(f"[WebSocket] 错误：Token无效或已过期")
+                await self.close(code=1013)
+                return
+            except User.DoesNotExist:
+                print(f"[WebSocket] 错误：用户ID {self.user_id} 不存在")
+                await self.close(code=1013)
+                return
+
+            self.group_name = user_group(self.user_id)
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.accept()
+            print(f"[WebSocket] 连接成功！用户 {self.user_id} 已加入 {self.group_name}")
+        except Exception as e:
+            print(f"[WebSocket] 连接总异常 - {str(e)}")
+            await self.close(code=1006)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        print(f"[WebSocket] 断开连接 - 用户 {getattr(self, 'user_id', '未知')}，关闭码：{close_code}")
+
+    async def send_json(self, data):
+        await self.send(text_data=json.dumps(data))
+
+    async def check_friend(self, friend_id):
+        """好友关系在本连接上只查一次库；解除好友时由 friend_removed 清掉"""
+        if friend_id in self.friends:
+            return True
+        if friend_id != self.user_id and await is_friend(self.user_id, friend_id):
+            self.friends.add(friend_id)
+            return True
+        return False
+
+    async def receive(self, text_data):
+        """按 type 分发客户端帧"""
+        friend_id = None
+        try:
+            data = json.loads(text_data)
+            frame_type = data.get('type')
+            try:
+                friend_id = int(data.get('friend_id'))
+            except (TypeError, ValueError):
+                await self.send_json({'type': 'error', 'friend_id': None, 'message': '缺少好友ID'})
+                return
+
+            if frame_type == 'unsubscribe':
+                self.subscriptions.discard(friend_id)
+                await self.send_json({'type': 'unsubscribed', 'friend_id': friend_id})
+                return
+            if frame_type not in ('subscribe', 'message'):
+                await self.send_json({'type': 'error', 'friend_id': friend_id, 'message': '未知的消息类型'})
+                return
+            if not await self.check_friend(friend_id):
+                print(f"[WebSocket] 错误：用户 {self.user_id} 与 {friend_id} 不是双向好友（或未通过）")
+                await self.send_json({'type': 'error', 'friend_id': friend_id, 'message': '不是好友'})
+                return
+
+            if frame_type == 'subscribe':
+                self.subscriptions.add(friend_id)
+                await self.send_json({'type': 'subscribed', 'friend_id': friend_id})
+                return
+
+            content = (data.get('content') or '').strip()
+            if not content:
+                print(f"[WebSocket] 忽略空消息 - 用户 {self.user_id}")
+                return
+            message_data = await save_message(self.user, friend_id, content)
+            await broadcast(self.channel_layer, message_data)
+            print(f"[WebSocket] 消息广播成功 - 用户 {self.user_id} → {friend_id}，消息ID：{message_data['id']}")
+        except Exception as e:
+            print(f"[WebSocket] 接收消息异常 - {str(e)}")
+            await self.send_json({'type': 'error', 'friend_id': friend_id, 'message': '消息处理失败'})
+
+    async def friend_removed(self, event):
+        """好友关系已解除：之后的订阅 / 发消息重新查库，已订阅的会话通知前端取消"""
+        friend_id = event['friend_id']
+        self.friends.discard(friend_id)
+        if friend_id in self.subscriptions:
+            self.subscriptions.discard(friend_id)
+            await self.send_json({'type': 'unsubscribed', 'friend_id': friend_id})
+
+    async def user_message(self, event):
+        """个人频道组的消息：按会话是否已订阅推送完整消息或提示"""
+        message = event['message']
+        friend_id = message['receiver_id'] if message['sender_id'] == self.user_id else message['sender_id']
+        try:
+            if friend_id in self.subscriptions:
+                await self.send_json({'type': 'new_message', 'friend_id': friend_id, 'message': message})
+            else:
+                await self.send_json({
+                    'type': 'notify',
+                    'friend_id': friend_id,
+                    'message_id': message['id'],
+                    'preview': conversations.preview(message['content']),
+                })
+        except Exception as e:
+            print(f"[WebSocket] 推送消息异常 - {str(e)}")
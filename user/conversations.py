@@ -0,0 +1,108 @@
+# user/conversations.py
+"""
+会话表（Conversation）的维护
+
+- 每对用户一行：最后一条消息 id / 预览 / 时间，以及双方各自的未读数
+- 写消息：send() 在同一事务中插入消息并更新会话；批量写入（ChatMessage.objects.bulk_create）同样经过
+  record_messages()，按会话合并后每个会话只执行一条 UPDATE（不存在时创建）
+- 最后一条消息只在更新的消息到达时替换（WHERE 条件写在 CASE 中），乱序写入不会把预览改旧
+- 标记已读：mark_read() 先清零会话上自己一侧的未读数（同时锁住会话行），再把消息置为已读；
+  与并发发送的消息按会话行串行，不会出现“消息未读但计数已清零”
+- 同时维护接收者的未读角标（user/badges.py）：写消息 +n，标记已读 -n
+- 好友列表按 (user_low, user_high) 唯一索引取会话字段，一条 SQL 返回全部好友
+"""
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import badges, writebehind
+from .models import ChatMessage, Conversation
+
+PREVIEW_LENGTH = Conversation._meta.get_field('last_message_preview').max_length
+
+
+def pair(user_id, other_id):
+    """(id 较小的一方, id 较大的一方)"""
+    low, high = sorted((int(user_id), int(other_id)))
+    return low, high
+
+
+def unread_field(user_id, low_id):
+    """user_id 一侧的未读数字段"""
+    return 'unread_low' if int(user_id) == low_id else 'unread_high'
+
+
+def preview(content):
+    return (content or '')[:PREVIEW_LENGTH]
+
+
+def send(sender, receiver_id, content):
+    """写入一条消息并更新会话（同一事务），返回消息"""
+    with transaction.atomic():
+        message = ChatMessage.objects.create(
+            # 写后模式下同步写入也使用雪花 id（见 user/writebehind.py）
+            id=writebehind.next_id() if writebehind.enabled() else None,
+            sender=sender, receiver_id=receiver_id, content=content, is_read=False,
+        )
+        record_messages([message])
+    return message
+
+
+def record_messages(messages):
+    """消息已写入后（调用方事务内）更新所属会话：每个会话一条 UPDATE"""
+    groups, unread = {}, {}
+    for message in messages:
+        low, high = pair(message.sender_id, message.receiver_id)
+        group = groups.setdefault((low, high), {'last': None, 'unread_low': 0, 'unread_high': 0})
+        last = group['last']
+        if last is None or (message.send_time, message.pk or 0) >= (last.send_time, last.pk or 0):
+            group['last'] = message
+        if not message.is_read:
+            group[unread_field(message.receiver_id, low)] += 1
+            unread[message.receiver_id] = unread.get(message.receiver_id, 0) + 1
+    for (low, high), group in groups.items():
+        _apply(low, high, group['last'], group['unread_low'], group['unread_high'])
+    for receiver_id, total in unread.items():
+        badges.incr(receiver_id, badges.UNREAD, total)
+
+
+def _apply(low, high, last, unread_low, unread_high):
+    newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=last.send_time)
+
+    def latest(field, value, output_field):
+        return Case(When(newer, then=Value(value)), default=F(field), output_field=output_field)
+
+    values = {
+        'last_message_id': latest('last_message_id', last.pk, models.BigIntegerField()),
+        'last_message_preview': latest('last_message_preview', preview(last.content), models.CharField()),
+        'last_message_at': latest('last_message_at', last.send_time, models.DateTimeField()),
+        'updated_at': timezone.now(),
+    }
+    for field, amount in (('unread_low', unread_low), ('unread_high', unread_high)):
+        if amount:
+            values[field] = F(field) + amount
+    conversations = Conversation.objects.filter(user_low_id=low, user_high_id=high)
+    if conversations.update(**values):
+        return
+    try:
+        with transaction.atomic():
+            Conversation.objects.create(
+                user_low_id=low, user_high_id=high, last_message_id=last.pk,
+                last_message_preview=preview(last.content), last_message_at=last.send_time,
+                unread_low=unread_low, unread_high=unread_high,
+            )
+    except IntegrityError:
+        # 并发的第一条消息已创建会话
+        conversations.update(**values)
+
+
+def mark_read(user_id, friend_id):
+    """把 friend_id 发给 user_id 的消息全部标记为已读，返回标记的条数"""
+    low, high = pair(user_id, friend_id)
+    with transaction.atomic():
+        Conversation.objects.filter(user_low_id=low, user_high_id=high).update(
+            **{unread_field(user_id, low): 0}, updated_at=timezone.now()
+        )
+        marked = ChatMessage.objects.filter(sender_id=friend_id, receiver_id=user_id, is_read=False).update(is_read=True)
+        badges.incr(int(user_id), badges.UNREAD, -marked)
+    return marked
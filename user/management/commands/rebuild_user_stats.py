@@ -0,0 +1,31 @@
+# user/management/commands/rebuild_user_stats.py
+"""
+按明细表分批重算所有用户的统计（UserStats）：首次上线回填，或统计出现偏差后修复
+
+按主键分批读取用户 id，每批用固定条数的分组聚合查询算出真实值后批量写回
+
+用法：python manage.py rebuild_user_stats [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from user import stats
+from user.models import User
+
+
+class Command(BaseCommand):
+    help = "重算用户统计（博客数、获赞/评论/转发数、浏览量）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的用户数')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk, rebuilt = 0, 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            rebuilt += stats.rebuild(batch)
+        self.stdout.write(self.style.SUCCESS(f"用户统计重算完成：共 {rebuilt} 位用户"))
@@ -0,0 +1,22 @@
+# user/management/commands/replay_chat_journal.py
+"""
+回放聊天写后日志（CHAT_WRITE_BEHIND_JOURNAL_DIR）：把未落库的消息写入数据库后删除日志文件
+
+服务停止后执行；写入按消息 id 去重，已落库的消息不会重复写入
+
+用法：python manage.py replay_chat_journal [--dir 日志目录]
+"""
+from django.core.management.base import BaseCommand
+
+from user import writebehind
+
+
+class Command(BaseCommand):
+    help = "回放聊天写后日志中尚未落库的消息"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='日志目录（默认 CHAT_WRITE_BEHIND_JOURNAL_DIR）')
+
+    def handle(self, *args, **options):
+        files, written = writebehind.replay(options['dir'])
+        self.stdout.write(self.style.SUCCESS(f"回放 {files} 个日志文件，写入 {written} 条消息"))
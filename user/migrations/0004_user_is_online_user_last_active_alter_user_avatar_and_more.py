@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_user_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_online',
+            field=models.BooleanField(default=False, verbose_name='是否在线'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='last_active',
+            field=models.DateTimeField(auto_now=True, verbose_name='最后活跃时间'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, default='avatars/default.png', help_text='支持 JPG、PNG 格式，建议尺寸 200x200px', null=True, upload_to='avatars/%Y/%m/%d/', verbose_name='用户头像'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='bio',
+            field=models.TextField(blank=True, help_text='一句话介绍自己，最多 500 字', max_length=500, null=True, verbose_name='个人简介'),
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField()),
+                ('send_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_read', models.BooleanField(default=False)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_messages', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '聊天消息',
+                'verbose_name_plural': '聊天消息',
+                'ordering': ['send_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Friend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_approved', models.BooleanField(default=False)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_friend_requests', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_friend_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '好友关系',
+                'verbose_name_plural': '好友关系',
+                'unique_together': {('user', 'friend')},
+            },
+        ),
+    ]
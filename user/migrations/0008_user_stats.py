@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('blog_count', models.PositiveIntegerField(default=0, verbose_name='博客数')),
+                ('published_count', models.PositiveIntegerField(default=0, verbose_name='已发布博客数')),
+                ('likes_received', models.PositiveIntegerField(default=0, verbose_name='获赞数')),
+                ('comments_received', models.PositiveIntegerField(default=0, verbose_name='收到评论数')),
+                ('shares_received', models.PositiveIntegerField(default=0, verbose_name='被转发数')),
+                ('view_count', models.PositiveBigIntegerField(default=0, verbose_name='总浏览量')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '用户统计',
+                'verbose_name_plural': '用户统计',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+def fill_conversations(apps, schema_editor):
+    # 按 (发送者, 接收者) 分组回填，每组一条 UPDATE，走 chat_pair_time_idx
+    ChatMessage = apps.get_model('user', 'ChatMessage')
+    pairs = ChatMessage.objects.order_by().values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in list(pairs):
+        low, high = sorted((sender_id, receiver_id))
+        ChatMessage.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(conversation=f"{low}_{high}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.CharField(default='', editable=False, max_length=41, verbose_name='会话'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', 'send_time', 'id'], name='chat_conversation_time_idx'),
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+    ]
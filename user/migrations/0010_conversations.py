@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_conversations(apps, schema_editor):
+    # 每个会话取最后一条消息；未读数按 (会话, 接收者) 一次分组统计
+    ChatMessage = apps.get_model('user', 'ChatMessage')
+    Conversation = apps.get_model('user', 'Conversation')
+    unread = {
+        (key, receiver_id): total
+        for key, receiver_id, total in ChatMessage.objects.filter(is_read=False).order_by()
+        .values_list('conversation', 'receiver_id').annotate(total=Count('id'))
+    }
+    rows = []
+    for key in ChatMessage.objects.order_by().values_list('conversation', flat=True).distinct():
+        last = ChatMessage.objects.filter(conversation=key).order_by('-send_time', '-id').first()
+        low, high = sorted((last.sender_id, last.receiver_id))
+        rows.append(Conversation(
+            user_low_id=low, user_high_id=high, last_message_id=last.id,
+            last_message_preview=last.content[:100], last_message_at=last.send_time,
+            unread_low=unread.get((key, low), 0), unread_high=unread.get((key, high), 0),
+        ))
+        if len(rows) >= 1000:
+            Conversation.objects.bulk_create(rows)
+            rows = []
+    Conversation.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_chat_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=100, verbose_name='最后一条消息预览')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True, verbose_name='最后一条消息时间')),
+                ('unread_low', models.PositiveIntegerField(default=0, verbose_name='user_low 的未读数')),
+                ('unread_high', models.PositiveIntegerField(default=0, verbose_name='user_high 的未读数')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='user.chatmessage', verbose_name='最后一条消息')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='用户（id 较大）')),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='用户（id 较小）')),
+            ],
+            options={
+                'verbose_name': '会话',
+                'verbose_name_plural': '会话',
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='conversation_pair_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_conversations, migrations.RunPython.noop),
+    ]
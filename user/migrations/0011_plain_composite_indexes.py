@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_conversations'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_receiver_read_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_unread_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['receiver', 'is_read', 'sender'], name='chat_unread_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import os
+import uuid
+
 import pytz
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -30,6 +34,8 @@ class User(AbstractUser):
         verbose_name=_("用户头像"),
         help_text=_("支持 JPG、PNG 格式，建议尺寸 200x200px")
     )
+    # 头像正方形多尺寸版本（32/64/128/256px），由 user.avatars 在后台生成
+    avatar_renditions = models.JSONField(default=dict, blank=True, verbose_name=_("头像版本"))
 
     # 扩展字段：个人简介
     bio = models.TextField(
@@ -97,11 +103,37 @@ class Friend(models.Model):
         unique_together = ("user", "friend")  # 避免重复申请（同一人不能多次申请同一用户）
         verbose_name = "好友关系"
         verbose_name_plural = "好友关系"
+        indexes = [
+            # 双向好友查询 Q(user=..)|Q(friend=..) 且 is_approved：两个分支各走一个索引
+            models.Index(fields=["user", "is_approved"], name="friend_user_approved_idx"),
+            # 收到的好友申请：WHERE friend_id AND is_approved ORDER BY created_at DESC
+            models.Index(fields=["friend", "is_approved", "-created_at"], name="friend_friend_approved_idx"),
+        ]
 
     def __str__(self):
         status = "已通过" if self.is_approved else "待审核"
         return f"{self.user.username} → {self.friend.username}（{status}）"
 
+def conversation_key(user_id, other_id):
+    """两人会话的标识：用户 id 升序拼接（A-B 与 B-A 相同，与聊天房间名一致）"""
+    low, high = sorted((int(user_id), int(other_id)))
+    return f"{low}_{high}"
+
+
+class ChatMessageManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create 不调用 save()，在这里补上会话标识，并与会话表（最后一条消息、未读数）在同一事务中更新
+        from .conversations import record_messages
+
+        objs = list(objs)
+        for message in objs:
+            message.fill_conversation()
+        with transaction.atomic():
+            created = super().bulk_create(objs, *args, **kwargs)
+            record_messages(created)
+        return created
+
+
 class ChatMessage(models.Model):
     """聊天消息模型"""
     sender = models.ForeignKey(
@@ -110,15 +142,118 @@ class ChatMessage(models.Model):
     receiver = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="received_messages"  # 关联自定义User
     )
+    # 会话标识（conversation_key），保存时自动填写；历史消息按 (conversation, send_time, id) 翻页
+    conversation = models.CharField(max_length=41, default="", editable=False, verbose_name="会话")
     content = models.TextField()
     send_time = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
 
+    objects = ChatMessageManager()
+
     class Meta:
         ordering = ["send_time"]
         verbose_name = "聊天消息"
         verbose_name_plural = "聊天消息"
+        indexes = [
+            # 聊天记录翻页：WHERE conversation AND (send_time, id) < / > (?, ?) ORDER BY send_time, id LIMIT n
+            models.Index(fields=["conversation", "send_time", "id"], name="chat_conversation_time_idx"),
+            # 两人会话：(sender=A, receiver=B) | (sender=B, receiver=A) ORDER BY send_time
+            models.Index(fields=["sender", "receiver", "send_time"], name="chat_pair_time_idx"),
+            # 未读数：WHERE receiver_id AND is_read；标记已读：WHERE receiver_id AND is_read AND sender_id
+            models.Index(fields=["receiver", "is_read", "sender"], name="chat_unread_idx"),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} → {self.receiver.username}: {self.content[:20]}"
 
+    def fill_conversation(self):
+        if not self.conversation:
+            self.conversation = conversation_key(self.sender_id, self.receiver_id)
+
+    def save(self, *args, **kwargs):
+        self.fill_conversation()
+        super().save(*args, **kwargs)
+
+
+class Conversation(models.Model):
+    """
+    两人会话（每对用户一行，user_low 为 id 较小的一方）：
+    最后一条消息、预览、时间与双方各自的未读数反规范化保存，好友列表不再逐个好友查询聊天记录；
+    由 user/conversations.py 在写消息、标记已读的同一事务中维护
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+", verbose_name="用户（id 较小）")
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+", verbose_name="用户（id 较大）")
+    last_message = models.ForeignKey(
+        ChatMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="最后一条消息"
+    )
+    last_message_preview = models.CharField(max_length=100, blank=True, default="", verbose_name="最后一条消息预览")
+    last_message_at = models.DateTimeField(null=True, blank=True, verbose_name="最后一条消息时间")
+    unread_low = models.PositiveIntegerField(default=0, verbose_name="user_low 的未读数")
+    unread_high = models.PositiveIntegerField(default=0, verbose_name="user_high 的未读数")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "会话"
+        verbose_name_plural = "会话"
+        constraints = [
+            models.UniqueConstraint(fields=["user_low", "user_high"], name="conversation_pair_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_low_id}_{self.user_high_id}：{self.last_message_preview[:20]}"
+
+
+
+class ChunkedUpload(models.Model):
+    """分片上传会话：分片按偏移量顺序追加到磁盘临时文件，完成后供头像/封面上传接口引用"""
+    STATUS_CHOICES = (
+        ('uploading', '上传中'),
+        ('complete', '已完成'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chunked_uploads")
+    filename = models.CharField(max_length=255, verbose_name="原始文件名")
+    size = models.PositiveBigIntegerField(verbose_name="文件总大小")
+    offset = models.PositiveBigIntegerField(default=0, verbose_name="已接收字节数")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "分片上传"
+        verbose_name_plural = "分片上传"
+        indexes = [
+            # 定期清理过期会话：WHERE updated_at < ?
+            models.Index(fields=["updated_at"], name="chunked_upload_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.filename}（{self.offset}/{self.size}）"
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{self.id}.part")
+
+
+class UserStats(models.Model):
+    """
+    用户统计（增量维护，见 user/stats.py）：写博客、点赞/转发/评论、浏览量合并时同步累加，
+    /userinfo/ 按主键一次读取；偏差可用 rebuild_user_stats 命令重算
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats", verbose_name="用户"
+    )
+    blog_count = models.PositiveIntegerField(default=0, verbose_name="博客数")
+    published_count = models.PositiveIntegerField(default=0, verbose_name="已发布博客数")
+    likes_received = models.PositiveIntegerField(default=0, verbose_name="获赞数")
+    comments_received = models.PositiveIntegerField(default=0, verbose_name="收到评论数")
+    shares_received = models.PositiveIntegerField(default=0, verbose_name="被转发数")
+    view_count = models.PositiveBigIntegerField(default=0, verbose_name="总浏览量")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "用户统计"
+        verbose_name_plural = "用户统计"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.blog_count} 篇 / {self.likes_received} 赞"
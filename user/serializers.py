@@ -11,6 +11,8 @@ from django.contrib.auth import authenticate
 
 from weblog import settings
 from .models import User, Friend, ChatMessage
+from . import stats as user_stats
+from .avatars import avatar_url, SIZE_LIST, SIZE_MESSAGE
 
 
 # ===================== 基础序列化器（登录/注册） =====================
@@ -78,12 +80,14 @@ class RegisterSerializer(serializers.ModelSerializer):
 
 # ===================== 用户信息序列化器 =====================
 class UserInfoSerializer(serializers.ModelSerializer):
-    """用户信息序列化器：包含基础信息+统计字段"""
+    """用户信息序列化器：包含基础信息+统计字段（统计读自增量维护的 UserStats，一次主键查询）"""
     create_time = serializers.DateTimeField(source='date_joined', read_only=True)
     last_login_time = serializers.DateTimeField(source='last_login', read_only=True)
     article_count = serializers.SerializerMethodField(read_only=True)
+    published_count = serializers.SerializerMethodField(read_only=True)
     like_count = serializers.SerializerMethodField(read_only=True)
     comment_count = serializers.SerializerMethodField(read_only=True)
+    share_count = serializers.SerializerMethodField(read_only=True)
     view_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -91,22 +95,33 @@ class UserInfoSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'username', 'email', 'bio', 'avatar',
             'create_time', 'last_login_time',
-            'article_count', 'like_count', 'comment_count', 'view_count'
+            'article_count', 'published_count', 'like_count', 'comment_count', 'share_count', 'view_count'
         ]
         read_only_fields = ['id', 'create_time', 'last_login_time']
         extra_kwargs = {'avatar': {'read_only': True}}
 
+    def to_representation(self, instance):
+        self._stats = user_stats.get(instance.pk)
+        return super().to_representation(instance)
+
     def get_article_count(self, obj):
-        return obj.articles.count() if hasattr(obj, 'articles') else 0
+        return self._stats['blog_count']
+
+    def get_published_count(self, obj):
+        return self._stats['published_count']
 
     def get_like_count(self, obj):
-        return obj.likes.count() if hasattr(obj, 'likes') else 0
+        return self._stats['likes_received']
 
     def get_comment_count(self, obj):
-        return obj.comments.count() if hasattr(obj, 'comments') else 0
+        return self._stats['comments_received']
+
+    def get_share_count(self, obj):
+        return self._stats['shares_received']
 
     def get_view_count(self, obj):
-        return sum(article.view_count for article in obj.articles.all()) if hasattr(obj, 'articles') else 0
+        # 浏览量由 blog.viewcounts 缓冲合并时同步累加
+        return self._stats['view_count']
 
 
 class UserInfoUpdateSerializer(serializers.ModelSerializer):
@@ -169,6 +184,12 @@ class AvatarUploadSerializer(serializers.ModelSerializer):
         return value
 
 
+class ChunkedUploadInitSerializer(serializers.Serializer):
+    """分片上传初始化：声明文件名与总大小（扩展名/大小限制在 uploads.create 中校验）"""
+    filename = serializers.CharField(max_length=255, label="文件名")
+    size = serializers.IntegerField(min_value=1, label="文件总大小（字节）")
+
+
 # ===================== 好友/聊天核心序列化器（重点修复） =====================
 class UserBasicSerializer(serializers.ModelSerializer):
     """用户基础信息序列化器（用于好友列表）- 修复：北京时间+布尔值在线状态"""
@@ -181,10 +202,8 @@ class UserBasicSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "avatar", "is_online", "last_active"]
 
     def get_avatar(self, obj):
-        """返回完整头像URL，兜底默认头像"""
-        if obj.avatar and hasattr(obj.avatar, 'url'):
-            return f"http://127.0.0.1:8000{obj.avatar.url}"
-        return "http://127.0.0.1:8000/media/avatars/default.png"
+        """返回完整头像URL（列表场景取 64px 版本，可通过 context['avatar_size'] 指定），兜底默认头像"""
+        return avatar_url(obj, self.context.get('avatar_size', SIZE_LIST))
 
     def get_is_online(self, obj):
         """
@@ -302,15 +321,12 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         fields = ["id", "sender", "receiver", "content", "send_time", "sender_avatar", "receiver_avatar", "is_read"]
         read_only_fields = ["sender", "send_time", "is_read"]
 
+    # 消息气泡里的头像只需 32px 版本
     def get_sender_avatar(self, obj):
-        if obj.sender.avatar and hasattr(obj.sender.avatar, 'url'):
-            return f"http://127.0.0.1:8000{obj.sender.avatar.url}"
-        return "http://127.0.0.1:8000/media/avatars/default.png"
+        return avatar_url(obj.sender, SIZE_MESSAGE)
 
     def get_receiver_avatar(self, obj):
-        if obj.receiver.avatar and hasattr(obj.receiver.avatar, 'url'):
-            return f"http://127.0.0.1:8000{obj.receiver.avatar.url}"
-        return "http://127.0.0.1:8000/media/avatars/default.png"
+        return avatar_url(obj.receiver, SIZE_MESSAGE)
 
     def get_send_time(self, obj):
         """消息发送时间：转换为北京时间"""
@@ -397,7 +413,7 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         return {
             "id": applicant.id,
             "username": applicant.username,
-            "avatar": f"http://127.0.0.1:8000{applicant.avatar.url}" if applicant.avatar else "http://127.0.0.1:8000/media/avatars/default.png"
+            "avatar": avatar_url(applicant, SIZE_LIST)
         }
 
 class HandleFriendRequestSerializer(serializers.Serializer):
@@ -430,7 +446,7 @@ class FriendSerializer(serializers.ModelSerializer):
     def get_friend_info(self, obj):
         """返回好友信息（区分当前用户是申请人还是被申请人）- 适配北京时间"""
         current_user = self.context["request"].user
-        friend = obj.friend if obj.user == current_user else obj.user
+        friend = obj.friend if obj.user_id == current_user.id else obj.user
 
         # 1. 处理最后活跃时间：转换为北京时间（东8区）
         last_active_str = "未知"
@@ -462,31 +478,38 @@ class FriendSerializer(serializers.ModelSerializer):
         return {
             "id": friend.id,
             "username": friend.username,
-            "avatar": f"http://127.0.0.1:8000{friend.avatar.url}" if friend.avatar else "http://127.0.0.1:8000/media/avatars/default.png",
+            "avatar": avatar_url(friend, SIZE_LIST),
             "is_online": is_online,
             "last_active": last_active_str  # 返回北京时间
         }
+    # 以下三个字段优先读取 FriendListView 查询集上的注解（一条 SQL 取回），没有注解时再单独查询
     def get_last_message(self, obj):
-        current_user = self.context["request"].user
-        friend = obj.friend if obj.user == current_user else obj.user
-        last_msg = ChatMessage.objects.filter(
-            (models.Q(sender=current_user, receiver=friend) |
-             models.Q(sender=friend, receiver=current_user))
-        ).order_by("-send_time").first()
+        if hasattr(obj, "last_message_content"):
+            return obj.last_message_content or ""
+        last_msg = self._last_message(obj)
         return last_msg.content if last_msg else ""
 
     def get_last_message_time(self, obj):
-        current_user = self.context["request"].user
-        friend = obj.friend if obj.user == current_user else obj.user
-        last_msg = ChatMessage.objects.filter(
-            (models.Q(sender=current_user, receiver=friend) |
-             models.Q(sender=friend, receiver=current_user))
-        ).order_by("-send_time").first()
-        return last_msg.send_time.strftime("%Y-%m-%d %H:%M:%S") if last_msg else ""
+        if hasattr(obj, "last_message_send_time"):
+            send_time = obj.last_message_send_time
+        else:
+            last_msg = self._last_message(obj)
+            send_time = last_msg.send_time if last_msg else None
+        return send_time.strftime("%Y-%m-%d %H:%M:%S") if send_time else ""
 
     def get_unread_count(self, obj):
+        if hasattr(obj, "unread_total"):
+            return obj.unread_total
         current_user = self.context["request"].user
-        friend = obj.friend if obj.user == current_user else obj.user
+        friend = obj.friend if obj.user_id == current_user.id else obj.user
         return ChatMessage.objects.filter(
             sender=friend, receiver=current_user, is_read=False
-        ).count()
\ No newline at end of file
+        ).count()
+
+    def _last_message(self, obj):
+        current_user = self.context["request"].user
+        friend = obj.friend if obj.user_id == current_user.id else obj.user
+        return ChatMessage.objects.filter(
+            (models.Q(sender=current_user, receiver=friend) |
+             models.Q(sender=friend, receiver=current_user))
+        ).order_by("-send_time").first()
\ No newline at end of file
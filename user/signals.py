@@ -0,0 +1,92 @@
+# user/signals.py
+"""
+用户模型信号：
+- 头像变化时（事务提交后）投递生成头像多尺寸版本的后台任务
+- 好友申请的新建 / 通过 / 删除（拒绝、取消）维护被申请人的待处理申请角标
+- 已通过的好友关系被删除或取消通过时（事务提交后）通知双方的 WebSocket 连接清掉缓存的好友校验
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import badges
+from .avatars import DEFAULT_AVATAR
+from .models import Friend, User
+
+logger = logging.getLogger(__name__)
+
+
+def _remember_avatar(instance):
+    # post_init 在 from_db() 设置 _state.adding 之前触发，用主键区分新建实例；头像被延迟加载时记为未知（None）
+    avatar = instance.__dict__.get('avatar', None) if instance.pk is not None else ''
+    instance._loaded_avatar = getattr(avatar, 'name', avatar)
+
+
+@receiver(post_init, sender=User)
+def remember_avatar(sender, instance, **kwargs):
+    _remember_avatar(instance)
+
+
+def _enqueue_process_avatar(user_id):
+    from .tasks import process_avatar
+    try:
+        process_avatar.delay(user_id)
+    except Exception:
+        # 消息队列不可用时不影响头像保存，序列化器会回退到原图
+        logger.exception("投递头像处理任务失败：user_id=%s", user_id)
+
+
+@receiver(post_save, sender=User)
+def process_avatar_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'avatar' not in update_fields):
+        return
+    name = instance.avatar.name if instance.avatar else ''
+    if name and name != DEFAULT_AVATAR and name != instance._loaded_avatar:
+        user_id = instance.pk
+        transaction.on_commit(lambda: _enqueue_process_avatar(user_id))
+    _remember_avatar(instance)
+
+
+@receiver(post_init, sender=Friend)
+def remember_approved(sender, instance, **kwargs):
+    # 新建实例记为 None；is_approved 被延迟加载时同样记为未知
+    instance._loaded_approved = instance.__dict__.get('is_approved') if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Friend)
+def update_request_badge_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        delta = 0 if instance.is_approved else 1
+    else:
+        delta = -1 if instance._loaded_approved is False and instance.is_approved else 0
+        if instance._loaded_approved and not instance.is_approved:
+            _on_commit_unfriended(instance)
+    badges.incr(instance.friend_id, badges.REQUESTS, delta)
+    instance._loaded_approved = instance.is_approved
+
+
+@receiver(post_delete, sender=Friend)
+def update_request_badge_on_delete(sender, instance, **kwargs):
+    # 拒绝 / 取消申请（以及用户注销时级联删除）
+    if not instance.is_approved:
+        badges.incr(instance.friend_id, badges.REQUESTS, -1)
+    else:
+        _on_commit_unfriended(instance)
+
+
+def _notify_unfriended(user_id, friend_id):
+    from .consumers import notify_unfriended
+    try:
+        notify_unfriended(user_id, friend_id)
+    except Exception:
+        # 通道层不可用时不影响删除好友；已建立的连接在重连前仍可能沿用旧的校验结果
+        logger.exception("通知解除好友失败：%s - %s", user_id, friend_id)
+
+
+def _on_commit_unfriended(instance):
+    user_id, friend_id = instance.user_id, instance.friend_id
+    transaction.on_commit(lambda: _notify_unfriended(user_id, friend_id))
@@ -0,0 +1,154 @@
+# user/stats.py
+"""
+用户统计（UserStats）的增量维护与重算
+
+- 写：incr() 对统计行执行一条 UPDATE field = field + n（减少时不低于 0），与业务写入处于同一事务；
+  由博客保存/删除信号、批量操作、点赞/转发/评论接口、浏览量合并调用
+- 统计行不存在时（老用户尚未回填、新用户首次产生数据）不从 0 开始累加，而是按明细表重算该用户，
+  因此增量永远建立在正确的基数上
+- batch()：上下文内的 incr() 先按用户在内存中累加，退出时每个用户只执行一次 UPDATE（批量删除等场景）
+- 读：get() 按主键一次读取，统计行不存在时返回全 0
+- 重算：rebuild() 按一批用户 id 用分组聚合查询算出真实值后写回（rebuild_user_stats 命令分批调用）
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from blog.models import Blog, BlogComment, BlogLike, BlogShare
+from .models import UserStats
+
+STAT_FIELDS = (
+    'blog_count', 'published_count', 'likes_received', 'comments_received', 'shares_received', 'view_count',
+)
+# 各项“收到的互动”对应的明细表（按博客作者分组计数）
+RECEIVED_MODELS = {
+    'likes_received': BlogLike,
+    'comments_received': BlogComment,
+    'shares_received': BlogShare,
+}
+
+# 博客计数字段 -> 作者收到的互动统计项
+COUNTER_STATS = {
+    'like_count': 'likes_received',
+    'comment_count': 'comments_received',
+    'share_count': 'shares_received',
+}
+
+_local = threading.local()
+
+
+def _check_fields(deltas):
+    for field in deltas:
+        if field not in STAT_FIELDS:
+            raise ValueError(f"未知的用户统计字段：{field}")
+
+
+def incr(user_id, **deltas):
+    """给用户的若干统计项加上增量（可为负数），例如 incr(user_id, likes_received=1)"""
+    _check_fields(deltas)
+    deltas = {field: int(amount) for field, amount in deltas.items() if amount}
+    if user_id is None or not deltas:
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        merged = pending.setdefault(user_id, {})
+        for field, amount in deltas.items():
+            merged[field] = merged.get(field, 0) + amount
+        return
+    _apply(user_id, deltas)
+
+
+def _apply(user_id, deltas):
+    deltas = {field: amount for field, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    values = {
+        field: F(field) + amount if amount > 0 else Greatest(F(field) + amount, Value(0))
+        for field, amount in deltas.items()
+    }
+    if UserStats.objects.filter(user_id=user_id).update(**values, updated_at=timezone.now()):
+        return
+    # 统计行不存在：本次写入已落库，直接重算即可得到包含它的真实值
+    try:
+        with transaction.atomic():
+            rebuild([user_id])
+    except IntegrityError:
+        # 用户已被删除（级联删除过程中）等情况，交给下次重算
+        pass
+
+
+def received_deltas(counts, sign=-1):
+    """博客计数 {'like_count': .., ...}（缺少的字段按 0）换算成作者统计项的增量，默认用于删除时扣减"""
+    return {stat: sign * counts.get(field, 0) for field, stat in COUNTER_STATS.items()}
+
+
+def batching():
+    return getattr(_local, 'pending', None) is not None
+
+
+@contextmanager
+def batch():
+    """合并上下文内的 incr()：退出时每个用户只写一次（嵌套时由最外层统一写入；异常时丢弃）"""
+    if batching():
+        yield
+        return
+    _local.pending = {}
+    try:
+        yield
+        pending = _local.pending
+    finally:
+        _local.pending = None
+    for user_id, deltas in pending.items():
+        _apply(user_id, deltas)
+
+
+def get(user_id):
+    """读取用户统计（一次主键查询），返回 {字段: 值}"""
+    row = UserStats.objects.filter(user_id=user_id).values(*STAT_FIELDS).first()
+    return row or dict.fromkeys(STAT_FIELDS, 0)
+
+
+def compute(user_ids):
+    """按明细表计算一批用户的真实统计值（查询数与用户数无关），返回 {user_id: {字段: 值}}"""
+    result = {user_id: dict.fromkeys(STAT_FIELDS, 0) for user_id in user_ids}
+    blogs = (
+        Blog.objects.filter(author_id__in=user_ids)
+        .order_by()
+        .values('author_id')
+        .annotate(
+            blog_count=Count('id'),
+            published_count=Count('id', filter=Q(status='published')),
+            view_count=Sum('view_count'),
+        )
+    )
+    for row in blogs:
+        stats = result[row['author_id']]
+        stats['blog_count'] = row['blog_count']
+        stats['published_count'] = row['published_count']
+        stats['view_count'] = row['view_count'] or 0
+    for field, model in RECEIVED_MODELS.items():
+        rows = (
+            model.objects.filter(blog__author_id__in=user_ids)
+            .order_by()
+            .values_list('blog__author_id')
+            .annotate(total=Count('id'))
+        )
+        for author_id, total in rows:
+            result[author_id][field] = total
+    return result
+
+
+def rebuild(user_ids):
+    """重算并写回一批用户的统计（存在则覆盖，不存在则创建），返回写入的行数"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    rows = [UserStats(user_id=user_id, **stats) for user_id, stats in compute(user_ids).items()]
+    UserStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user'], update_fields=[*STAT_FIELDS, 'updated_at'],
+    )
+    return len(rows)
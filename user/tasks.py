@@ -2,6 +2,7 @@
 from celery import shared_task
 from django.utils import timezone
 from .models import User  # 导入User模型
+from . import avatars, badges, uploads
 
 @shared_task
 def update_user_online_status():
@@ -21,4 +22,49 @@ def update_user_online_status():
         return f"更新完成，共处理{updated_count}个用户"
     except Exception as e:
         print(f"更新用户在线状态失败：{str(e)}")
-        raise e  # 抛出异常，便于Celery记录错误日志
\ No newline at end of file
+        raise e  # 抛出异常，便于Celery记录错误日志
+
+
+@shared_task
+def process_avatar(user_id):
+    """
+    头像上传后的后台处理：
+    - 居中裁成正方形，生成 32/64/128/256px 版本并重新编码，整体原子替换
+    """
+    try:
+        processed = avatars.process(user_id)
+        print(f"用户{user_id}头像版本{'生成完成' if processed else '无需生成'}")
+        return processed
+    except Exception as e:
+        print(f"处理用户{user_id}头像失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def cleanup_chunked_uploads():
+    """
+    定时清理分片上传：
+    - 删除超过保留时间未更新的上传会话及其临时文件
+    """
+    try:
+        removed = uploads.cleanup_expired()
+        print(f"成功清理{removed}个过期分片上传")
+        return f"清理完成，共处理{removed}个上传会话"
+    except Exception as e:
+        print(f"清理分片上传失败：{str(e)}")
+        raise e
+
+
+@shared_task
+def recount_badges():
+    """
+    角标计数自愈：
+    - 对最近活跃的用户按数据库分组重算未读消息数、待处理好友申请数，覆盖计数存储中的值
+    """
+    try:
+        total = badges.recount_active()
+        print(f"成功重算{total}个用户的角标计数")
+        return total
+    except Exception as e:
+        print(f"重算角标计数失败：{str(e)}")
+        raise e
@@ -1,3 +1,873 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from utils.query_budget import QueryBudgetTestMixin, get_budget
+from utils.query_plan import QueryPlanAssertionsMixin
+from blog.models import Blog
+from utils.snowflake import Snowflake, timestamp_ms
+from . import avatars, badges, consumers, stats, uploads, writebehind
+from .consumers import ChatConsumer, UserChatConsumer
+from .models import ChatMessage, ChunkedUpload, Conversation, Friend, User, UserStats, conversation_key
+from .tasks import recount_badges
+from .views import FriendListView, MyFriendRequestsView
+
+
+class ChatHotQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """user 热点接口与 Consumer 的执行计划回归测试：捕获实际执行的 SQL 逐条 EXPLAIN"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'plan_{i}', email=f'plan_{i}@test.com', password='pass123456')
+            for i in range(8)
+        ]
+        cls.me, cls.friend = cls.users[0], cls.users[2]
+        for other in cls.users[1:]:
+            Friend.objects.create(user=cls.me, friend=other, is_approved=other.id % 2 == 1)
+            Friend.objects.create(user=other, friend=cls.users[-1] if other != cls.users[-1] else cls.me)
+        ChatMessage.objects.bulk_create(
+            ChatMessage(sender=sender, receiver=receiver, content='你好', is_read=i % 3 == 0)
+            for i, (sender, receiver) in enumerate(
+                [(cls.me, cls.friend), (cls.friend, cls.me), (cls.users[4], cls.me), (cls.users[3], cls.friend)] * 10
+            )
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.me).access_token}')
+
+    def test_friend_list(self):
+        with self.assertQueriesUseIndexes('friend_user_approved_idx', 'friend_friend_approved_idx'):
+            response = self.client.get('/chat/friends/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_friendship_check(self):
+        # ChatConsumer / UserChatConsumer 的双向好友校验
+        with self.assertQueriesUseIndexes():
+            self.assertTrue(async_to_sync(consumers.is_friend)(self.me.id, self.friend.id))
+
+    def test_send_message(self):
+        with self.assertQueriesUseIndexes():
+            response = self.client.post('/chat/send-message/', {'friend_id': self.friend.id, 'content': '你好'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_chat_history(self):
+        with self.assertQueriesUseIndexes('chat_conversation_time_idx'):
+            response = self.client.get('/chat/messages/', {'friend_id': self.friend.id, 'page_size': 5})
+        # before_id 往前翻
+        with self.assertQueriesUseIndexes('chat_conversation_time_idx'):
+            self.client.get('/chat/messages/', {'friend_id': self.friend.id, 'before_id': response.data['before_id']})
+
+    def test_mark_as_read_and_unread_count(self):
+        with self.assertQueriesUseIndexes('chat_unread_idx'):
+            response = self.client.get('/chat/unread-count/')
+        self.assertEqual(response.data['total_unread'], ChatMessage.objects.filter(receiver=self.me, is_read=False).count())
+        with self.assertQueriesUseIndexes('chat_unread_idx'):
+            self.client.post('/chat/mark-as-read/', {'friend_id': self.friend.id})
+
+    def test_friend_requests(self):
+        with self.assertQueriesUseIndexes():
+            self.client.get('/friend-request/my/')
+        with self.assertQueriesUseIndexes():
+            self.client.get('/chat/pending-request-count/')
+        with self.assertQueriesUseIndexes():
+            pending = Friend.objects.filter(user=self.me, is_approved=False).values_list('friend_id', flat=True).first()
+            response = self.client.delete(f'/friend-request/cancel/{pending}/')
+        self.assertEqual(response.status_code, 204)
+
+
+def named_routes(patterns):
+    """递归列出 urlpatterns 中所有带 name 的路由"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from named_routes(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+class ChatAPITestCase(QueryBudgetTestMixin, TestCase):
+    """各组聊天/好友接口测试共用的夹具：4 位好友（两个方向）、3 条待处理申请、每位好友 3 条消息"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username='budget_me', email='budget_me@test.com', password='pass123456')
+        cls.friends = [
+            User.objects.create_user(username=f'budget_friend_{i}', email=f'budget_friend_{i}@test.com', password='pass123456')
+            for i in range(4)
+        ]
+        cls.applicants = [
+            User.objects.create_user(username=f'budget_applicant_{i}', email=f'budget_applicant_{i}@test.com', password='pass123456')
+            for i in range(3)
+        ]
+        cls.stranger = User.objects.create_user(username='budget_stranger', email='budget_stranger@test.com', password='pass123456')
+        for i, friend in enumerate(cls.friends):
+            # 两个方向的好友关系都覆盖到
+            if i % 2:
+                Friend.objects.create(user=friend, friend=cls.me, is_approved=True)
+            else:
+                Friend.objects.create(user=cls.me, friend=friend, is_approved=True)
+        cls.requests = [Friend.objects.create(user=applicant, friend=cls.me) for applicant in cls.applicants]
+        cls.friend = cls.friends[0]
+        ChatMessage.objects.bulk_create(
+            ChatMessage(sender=sender, receiver=receiver, content=f'消息 {i}')
+            for i, (sender, receiver) in enumerate(
+                [(cls.me, friend) for friend in cls.friends] + [(friend, cls.me) for friend in cls.friends] * 2
+            )
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.me).access_token}')
+
+
+class ChatQueryBudgetTests(ChatAPITestCase):
+    """user/urls.py 各路由的单请求查询预算：好友列表、聊天记录、申请列表的查询数不得随条数增长（N+1）"""
+
+    def test_every_route_has_budget(self):
+        from user import urls
+        missing = [name for name in named_routes(urls.urlpatterns) if get_budget(name) is None]
+        self.assertFalse(missing, f"以下路由没有声明查询预算：{missing}")
+
+    def test_token_obtain_and_refresh(self):
+        client = APIClient()
+        with self.assertQueryBudget('token_obtain_pair', 'POST'):
+            response = client.post('/api/token/', {'username': 'budget_me', 'password': 'pass123456'})
+        self.assertEqual(response.status_code, 200)
+        with self.assertQueryBudget('token_refresh', 'POST'):
+            response = client.post('/api/token/refresh/', {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_friend_list(self):
+        with self.assertQueryBudget('friend-list'):
+            response = self.client.get('/chat/friends/')
+        self.assertEqual(response.status_code, 200)
+        data = response.data['data'] if 'data' in response.data else response.data
+        self.assertEqual(len(data), len(self.friends))
+        self.assertTrue(all(item['unread_count'] == 2 and item['last_message'] for item in data))
+
+    def test_chat_messages(self):
+        with self.assertQueryBudget('chat-messages'):
+            response = self.client.get('/chat/messages/', {'friend_id': self.friend.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 3)
+        self.assertFalse(response.data['has_more'])
+
+    def test_send_message(self):
+        with self.assertQueryBudget('send-message', 'POST'):
+            response = self.client.post('/chat/send-message/', {'friend_id': self.friend.id, 'content': '你好'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_mark_as_read_and_unread_count(self):
+        with self.assertQueryBudget('unread-count'):
+            response = self.client.get('/chat/unread-count/')
+        self.assertEqual(response.data['total_unread'], 2 * len(self.friends))
+        with self.assertQueryBudget('mark-as-read', 'POST'):
+            response = self.client.post('/chat/mark-as-read/', {'friend_id': self.friend.id})
+        self.assertEqual(response.status_code, 200)
+
+    def test_send_friend_request(self):
+        with self.assertQueryBudget('send-friend-request', 'POST'):
+            response = self.client.post('/friend-request/send/', {'friend_id': self.stranger.id})
+        self.assertEqual(response.data['code'], 200)
+
+    def test_my_friend_requests(self):
+        with self.assertQueryBudget('my-friend-requests'):
+            response = self.client.get('/friend-request/my/')
+        self.assertEqual(len(response.data['data']), len(self.applicants))
+
+    def test_handle_friend_request(self):
+        with self.assertQueryBudget('handle-friend-request', 'POST'):
+            response = self.client.post('/friend-request/handle/', {'request_id': self.requests[0].id, 'agree': True})
+        self.assertEqual(response.data['code'], 200)
+        with self.assertQueryBudget('handle-friend-request', 'POST'):
+            response = self.client.post('/friend-request/handle/', {'request_id': self.requests[1].id, 'agree': False})
+        self.assertEqual(response.data['code'], 200)
+
+    def test_cancel_friend_request_and_delete_friend(self):
+        Friend.objects.create(user=self.me, friend=self.stranger)
+        with self.assertQueryBudget('cancel-friend-request', 'DELETE'):
+            response = self.client.delete(f'/friend-request/cancel/{self.stranger.id}/')
+        self.assertEqual(response.status_code, 204)
+        with self.assertQueryBudget('delete-friend', 'DELETE'):
+            response = self.client.delete(f'/friend/delete/{self.friend.id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_user_public_detail(self):
+        with self.assertQueryBudget('user-public-detail'):
+            response = self.client.get(f'/users/{self.friend.id}/')
+        self.assertEqual(response.data['code'], 200)
+
+    def test_heartbeat_and_pending_count(self):
+        with self.assertQueryBudget('heartbeat', 'POST'):
+            response = self.client.post('/chat/heartbeat/')
+        self.assertEqual(response.data['code'], 200)
+        with self.assertQueryBudget('pending-request-count'):
+            response = self.client.get('/chat/pending-request-count/')
+        self.assertEqual(response.data['count'], len(self.applicants))
+
+class ChatHistoryPagingTests(ChatAPITestCase):
+    """聊天记录按消息 id 游标翻页：向前/向后翻页不重不漏，每页查询数固定"""
+
+    def test_chat_messages_paging(self):
+        base = timezone.now()
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                sender=self.me if i % 2 else self.friend, receiver=self.friend if i % 2 else self.me,
+                content=f'翻页 {i}', send_time=base + timedelta(seconds=i // 2),  # 每两条同一时刻
+            )
+            for i in range(50)
+        )
+        ids = list(
+            ChatMessage.objects.filter(conversation=conversation_key(self.me.id, self.friend.id))
+            .order_by('send_time', 'id').values_list('id', flat=True)
+        )
+        # 每页查询数固定，与会话长度和翻页深度无关
+        with self.assertQueryBudget('chat-messages'):
+            latest = self.client.get('/chat/messages/', {'friend_id': self.friend.id, 'page_size': 20}).data
+        self.assertEqual([item['id'] for item in latest['data']], ids[-20:])
+        self.assertTrue(latest['has_more'])
+        self.assertEqual(latest['data'][-1]['sender_name'], self.me.username)
+
+        seen = [item['id'] for item in latest['data']]
+        before_id = latest['before_id']
+        while True:
+            with self.assertQueryBudget('chat-messages'):
+                page = self.client.get('/chat/messages/', {
+                    'friend_id': self.friend.id, 'before_id': before_id, 'page_size': 20,
+                }).data
+            seen = [item['id'] for item in page['data']] + seen
+            if not page['has_more']:
+                break
+            before_id = page['before_id']
+        self.assertEqual(seen, ids)
+
+        newer = self.client.get('/chat/messages/', {
+            'friend_id': self.friend.id, 'after_id': ids[10], 'page_size': 5,
+        }).data
+        self.assertEqual([item['id'] for item in newer['data']], ids[11:16])
+        self.assertTrue(newer['has_more'])
+
+        # 游标不属于该会话：空页；参数非法：400
+        other = ChatMessage.objects.exclude(conversation=conversation_key(self.me.id, self.friend.id)).first()
+        response = self.client.get('/chat/messages/', {'friend_id': self.friend.id, 'before_id': other.id})
+        self.assertEqual(response.data['data'], [])
+        response = self.client.get('/chat/messages/', {'friend_id': self.friend.id, 'before_id': 1, 'after_id': 2})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConversationTests(ChatAPITestCase):
+    """会话表：最后一条消息、双方未读数随发消息/标记已读更新"""
+
+    def test_conversation_updates(self):
+        low, high = sorted((self.me.id, self.friends[2].id))
+        conversation = Conversation.objects.get(user_low=low, user_high=high)
+        self.assertEqual((conversation.unread_low if low == self.me.id else conversation.unread_high), 2)
+
+        # 发消息：会话的最后一条消息、对方未读数随之更新，好友列表按最近聊天排到最前
+        self.client.post('/chat/send-message/', {'friend_id': self.friends[2].id, 'content': '最新' * 60})
+        data = self.client.get('/chat/friends/').data['data']
+        self.assertEqual(data[0]['friend_info']['id'], self.friends[2].id)
+        self.assertEqual(data[0]['last_message'], ('最新' * 60)[:100])
+        self.assertEqual(data[0]['unread_count'], 2)
+        conversation.refresh_from_db()
+        # 夹具中我发给对方 1 条，加上刚发的 1 条
+        self.assertEqual((conversation.unread_high if low == self.me.id else conversation.unread_low), 2)
+
+        # 标记已读：只清零自己一侧；乱序写入的旧消息不覆盖最后一条消息
+        self.client.post('/chat/mark-as-read/', {'friend_id': self.friends[2].id})
+        ChatMessage.objects.bulk_create([ChatMessage(
+            sender=self.friends[2], receiver=self.me, content='迟到的消息',
+            send_time=conversation.last_message_at - timedelta(minutes=1),
+        )])
+        item = next(i for i in self.client.get('/chat/friends/').data['data'] if i['friend_info']['id'] == self.friends[2].id)
+        self.assertEqual(item['unread_count'], 1)
+        self.assertEqual(item['last_message'], ('最新' * 60)[:100])
+
+
+@override_settings(USER_BADGE_STORE='user.badges.MemoryBadgeStore')
+class BadgeCounterTests(ChatAPITestCase):
+    """未读消息 / 好友申请角标：增量维护、各存储实现、自愈任务按数据库覆盖"""
+
+    def setUp(self):
+        super().setUp()
+        badges.get_store().clear()
+
+    def test_badge_counters(self):
+        def badge(path, key):
+            return self.client.get(path).data[key]
+
+        unread_url, requests_url = '/chat/unread-count/', '/chat/pending-request-count/'
+        self.assertEqual(badge(unread_url, 'total_unread'), 2 * len(self.friends))
+        self.assertEqual(badge(requests_url, 'count'), len(self.applicants))
+        # 计数已在存储中：轮询只剩认证查询
+        with self.assertNumQueries(1):
+            badge(unread_url, 'total_unread')
+
+        friend_client = APIClient()
+        friend_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.friends[1]).access_token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            # 好友 1 是申请人一方，从它的方向发消息
+            friend_client.post('/chat/send-message/', {'friend_id': self.me.id, 'content': '新消息'})
+        self.assertEqual(badge(unread_url, 'total_unread'), 2 * len(self.friends) + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/chat/mark-as-read/', {'friend_id': self.friends[1].id})
+        self.assertEqual(badge(unread_url, 'total_unread'), 2 * len(self.friends) - 2)
+
+        stranger_client = APIClient()
+        stranger_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.stranger).access_token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            stranger_client.post('/friend-request/send/', {'friend_id': self.me.id})
+        self.assertEqual(badge(requests_url, 'count'), len(self.applicants) + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/friend-request/handle/', {'request_id': self.requests[0].id, 'agree': True})
+            self.client.post('/friend-request/handle/', {'request_id': self.requests[1].id, 'agree': False})
+            stranger_client.delete(f'/friend-request/cancel/{self.me.id}/')
+        self.assertEqual(badge(requests_url, 'count'), len(self.applicants) - 2)
+
+        # 存储与数据库不一致时，自愈任务按数据库覆盖
+        badges.get_store().set_many({(self.me.id, badges.UNREAD): 99, (self.me.id, badges.REQUESTS): 99})
+        self.assertGreaterEqual(recount_badges(), 1)  # last_active 为 auto_now，测试用户都算最近活跃
+        self.assertEqual(badge(unread_url, 'total_unread'), 2 * len(self.friends) - 2)
+        self.assertEqual(badge(requests_url, 'count'), len(self.applicants) - 2)
+
+    def test_badge_stores(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        for store in (badges.MemoryBadgeStore(), badges.CacheBadgeStore(),
+                      badges.SQLiteBadgeStore(path=f'{tmp}/badges.sqlite3')):
+            store.incr(self.me.id, badges.UNREAD, 1)  # 没有值时不累加
+            self.assertIsNone(store.get(self.me.id, badges.UNREAD))
+            store.set_many({(self.me.id, badges.UNREAD): 2})
+            store.incr(self.me.id, badges.UNREAD, 3)
+            self.assertEqual(store.get(self.me.id, badges.UNREAD), 5)
+            store.incr(self.me.id, badges.UNREAD, -9)
+            self.assertIn(store.get(self.me.id, badges.UNREAD), (0, None), type(store).__name__)
+            store.clear()
+
+    @override_settings(USER_BADGE_STORE='user.badges.CacheBadgeStore')
+    def test_process_local_cache_falls_back_to_count(self):
+        # 默认缓存是进程内的 LocMemCache：其他 worker 的增量看不到，不使用缓存存储，每次按数据库计数
+        store = badges.get_store()
+        self.assertFalse(store.enabled)
+        with self.captureOnCommitCallbacks(execute=True):
+            badges.incr(self.me.id, badges.UNREAD, 5)
+        self.assertIsNone(store.get(self.me.id, badges.UNREAD))
+        ChatMessage.objects.filter(receiver=self.me).update(is_read=True)
+        self.assertEqual(self.client.get('/chat/unread-count/').data['total_unread'], 0)
+        with self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/2',
+        }}):
+            self.assertTrue(store.enabled)
+
+
+class ChunkedUploadTests(ChatAPITestCase):
+    """分片上传：按偏移量续传、完成后用作头像、拒绝不允许的类型和大小"""
+
+    def test_chunked_upload(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), (10, 20, 30)).save(buffer, 'PNG')
+        content = buffer.getvalue()
+        half = len(content) // 2
+
+        with override_settings(CHUNKED_UPLOAD_DIR=tmp, MEDIA_ROOT=tmp):
+            with self.assertQueryBudget('chunked-upload-init', 'POST'):
+                response = self.client.post('/uploads/', {'filename': 'me.png', 'size': len(content)})
+            upload_id = response.data['data']['upload_id']
+            url = f'/uploads/{upload_id}/'
+            with self.assertQueryBudget('chunked-upload-detail', 'PUT'):
+                response = self.client.put(f'{url}?offset=0', content[:half], content_type='application/octet-stream')
+            self.assertEqual(response.data['data']['offset'], half)
+            # 偏移量不一致（如重复发送同一分片）返回 409 与服务端进度
+            response = self.client.put(f'{url}?offset=0', content[:half], content_type='application/octet-stream')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.data['data']['offset'], half)
+            self.assertEqual(self.client.post(f'{url}finalize/').status_code, 409)
+            self.client.put(f'{url}?offset={half}', content[half:], content_type='application/octet-stream')
+            with self.assertQueryBudget('chunked-upload-detail'):
+                response = self.client.get(url)
+            self.assertEqual(response.data['data']['offset'], len(content))
+            with self.assertQueryBudget('chunked-upload-finalize', 'POST'):
+                response = self.client.post(f'{url}finalize/')
+            self.assertEqual(response.data['data']['status'], 'complete')
+
+            response = self.client.post('/upload-avatar/', {'upload_id': upload_id})
+            self.assertEqual(response.data['code'], 200)
+            self.me.refresh_from_db()
+            self.assertTrue(self.me.avatar.name.endswith('.png'))
+            self.assertFalse(ChunkedUpload.objects.filter(pk=upload_id).exists())
+
+    def test_chunked_upload_rejects_disallowed_type(self):
+        response = self.client.post('/uploads/', {'filename': 'run.exe', 'size': 10})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/uploads/', {'filename': 'big.png', 'size': 100 * 1024 * 1024})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_content_length(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        with override_settings(CHUNKED_UPLOAD_DIR=tmp):
+            upload_id = self.client.post('/uploads/', {'filename': 'me.png', 'size': 10}).data['data']['upload_id']
+            response = self.client.put(
+                f'/uploads/{upload_id}/?offset=0', b'0123456789', content_type='application/octet-stream',
+                CONTENT_LENGTH='abc',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 400)
+
+    def test_chunk_received_before_locking(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        test = self
+
+        class RacingStream(BytesIO):
+            """读取请求体期间，另一个请求抢先提交了同一 offset 的分片"""
+
+            def read(self, size=-1):
+                if self.tell() == 0:
+                    uploads.append_chunk(test.me, upload.pk, 0, BytesIO(b'a' * 4), 4)
+                return super().read(size)
+
+        with override_settings(CHUNKED_UPLOAD_DIR=tmp):
+            upload = uploads.create(self.me, 'me.png', 10)
+            with self.assertRaises(uploads.UploadError) as raised:
+                uploads.append_chunk(self.me, upload.pk, 0, RacingStream(b'b' * 4), 4)
+            # 加锁后重新校验 offset：后到的分片被拒绝，不会覆盖已提交的数据，分片文件也被清理
+            self.assertEqual((raised.exception.status_code, raised.exception.offset), (409, 4))
+            with open(upload.temp_path, 'rb') as file:
+                self.assertEqual(file.read(), b'a' * 4)
+            self.assertEqual(os.listdir(tmp), [os.path.basename(upload.temp_path)])
+
+
+@override_settings(AVATAR_RENDITION_SIZES=[32, 64, 128, 256], AVATAR_RENDITION_FORMAT='webp')
+class AvatarRenditionTests(TestCase):
+    """头像多尺寸版本：居中裁成正方形后生成各尺寸，接口按场景输出对应尺寸的地址"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username='avatar_me', email='avatar_me@test.com', password='pass123456')
+        cls.friend = User.objects.create_user(username='avatar_friend', email='avatar_friend@test.com', password='pass123456')
+        Friend.objects.create(user=cls.me, friend=cls.friend, is_approved=True)
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=tmp))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.me).access_token}')
+
+    def set_avatar(self, user, name, size=(300, 200)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (10, 120, 200)).save(buffer, 'PNG')
+        user.avatar = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+        user.save()
+        return user
+
+    def test_process_generates_square_renditions(self):
+        user = self.set_avatar(User.objects.get(pk=self.friend.pk), 'friend.png')
+        self.assertTrue(avatars.process(user.pk))
+        self.assertFalse(avatars.process(user.pk))  # 已是最新
+        user.refresh_from_db()
+        renditions = user.avatar_renditions
+        self.assertEqual((renditions['source'], renditions['format']), (user.avatar.name, 'webp'))
+        self.assertEqual(sorted(renditions['sizes'], key=int), ['32', '64', '128', '256'])
+        for size, path in renditions['sizes'].items():
+            with default_storage.open(path, 'rb') as file, Image.open(file) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (int(size), int(size))))
+
+        # 取不小于目标尺寸的最小版本，超过最大尺寸时取最大版本，不指定尺寸时取原图
+        self.assertTrue(avatars.avatar_url(user, 40).endswith('-64.webp'))
+        self.assertTrue(avatars.avatar_url(user, 1000).endswith('-256.webp'))
+        self.assertTrue(avatars.avatar_url(user).endswith('.png'))
+
+    def test_reprocess_keeps_old_files_until_update(self):
+        user = self.set_avatar(User.objects.get(pk=self.friend.pk), 'friend.png')
+        avatars.process(user.pk)
+        renditions = User.objects.get(pk=user.pk).avatar_renditions
+        old = set(renditions['sizes'].values())
+        # 让库里的记录过期，强制重新处理同一张头像
+        User.objects.filter(pk=user.pk).update(avatar_renditions={**renditions, 'source': 'stale.png'})
+        build = avatars.build_renditions
+
+        def checked_build(*args):
+            renditions = build(*args)
+            # 新版本写到了新文件名，UPDATE 之前旧文件仍然完好
+            self.assertFalse(set(renditions['sizes'].values()) & old)
+            self.assertTrue(all(default_storage.exists(path) for path in old))
+            return renditions
+
+        with mock.patch.object(avatars, 'build_renditions', checked_build):
+            self.assertTrue(avatars.process(user.pk))
+        current = set(User.objects.get(pk=user.pk).avatar_renditions['sizes'].values())
+        self.assertTrue(all(default_storage.exists(path) for path in current))
+        self.assertFalse(any(default_storage.exists(path) for path in old))
+
+    def test_urls_exposed_per_context(self):
+        user = self.set_avatar(User.objects.get(pk=self.friend.pk), 'friend.png')
+        # 版本未生成：回退到原图
+        friend_info = self.client.get('/chat/friends/').data['data'][0]['friend_info']
+        self.assertTrue(friend_info['avatar'].endswith('.png'))
+
+        avatars.process(user.pk)
+        friend_info = self.client.get('/chat/friends/').data['data'][0]['friend_info']
+        self.assertTrue(friend_info['avatar'].endswith(f'-{avatars.SIZE_LIST}.webp'))
+        message = self.client.post('/chat/send-message/', {'friend_id': self.friend.id, 'content': '在吗'}).data
+        self.assertTrue(message['receiver_avatar'].endswith(f'-{avatars.SIZE_MESSAGE}.webp'))
+        # 没有上传头像的用户返回默认头像
+        self.assertTrue(message['sender_avatar'].endswith(avatars.DEFAULT_AVATAR))
+
+        # 换了头像但新版本还没生成：不再返回旧头像的版本
+        self.set_avatar(User.objects.get(pk=self.friend.pk), 'friend-new.png')
+        friend_info = self.client.get('/chat/friends/').data['data'][0]['friend_info']
+        self.assertNotIn('.webp', friend_info['avatar'])
+
+
+@override_settings(CHAT_SNOWFLAKE_NODE_ID=7)
+class ChatWriteBehindTests(QueryBudgetTestMixin, TestCase):
+    """聊天消息写后模式：雪花 id、批量落库、日志回放"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username='wb_me', email='wb_me@test.com', password='pass123456')
+        cls.friend = User.objects.create_user(username='wb_friend', email='wb_friend@test.com', password='pass123456')
+        Friend.objects.create(user=cls.me, friend=cls.friend, is_approved=True)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def journals(self):
+        return sorted(os.listdir(self.tmp))
+
+    def test_snowflake_ids(self):
+        generator = Snowflake(node_id=7)
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLessEqual(abs(timestamp_ms(ids[-1]) / 1000 - timezone.now().timestamp()), 5)
+        with self.assertRaises(ValueError):
+            Snowflake(node_id=None)
+
+    @override_settings(CHAT_SNOWFLAKE_NODE_ID=None)
+    def test_node_id_required(self):
+        # 不按进程号推算节点号：没有显式配置时拒绝生成 id，写后模式无法开启
+        with self.assertRaises(ImproperlyConfigured):
+            writebehind.next_id()
+        with self.assertRaises(ImproperlyConfigured), self.settings(CHAT_WRITE_BEHIND=True):
+            writebehind.get_buffer()
+
+    def test_id_collision_keeps_message(self):
+        entry = {
+            'id': writebehind.next_id(), 'sender_id': self.me.id, 'receiver_id': self.friend.id,
+            'content': '原消息', 'send_time': timezone.now(),
+        }
+        self.assertEqual(writebehind.write_batch([entry]), 1)
+        # 同一条消息重复回放：跳过；id 相同但内容不同（另一节点生成的冲突 id）：换新 id 写入
+        clash = {**entry, 'sender_id': self.friend.id, 'receiver_id': self.me.id, 'content': '冲突消息'}
+        self.assertEqual(writebehind.write_batch([entry, clash]), 1)
+        batch = [{**clash, 'id': entry['id'] - 1}, {**clash, 'id': entry['id'] - 1, 'content': '同批冲突'}]
+        self.assertEqual(writebehind.write_batch(batch), 2)
+        self.assertEqual(
+            sorted(ChatMessage.objects.values_list('content', flat=True)), ['冲突消息', '冲突消息', '原消息', '同批冲突']
+        )
+        self.assertEqual(ChatMessage.objects.get(pk=entry['id']).content, '原消息')
+
+    def test_journal_io_off_event_loop(self):
+        buffer = writebehind.MessageBuffer(directory=self.tmp, interval_ms=60000)
+        record = buffer._record
+        threads = []
+
+        def tracking_record(*args):
+            threads.append(threading.current_thread())
+            return record(*args)
+
+        async def scenario():
+            loop_thread = threading.current_thread()
+            with mock.patch.object(buffer, '_record', tracking_record):
+                entry = await buffer.add_async(self.me.id, self.friend.id, '异步')
+            self.assertEqual(await buffer.flush(), 1)
+            buffer._timer.cancel()
+            return loop_thread, entry
+
+        loop_thread, entry = async_to_sync(scenario)()
+        self.assertTrue(threads and all(thread is not loop_thread for thread in threads))
+        self.assertTrue(ChatMessage.objects.filter(pk=entry['id'], content='异步').exists())
+        self.assertEqual(self.journals(), [])
+
+    def test_buffer_flush(self):
+        buffer = writebehind.MessageBuffer(directory=self.tmp, batch_size=10)
+        entries = [buffer.add(self.me.id, self.friend.id, f'缓冲 {i}') for i in range(3)]
+        # 未落库前只在日志中
+        self.assertEqual(len(self.journals()), 1)
+        self.assertFalse(ChatMessage.objects.filter(pk__in=[e['id'] for e in entries]).exists())
+
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(buffer.flush_sync(), 3)
+        # 一批只有一条 INSERT
+        inserts = [q for q in captured.captured_queries if q['sql'].startswith('INSERT INTO "user_chatmessage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            list(ChatMessage.objects.filter(sender=self.me).order_by('id').values_list('id', 'content')),
+            [(e['id'], e['content']) for e in entries],
+        )
+        conversation = Conversation.objects.get()
+        self.assertEqual((conversation.last_message_id, conversation.unread_high), (entries[-1]['id'], 3))
+        self.assertEqual(self.journals(), [])
+
+    def test_crash_recovery(self):
+        crashed = writebehind.MessageBuffer(directory=self.tmp)
+        entries = [crashed.add(self.friend.id, self.me.id, f'崩溃前 {i}') for i in range(2)]
+        # 新进程接管日志；与未崩溃的旧缓冲重复写入时按 id 去重
+        recovered = writebehind.MessageBuffer(directory=self.tmp)
+        self.assertEqual(recovered.pending_count(), 2)
+        self.assertEqual(recovered.flush_sync(), 2)
+        self.assertEqual(crashed.flush_sync(), 0)
+        self.assertEqual(ChatMessage.objects.filter(pk__in=[e['id'] for e in entries]).count(), 2)
+        self.assertEqual(self.journals(), [])
+
+        # 已退出进程留下的日志（最后一行只写了一半）由回放命令写入
+        message_id = writebehind.next_id()
+        with open(os.path.join(self.tmp, '999999999-00000001.jsonl'), 'w', encoding='utf-8') as journal:
+            journal.write(json.dumps({
+                'id': message_id, 'sender_id': self.me.id, 'receiver_id': self.friend.id,
+                'content': '回放', 'send_time': timezone.now().isoformat(),
+            }) + '\n{"id": ')
+        out = StringIO()
+        call_command('replay_chat_journal', '--dir', self.tmp, stdout=out)
+        self.assertIn('写入 1 条消息', out.getvalue())
+        self.assertTrue(ChatMessage.objects.filter(pk=message_id, content='回放').exists())
+
+    @override_settings(CHAT_WRITE_BEHIND=True)
+    def test_sync_send_uses_snowflake_ids(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.me).access_token}')
+        # 首条消息还要新建会话行，仍在预算内
+        with self.assertQueryBudget('send-message', 'POST'):
+            response = client.post('/chat/send-message/', {'friend_id': self.friend.id, 'content': '你好'})
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(ChatMessage.objects.get(sender=self.me).id, 1 << 40)
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """最小的 WebSocket 测试客户端（channels.testing 依赖 daphne，这里直接基于 asgiref）"""
+
+    def __init__(self, application, url):
+        path, _, query_string = url.partition('?')
+        super().__init__(application, {
+            'type': 'websocket', 'path': path, 'query_string': query_string.encode(), 'headers': [], 'subprotocols': [],
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output(1))['type'] == 'websocket.accept'
+
+    async def send_json_to(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json_from(self):
+        return json.loads((await self.receive_output(1))['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class UserChatConsumerTests(TestCase):
+    """每个用户一条 WebSocket：按 friend_id 订阅，未订阅的会话只收提示，与旧的每好友连接互通"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(username='ws_me', email='ws_me@test.com', password='pass123456')
+        cls.friend = User.objects.create_user(username='ws_friend', email='ws_friend@test.com', password='pass123456')
+        cls.other = User.objects.create_user(username='ws_other', email='ws_other@test.com', password='pass123456')
+        cls.stranger = User.objects.create_user(username='ws_stranger', email='ws_stranger@test.com', password='pass123456')
+        Friend.objects.create(user=cls.me, friend=cls.friend, is_approved=True)
+        Friend.objects.create(user=cls.other, friend=cls.me, is_approved=True)
+
+    def connect(self, user, url='/ws/chat/'):
+        application = URLRouter([
+            path('ws/chat/', UserChatConsumer.as_asgi()),
+            path('ws/chat/<int:friend_id>/', ChatConsumer.as_asgi()),
+        ])
+        token = RefreshToken.for_user(user).access_token
+        return WebsocketClient(application, f'{url}?token={token}')
+
+    def test_multiplexed_socket(self):
+        async def scenario():
+            me, friend = self.connect(self.me), self.connect(self.friend)
+            legacy = self.connect(self.other, f'/ws/chat/{self.me.id}/')
+            for communicator in (me, friend, legacy):
+                self.assertTrue(await communicator.connect())
+
+            await me.send_json_to({'type': 'subscribe', 'friend_id': self.friend.id})
+            self.assertEqual(await me.receive_json_from(), {'type': 'subscribed', 'friend_id': self.friend.id})
+            await me.send_json_to({'type': 'subscribe', 'friend_id': self.stranger.id})
+            self.assertEqual((await me.receive_json_from())['type'], 'error')
+
+            # 已订阅的会话收到完整消息（自己发出的也回推）；对方未订阅只收到提示
+            await me.send_json_to({'type': 'message', 'friend_id': self.friend.id, 'content': '你好'})
+            pushed = await me.receive_json_from()
+            self.assertEqual((pushed['type'], pushed['friend_id'], pushed['message']['content']),
+                             ('new_message', self.friend.id, '你好'))
+            notify = await friend.receive_json_from()
+            self.assertEqual(notify, {'type': 'notify', 'friend_id': self.me.id,
+                                      'message_id': pushed['message']['id'], 'preview': '你好'})
+
+            # 旧的每好友连接发出的消息同样推送到个人频道组
+            await legacy.send_json_to({'content': '旧连接'})
+            self.assertEqual((await legacy.receive_json_from())['message']['content'], '旧连接')
+            self.assertEqual((await me.receive_json_from())['type'], 'notify')
+
+            # 同一条连接上发给另一个好友：只在首次校验好友关系
+            await me.send_json_to({'type': 'subscribe', 'friend_id': self.other.id})
+            await me.receive_json_from()
+            await me.send_json_to({'type': 'message', 'friend_id': self.other.id, 'content': '新连接'})
+            self.assertEqual((await me.receive_json_from())['message']['content'], '新连接')
+            self.assertEqual((await legacy.receive_json_from())['message']['content'], '新连接')
+
+            await me.send_json_to({'type': 'unsubscribe', 'friend_id': self.friend.id})
+            self.assertEqual((await me.receive_json_from())['type'], 'unsubscribed')
+            self.assertTrue(await friend.receive_nothing())
+            for communicator in (me, friend, legacy):
+                await communicator.disconnect()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            async_to_sync(scenario)()
+        self.assertEqual(ChatMessage.objects.filter(sender=self.me).count(), 2)
+        self.assertEqual(Conversation.objects.get(user_low=self.me, user_high=self.friend).unread_high, 1)
+
+    def test_unfriend_invalidates_socket(self):
+        def unfriend(change):
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+
+        def unapprove():
+            relation = Friend.objects.get(user=self.other, friend=self.me)
+            relation.is_approved = False
+            relation.save()
+
+        async def scenario():
+            me, friend = self.connect(self.me), self.connect(self.friend)
+            for communicator in (me, friend):
+                self.assertTrue(await communicator.connect())
+            await me.send_json_to({'type': 'subscribe', 'friend_id': self.friend.id})
+            await me.receive_json_from()
+            await me.send_json_to({'type': 'message', 'friend_id': self.other.id, 'content': '校验过'})
+            self.assertEqual((await me.receive_json_from())['type'], 'notify')
+
+            # 删除好友：已订阅的会话收到取消订阅，之后的消息重新校验好友关系
+            await database_sync_to_async(unfriend)(Friend.objects.filter(user=self.me, friend=self.friend).delete)
+            self.assertEqual(await me.receive_json_from(), {'type': 'unsubscribed', 'friend_id': self.friend.id})
+            self.assertTrue(await friend.receive_nothing())
+            await me.send_json_to({'type': 'message', 'friend_id': self.friend.id, 'content': '还在吗'})
+            self.assertEqual(await me.receive_json_from(),
+                             {'type': 'error', 'friend_id': self.friend.id, 'message': '不是好友'})
+
+            # 取消通过：缓存的好友校验同样失效
+            await database_sync_to_async(unfriend)(unapprove)
+            await me.send_json_to({'type': 'message', 'friend_id': self.other.id, 'content': '还在吗'})
+            self.assertEqual((await me.receive_json_from())['message'], '不是好友')
+            for communicator in (me, friend):
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertFalse(ChatMessage.objects.filter(content='还在吗').exists())
+
+    def test_rejects_invalid_token(self):
+        async def scenario():
+            communicator = WebsocketClient(URLRouter([path('ws/chat/', UserChatConsumer.as_asgi())]),
+                                           '/ws/chat/?token=invalid')
+            self.assertFalse(await communicator.connect())
+
+        async_to_sync(scenario)()
+
+
+class UserStatsTests(QueryBudgetTestMixin, TestCase):
+    """用户统计随博客/互动写入增量维护，与按明细表重算的结果一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='stats_author', email='stats_author@test.com', password='pass123456')
+        cls.reader = User.objects.create_user(username='stats_reader', email='stats_reader@test.com', password='pass123456')
+        cls.blogs = [
+            Blog.objects.create(title=f'统计 {i}', content='内容', author=cls.author, status='published', is_public=True)
+            for i in range(3)
+        ]
+        cls.draft = Blog.objects.create(title='草稿', content='内容', author=cls.author, status='draft', is_public=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def assertStatsAccurate(self):
+        self.assertEqual(stats.get(self.author.id), stats.compute([self.author.id])[self.author.id])
+
+    def test_incremental_updates(self):
+        self.login(self.reader)
+        for blog in self.blogs[:2]:
+            self.client.post(f'/api/blogs/{blog.id}/like/')
+            self.client.post(f'/api/blogs/{blog.id}/share/')
+            self.client.post(f'/api/blogs/{blog.id}/comment/add/', {'blog_id': blog.id, 'content': '评论'})
+        self.client.post(f'/api/blogs/{self.blogs[1].id}/like/')  # 取消点赞
+        self.assertStatsAccurate()
+        self.assertEqual(stats.get(self.author.id)['likes_received'], 1)
+
+        self.login(self.author)
+        self.client.patch(f'/api/blogs/{self.draft.id}/publish/')
+        self.client.post('/api/blogs/bulk/unpublish/', {'ids': [self.blogs[2].id]}, format='json')
+        self.client.delete(f'/api/blogs/{self.blogs[1].id}/')
+        self.assertStatsAccurate()
+        self.assertEqual(stats.get(self.author.id)['blog_count'], 3)
+        self.assertEqual(stats.get(self.author.id)['published_count'], 2)
+
+    def test_userinfo_reads_stats(self):
+        UserStats.objects.all().delete()
+        # 统计行缺失时，下一次增量会先按明细表重算
+        stats.incr(self.author.id, view_count=5)
+        self.assertEqual(stats.get(self.author.id)['blog_count'], 4)
+        self.assertEqual(stats.get(self.author.id)['view_count'], 0)
+        stats.incr(self.author.id, view_count=5)
+
+        self.login(self.author)
+        with self.assertQueryBudget('api_userinfo'):
+            response = self.client.get('/userinfo/')
+        data = response.data['data']
+        self.assertEqual((data['article_count'], data['published_count'], data['view_count']), (4, 3, 5))
+
+    def test_rebuild_command(self):
+        UserStats.objects.filter(user=self.author).update(blog_count=0, published_count=0)
+        call_command('rebuild_user_stats', batch_size=1, stdout=StringIO())
+        self.assertStatsAccurate()
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
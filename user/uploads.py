@@ -0,0 +1,213 @@
+# user/uploads.py
+"""
+可续传的分片上传
+
+流程：
+1. init：声明文件名与总大小，创建上传会话（ChunkedUpload），返回 upload_id
+2. PUT 分片：请求体为原始字节，?offset= 必须等于服务端已接收的字节数；
+   分片先按 64KB 块流式写入单独的分片文件（不持有行锁和事务，慢客户端不会占住数据库连接），
+   收完后再加行锁、校验 offset，把分片拷进临时文件并提交进度；内存占用与文件大小无关；
+   断线后先查询会话拿到 offset，从该位置继续上传即可
+3. finalize：校验大小、扩展名（ALLOWED_UPLOAD_EXTENSIONS / MAX_UPLOAD_SIZE）并确认是有效图片
+4. 头像 / 博客封面接口通过 upload_id 引用已完成的文件，保存成功后删除会话与临时文件
+
+过期未完成的会话由定时任务 cleanup_chunked_uploads 清理
+"""
+import logging
+import mimetypes
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+
+from .models import ChunkedUpload
+
+logger = logging.getLogger(__name__)
+
+# 每次从请求体读取、写入磁盘的块大小
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """分片上传业务错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 2 * 1024 * 1024)
+
+
+def extension_of(filename):
+    return os.path.splitext(filename)[1][1:].lower()
+
+
+def check_limits(filename, size):
+    """校验扩展名与大小限制（init 时按声明值校验，finalize 时按实际值再校验一次）"""
+    if extension_of(filename) not in settings.ALLOWED_UPLOAD_EXTENSIONS:
+        raise UploadError(f'不支持的图片格式！仅支持 {", ".join(settings.ALLOWED_UPLOAD_EXTENSIONS)}')
+    if size > settings.MAX_UPLOAD_SIZE:
+        raise UploadError(f'图片大小不能超过 {settings.MAX_UPLOAD_SIZE // 1024 // 1024}MB')
+
+
+def create(user, filename, size):
+    check_limits(filename, size)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    upload = ChunkedUpload.objects.create(user=user, filename=os.path.basename(filename), size=size)
+    # 先建空文件，后续分片以 r+b 打开按偏移写入
+    open(upload.temp_path, 'wb').close()
+    return upload
+
+
+def _get_for_update(user, upload_id):
+    try:
+        return ChunkedUpload.objects.select_for_update().get(pk=upload_id, user=user)
+    except (ChunkedUpload.DoesNotExist, DjangoValidationError, ValueError):
+        raise UploadError('上传会话不存在或已过期', status.HTTP_404_NOT_FOUND)
+
+
+def _check_appendable(upload, offset, length):
+    if upload.status != 'uploading':
+        raise UploadError('上传已完成，不能再追加分片', status.HTTP_409_CONFLICT, upload.offset)
+    if offset != upload.offset:
+        raise UploadError('分片偏移量与已上传进度不一致', status.HTTP_409_CONFLICT, upload.offset)
+    if offset + length > upload.size:
+        raise UploadError('分片超出声明的文件大小', status.HTTP_400_BAD_REQUEST, upload.offset)
+
+
+def _receive(stream, length, path):
+    """把请求体流式写到 path，返回实际收到的字节数（连接中断时少于 length）"""
+    received = 0
+    with open(path, 'wb') as file:
+        while received < length:
+            block = stream.read(min(COPY_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            file.write(block)
+            received += len(block)
+    return received
+
+
+def append_chunk(user, upload_id, offset, stream, length):
+    """
+    把请求体中的一个分片写到临时文件的 offset 处，返回更新后的会话
+    offset 与服务端记录不一致时返回 409 并带上服务端 offset，客户端据此续传
+    读取请求体期间不持有锁：先收到单独的分片文件，再加锁校验并拷入临时文件
+    """
+    if length <= 0:
+        raise UploadError('分片内容不能为空')
+    if length > max_chunk_size():
+        raise UploadError(f'单个分片不能超过 {max_chunk_size()} 字节', status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # 不加锁的预检查：明显过期的分片不必接收请求体
+    try:
+        upload = ChunkedUpload.objects.get(pk=upload_id, user=user)
+    except (ChunkedUpload.DoesNotExist, DjangoValidationError, ValueError):
+        raise UploadError('上传会话不存在或已过期', status.HTTP_404_NOT_FOUND)
+    _check_appendable(upload, offset, length)
+
+    part_path = f'{upload.temp_path}.{uuid.uuid4().hex}.part'
+    try:
+        received = _receive(stream, length, part_path)
+        # 行锁保证同一会话的分片串行提交；接收期间其它请求可能已提交同一 offset，需要重新校验
+        with transaction.atomic():
+            upload = _get_for_update(user, upload_id)
+            _check_appendable(upload, offset, received)
+            with open(upload.temp_path, 'r+b') as file, open(part_path, 'rb') as part:
+                file.seek(offset)
+                shutil.copyfileobj(part, file, COPY_BLOCK_SIZE)
+                # 截掉上次失败写入可能残留的尾部数据
+                file.truncate(offset + received)
+            # 连接中断：已收到的部分照常记录，客户端从新的 offset 续传
+            upload.offset = offset + received
+            upload.save(update_fields=['offset', 'updated_at'])
+    finally:
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+    return upload
+
+
+def finalize(user, upload_id):
+    """确认所有字节已接收并校验文件，通过后标记为已完成"""
+    with transaction.atomic():
+        upload = _get_for_update(user, upload_id)
+        if upload.status == 'complete':
+            return upload
+        if upload.offset != upload.size:
+            raise UploadError('文件尚未上传完整', status.HTTP_409_CONFLICT, upload.offset)
+
+        actual_size = os.path.getsize(upload.temp_path) if os.path.exists(upload.temp_path) else -1
+        if actual_size != upload.size:
+            raise UploadError('临时文件已丢失或不完整，请重新上传', status.HTTP_409_CONFLICT, 0)
+        check_limits(upload.filename, actual_size)
+        try:
+            with Image.open(upload.temp_path) as image:
+                image.verify()
+        except Exception:
+            raise UploadError('文件不是有效的图片')
+
+        upload.status = 'complete'
+        upload.save(update_fields=['status', 'updated_at'])
+    return upload
+
+
+def get_completed(user, upload_id):
+    try:
+        upload = ChunkedUpload.objects.get(pk=upload_id, user=user)
+    except (ChunkedUpload.DoesNotExist, DjangoValidationError, ValueError):
+        raise UploadError('上传会话不存在或已过期', status.HTTP_404_NOT_FOUND)
+    if upload.status != 'complete':
+        raise UploadError('文件尚未完成上传（请先调用 finalize）', status.HTTP_409_CONFLICT, upload.offset)
+    return upload
+
+
+def open_file(upload):
+    """以 UploadedFile 形式打开已完成的临时文件，可直接赋给 ImageField / 交给序列化器"""
+    content_type = mimetypes.guess_type(upload.filename)[0] or 'application/octet-stream'
+    return UploadedFile(open(upload.temp_path, 'rb'), name=upload.filename, content_type=content_type, size=upload.size)
+
+
+@contextmanager
+def attach(user, upload_id):
+    """打开已完成上传的文件供保存；调用方保存成功后再调用 discard() 删除会话"""
+    file = open_file(get_completed(user, upload_id))
+    try:
+        yield file
+    finally:
+        file.close()
+
+
+def discard(upload_or_id):
+    """删除上传会话及其临时文件"""
+    upload = upload_or_id if isinstance(upload_or_id, ChunkedUpload) else ChunkedUpload.objects.filter(pk=upload_or_id).first()
+    if upload is None:
+        return
+    try:
+        os.remove(upload.temp_path)
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def cleanup_expired():
+    """删除超过 CHUNKED_UPLOAD_EXPIRE_HOURS 未更新的会话（含已完成但未被引用的），返回删除数"""
+    expire_at = timezone.now() - timedelta(hours=getattr(settings, 'CHUNKED_UPLOAD_EXPIRE_HOURS', 24))
+    removed = 0
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=expire_at).iterator():
+        discard(upload)
+        removed += 1
+    return removed
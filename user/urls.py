@@ -5,7 +5,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     FriendListView, ChatMessageView, SendMessageView,
     MarkAsReadView, UnreadCountView, SendFriendRequestView, MyFriendRequestsView, HandleFriendRequestView,
-    CancelFriendRequestView, DeleteFriendView, UserPublicDetailView, HeartbeatView, PendingRequestCountView
+    CancelFriendRequestView, DeleteFriendView, UserPublicDetailView, HeartbeatView, PendingRequestCountView,
+    ChunkedUploadInitView, ChunkedUploadView, ChunkedUploadFinalizeView
 )
 
 urlpatterns = [
@@ -24,6 +25,10 @@ urlpatterns = [
     path('users/<int:id>/', UserPublicDetailView.as_view(), name='user-public-detail'),
     path('chat/heartbeat/', HeartbeatView.as_view(), name='heartbeat'),
     path('chat/pending-request-count/', PendingRequestCountView.as_view(), name='pending-request-count'),
+    # 分片上传（头像/博客封面）：创建会话 → PUT 分片 → finalize
+    path('uploads/', ChunkedUploadInitView.as_view(), name='chunked-upload-init'),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadView.as_view(), name='chunked-upload-detail'),
+    path('uploads/<uuid:upload_id>/finalize/', ChunkedUploadFinalizeView.as_view(), name='chunked-upload-finalize'),
 ]
 
 
@@ -16,12 +16,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics, serializers
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from .serializers import AvatarUploadSerializer
+from .serializers import AvatarUploadSerializer, ChunkedUploadInitSerializer
+from . import badges, chat, conversations, uploads
 from .serializers import  FriendSerializer, HandleFriendRequestSerializer, \
     FriendRequestSerializer, SendFriendRequestSerializer  # 你的自定义用户模型
 import logging
-from .models import User
+from .models import ChunkedUpload, User
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest, Least
 # 配置日志（方便调试）
 logger = logging.getLogger(__name__)
 class LoginView(APIView):
@@ -147,9 +149,23 @@ class AvatarUploadView(APIView):
             }, status=status.HTTP_401_UNAUTHORIZED)
 
         user = request.user
+        # 通过分片上传接口上传完成的文件：传 upload_id 引用，不再走 multipart
+        upload_id = request.data.get('upload_id')
+        if upload_id:
+            try:
+                with uploads.attach(user, upload_id) as file:
+                    response = self._save_avatar(request, user, {'avatar': file})
+            except uploads.UploadError as e:
+                return upload_error_response(e)
+            if response.status_code == status.HTTP_200_OK:
+                uploads.discard(upload_id)
+            return response
+        return self._save_avatar(request, user, request.data)
+
+    def _save_avatar(self, request, user, data):
         serializer = AvatarUploadSerializer(
             instance=user,
-            data=request.data,
+            data=data,
             partial=True
         )
 
@@ -172,6 +188,106 @@ class AvatarUploadView(APIView):
 
 
 
+def upload_error_response(error):
+    """分片上传错误的统一响应：data.offset 为服务端已接收的字节数，客户端据此续传"""
+    return Response({
+        'code': error.status_code,
+        'message': str(error),
+        'data': {'offset': error.offset}
+    }, status=error.status_code)
+
+
+def upload_payload(upload):
+    return {
+        'upload_id': str(upload.id),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'chunk_size': uploads.max_chunk_size(),
+    }
+
+
+class ChunkedUploadInitView(APIView):
+    """分片上传：创建上传会话（POST filename + size）"""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ChunkedUploadInitSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'code': 400,
+                'message': '上传参数错误',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = uploads.create(request.user, **serializer.validated_data)
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'code': 200,
+            'message': '上传会话创建成功',
+            'data': upload_payload(upload)
+        }, status=status.HTTP_200_OK)
+
+
+class ChunkedUploadView(APIView):
+    """
+    分片上传：
+    - GET：查询上传进度（断线后取 offset 续传）
+    - PUT ?offset=N：请求体为原始字节，从 offset 处追加一个分片（流式写盘，不经过 multipart 解析）
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        upload = ChunkedUpload.objects.filter(pk=upload_id, user=request.user).first()
+        if upload is None:
+            return upload_error_response(uploads.UploadError('上传会话不存在或已过期', status.HTTP_404_NOT_FOUND))
+        return Response({
+            'code': 200,
+            'message': '获取上传进度成功',
+            'data': upload_payload(upload)
+        }, status=status.HTTP_200_OK)
+
+    def put(self, request, upload_id):
+        try:
+            offset = int(request.query_params.get('offset', request.headers.get('Upload-Offset', '')))
+        except ValueError:
+            return upload_error_response(uploads.UploadError('offset 必须为整数'))
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return upload_error_response(uploads.UploadError('Content-Length 必须为整数'))
+        try:
+            upload = uploads.append_chunk(request.user, upload_id, offset, request.stream, length)
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'code': 200,
+            'message': '分片上传成功',
+            'data': upload_payload(upload)
+        }, status=status.HTTP_200_OK)
+
+
+class ChunkedUploadFinalizeView(APIView):
+    """分片上传：确认上传完成并校验文件（POST），之后可在头像/封面接口中通过 upload_id 引用"""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        try:
+            upload = uploads.finalize(request.user, upload_id)
+        except uploads.UploadError as e:
+            return upload_error_response(e)
+        return Response({
+            'code': 200,
+            'message': '文件上传完成',
+            'data': upload_payload(upload)
+        }, status=status.HTTP_200_OK)
+
+
 class UpdateUserInfoView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -217,11 +333,25 @@ class FriendListView(generics.ListAPIView):
 
     def get_queryset(self):
         current_user = self.request.user
+        # 两人的会话行：按 (user_low, user_high) 唯一索引定位
+        conversation = Conversation.objects.filter(
+            user_low_id=Least(models.OuterRef("user_id"), models.OuterRef("friend_id")),
+            user_high_id=Greatest(models.OuterRef("user_id"), models.OuterRef("friend_id")),
+        )
+        my_unread = models.Case(
+            models.When(user_low_id=current_user.id, then=models.F("unread_low")),
+            default=models.F("unread_high"),
+        )
         # 双向查询：我加别人且通过 / 别人加我且通过（原逻辑不变）
+        # 好友用户、最后一条消息、未读数读自会话表，随同一条 SQL 取回；按最近聊天时间排序
         return Friend.objects.filter(
             models.Q(user=current_user, is_approved=True) |
             models.Q(friend=current_user, is_approved=True)
-        ).order_by("-created_at")
+        ).select_related("user", "friend").annotate(
+            last_message_content=models.Subquery(conversation.values("last_message_preview")[:1]),
+            last_message_send_time=models.Subquery(conversation.values("last_message_at")[:1]),
+            unread_total=Coalesce(models.Subquery(conversation.annotate(mine=my_unread).values("mine")[:1]), 0),
+        ).order_by(models.F("last_message_send_time").desc(nulls_last=True), "-created_at")
 
     # 重写 list 方法：自定义返回格式（带 code 状态码）
     def list(self, request, *args, **kwargs):
@@ -242,7 +372,7 @@ class FriendListView(generics.ListAPIView):
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import ChatMessage, Friend, User  # 导入自定义模型
+from .models import ChatMessage, Conversation, Friend, User  # 导入自定义模型
 from django.utils import timezone
 
 class ChatMessageView(APIView):
@@ -253,49 +383,56 @@ class ChatMessageView(APIView):
     # 需登录验证
 
     def get(self, request):
-        # 1. 提取并验证 friend_id 参数
-        friend_id = request.query_params.get('friend_id')
-        if not friend_id:
+        """
+        聊天记录（按时间升序），游标分页：
+        - 不带游标：最新一页；before_id=<消息id>：更早的一页；after_id=<消息id>：更新的一页
+        - page_size 默认 CHAT_HISTORY_PAGE_SIZE，最大 CHAT_HISTORY_MAX_PAGE_SIZE
+        - 返回的 before_id / after_id 可直接用于继续向前 / 向后翻页，has_more 表示请求方向上还有消息
+        """
+        # 1. 提取并验证 friend_id 参数与游标
+        params = {}
+        for name in ('friend_id', 'before_id', 'after_id'):
+            value = request.query_params.get(name)
+            if value in (None, ''):
+                continue
+            try:
+                params[name] = int(value)
+            except ValueError:
+                return Response({'error': f'{name} 必须为整数'}, status=400)
+        friend_id = params.get('friend_id')
+        if friend_id is None:
             return Response({'error': 'friend_id 为必填参数'}, status=400)
-        try:
-            friend_id = int(friend_id)
-        except ValueError:
-            return Response({'error': 'friend_id 必须为整数'}, status=400)
+        if 'before_id' in params and 'after_id' in params:
+            return Response({'error': 'before_id 与 after_id 不能同时使用'}, status=400)
 
         # 2. 验证「双向好友关系且已通过」
         try:
             # 条件：当前用户是申请人且好友是被申请人，或当前用户是被申请人且好友是申请人，且状态为已通过
-            friend_relation = Friend.objects.get(
+            friend_relation = Friend.objects.select_related('user', 'friend').get(
                 (Q(user=request.user, friend_id=friend_id) | Q(friend=request.user, user_id=friend_id)),
                 is_approved=True
             )
         except Friend.DoesNotExist:
             return Response({'error': '好友关系不存在或未通过'}, status=403)
 
-        # 3. 查询历史消息（双向：当前用户→好友 / 好友→当前用户）
-        messages = ChatMessage.objects.filter(
-            (Q(sender=request.user, receiver_id=friend_id) |  # 当前用户发好友
-             Q(sender_id=friend_id, receiver=request.user))   # 好友发当前用户
-        ).order_by('send_time')  # 按时间升序
+        # 3. 查询一页历史消息（双向：当前用户→好友 / 好友→当前用户），一条 SQL
+        rows, has_more = chat.history(
+            request.user.id, friend_id,
+            before_id=params.get('before_id'), after_id=params.get('after_id'),
+            limit=request.query_params.get('page_size'),
+        )
 
-        # 4. 序列化消息
-        message_list = []
-        for msg in messages:
-            message_list.append(
-                {
-                'id': msg.id,
-                'sender_id': msg.sender.id,
-                'sender_name': msg.sender.username,
-                'receiver_id': msg.receiver.id,
-                'content': msg.content,
-                'send_time': msg.send_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'is_read': msg.is_read
-            })
+        # 4. 序列化消息（发送者昵称取自好友关系的双方，不再逐条关联用户表）
+        names = {user.id: user.username for user in (friend_relation.user, friend_relation.friend)}
+        message_list = chat.serialize(rows, names)
 
         return Response({
             "code": 200,  # 成功标识
             "message": "获取历史消息成功",
-            "data": message_list  # 消息列表数据
+            "data": message_list,  # 消息列表数据（时间升序）
+            "has_more": has_more,
+            "before_id": message_list[0]['id'] if message_list else None,
+            "after_id": message_list[-1]['id'] if message_list else None,
         })
 
 class SendMessageView(generics.CreateAPIView):
@@ -312,7 +449,7 @@ class SendMessageView(generics.CreateAPIView):
         current_user = request.user
 
         try:
-            friend = Friend.objects.get(
+            friend = Friend.objects.select_related("friend").get(
                 user=current_user, friend_id=friend_id, is_approved=True
             )
         except Friend.DoesNotExist:
@@ -321,11 +458,9 @@ class SendMessageView(generics.CreateAPIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        chat_message = ChatMessage.objects.create(
-            sender=current_user,
-            receiver=friend.friend,
-            content=content
-        )
+        # 消息与会话（最后一条消息、对方未读数）在同一事务中写入
+        chat_message = conversations.send(current_user, friend.friend_id, content)
+        chat_message.receiver = friend.friend  # 序列化头像时不再查询接收者
 
         return Response(
             ChatMessageSerializer(chat_message).data,
@@ -336,6 +471,7 @@ class SendMessageView(generics.CreateAPIView):
 class MarkAsReadView(generics.CreateAPIView):
     """标记消息为已读接口"""
     permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
     serializer_class = MarkAsReadSerializer
 
     def create(self, request, *args, **kwargs):
@@ -345,11 +481,8 @@ class MarkAsReadView(generics.CreateAPIView):
         friend_id = serializer.validated_data["friend_id"]
         current_user = request.user
 
-        ChatMessage.objects.filter(
-            sender_id=friend_id,
-            receiver=current_user,
-            is_read=False
-        ).update(is_read=True)
+        # 消息置为已读，并清零会话上自己一侧的未读数
+        conversations.mark_read(current_user.id, friend_id)
 
         return Response({"message": "标记已读成功"})
 
@@ -357,11 +490,11 @@ class MarkAsReadView(generics.CreateAPIView):
 class UnreadCountView(generics.RetrieveAPIView):
     """获取未读消息总数接口"""
     permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
 
     def retrieve(self, request, *args, **kwargs):
-        total_unread = ChatMessage.objects.filter(
-            receiver=request.user, is_read=False
-        ).count()
+        # 角标计数存储 O(1) 读取，不再 COUNT(*)
+        total_unread = badges.get(request.user.id, badges.UNREAD)
         return Response({"total_unread": total_unread})
 
 from rest_framework.response import Response
@@ -430,7 +563,7 @@ class MyFriendRequestsView(generics.ListAPIView):
         return Friend.objects.filter(
             friend=self.request.user,
             is_approved=False
-        ).order_by("-created_at")
+        ).select_related("user").order_by("-created_at")
 
     def list(self, request, *args, **kwargs):
         """重写list方法，添加code编码"""
@@ -638,14 +771,8 @@ class PendingRequestCountView(APIView):
 
     def get(self, request):
         try:
-            # 核心修正：
-            # 1. 用Friend模型查询（而非User模型）
-            # 2. friend=request.user 表示「当前用户是被申请人」
-            # 3. is_approved=False 表示「未审核的申请」
-            pending_count = Friend.objects.filter(
-                friend=request.user,  # 当前用户是被申请人（收到申请）
-                is_approved=False  # 未通过审核的申请（未处理）
-            ).count()
+            # 当前用户作为被申请人、尚未处理的申请数（Friend 信号维护，存储中没有时按数据库计数）
+            pending_count = badges.get(request.user.id, badges.REQUESTS)
 
             return Response({"count": pending_count}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -0,0 +1,316 @@
+# user/writebehind.py
+"""
+聊天消息写后（write-behind）模式：CHAT_WRITE_BEHIND = True 时 ChatConsumer 不再逐条 INSERT
+
+- 收到消息：先用雪花 id 确定主键与发送时间，追加一行到本地日志（journal），然后立即广播，不等数据库；
+  写日志、fsync、切分段、删除分段与启动时扫描遗留日志都在单独的日志线程中执行，不阻塞事件循环
+- 雪花 id 的节点号必须显式配置（CHAT_SNOWFLAKE_NODE_ID，每个进程不同），未配置时拒绝开启写后模式
+- 落库：进程内缓冲每 CHAT_WRITE_BEHIND_INTERVAL_MS 毫秒或攒满 CHAT_WRITE_BEHIND_BATCH 条时，
+  用一次 bulk_create 写入（同一事务中更新会话表与未读角标，见 ChatMessageManager.bulk_create）
+- 日志：每次落库前把当前日志文件切成一个分段，落库成功后删除对应分段；进程崩溃时未删除的分段即未落库的消息。
+  新进程启动后第一次落库时接管已退出进程留下的日志一并写入；写入时 id 已存在且发送者、接收者、内容相同的视为
+  重复回放并跳过，内容不同（id 冲突）时换一个新 id 写入，不丢消息
+- 关闭：进程正常退出（atexit）时同步写完缓冲；也可以在服务停止后执行 replay_chat_journal 命令回放
+- 代价：消息在落库前（最多一个间隔）查不到历史记录、会话预览与未读角标；日志默认只 flush 到操作系统，
+  能扛住进程崩溃，需要扛住断电时打开 CHAT_WRITE_BEHIND_FSYNC
+- 开启后 SendMessageView 等同步写入同样使用雪花 id，避免与自增主键交错（MySQL 显式插入大 id 后自增值会跟着跳）
+"""
+import asyncio
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utils.snowflake import Snowflake
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+_snowflake = None
+_buffer = None
+_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'CHAT_WRITE_BEHIND', False)
+
+
+def journal_dir():
+    return getattr(settings, 'CHAT_WRITE_BEHIND_JOURNAL_DIR', os.path.join(settings.BASE_DIR, 'chat_journal'))
+
+
+def node_id():
+    """本进程的雪花 id 节点号；未配置时报错（按进程号推算在多个 worker 之间可能重复，产生相同的 id）"""
+    value = getattr(settings, 'CHAT_SNOWFLAKE_NODE_ID', None)
+    if value is None:
+        raise ImproperlyConfigured("开启 CHAT_WRITE_BEHIND 前须为每个进程配置不同的 CHAT_SNOWFLAKE_NODE_ID（0~1023）")
+    return int(value)
+
+
+def next_id():
+    global _snowflake
+    node = node_id()
+    if _snowflake is None or _snowflake.node_id != node:
+        with _lock:
+            if _snowflake is None or _snowflake.node_id != node:
+                _snowflake = Snowflake(node)
+    return _snowflake.next_id()
+
+
+def write_batch(entries):
+    """
+    把日志条目写入数据库，返回实际写入的条数：
+    id 已存在（库中或同一批中）且发送者、接收者、内容都相同的是重复回放，跳过；
+    内容不同说明 id 冲突，换一个新 id 写入
+    """
+    entries = sorted(entries, key=lambda entry: entry['id'])
+    if not entries:
+        return 0
+    with transaction.atomic():
+        seen = {
+            pk: (sender_id, receiver_id, content)
+            for pk, sender_id, receiver_id, content in ChatMessage.objects.filter(pk__in={entry['id'] for entry in entries})
+            .order_by().values_list('pk', 'sender_id', 'receiver_id', 'content')
+        }
+        messages = []
+        for entry in entries:
+            pk, identity = entry['id'], (entry['sender_id'], entry['receiver_id'], entry['content'])
+            if pk in seen:
+                if seen[pk] == identity:
+                    continue
+                pk = next_id()
+                logger.warning("聊天消息 id %s 冲突（内容不同），改用新 id %s 写入", entry['id'], pk)
+            seen[pk] = identity
+            messages.append(ChatMessage(
+                id=pk, sender_id=entry['sender_id'], receiver_id=entry['receiver_id'],
+                content=entry['content'], send_time=entry['send_time'], is_read=False,
+            ))
+        if messages:
+            ChatMessage.objects.bulk_create(messages)
+    return len(messages)
+
+
+def read_journal(path):
+    """读取日志文件；进程崩溃时最后一行可能只写了一半，跳过"""
+    entries = []
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+                entry['send_time'] = parse_datetime(entry['send_time'])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("跳过不完整的聊天日志行：%s", path)
+                continue
+            entries.append(entry)
+    return entries
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def orphan_journals(directory=None, include_live=False):
+    """已退出进程留下的日志文件（文件名 <pid>-<序号>.jsonl）"""
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory or journal_dir(), '*.jsonl'))):
+        try:
+            pid = int(os.path.basename(path).split('-', 1)[0])
+        except ValueError:
+            continue
+        if include_live or pid == os.getpid() or not _pid_alive(pid):
+            paths.append(path)
+    return paths
+
+
+class MessageBuffer:
+    """
+    进程内的写后缓冲：事件循环中调用 add_async()，日志读写在单线程的日志线程中按顺序执行，
+    落库在数据库线程池中执行；add() / flush_sync() 供同步代码调用
+    """
+
+    def __init__(self, directory=None, interval_ms=None, batch_size=None, fsync=None):
+        self.directory = directory or journal_dir()
+        self.interval = (interval_ms or getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL_MS', 200)) / 1000
+        self.batch_size = batch_size or getattr(settings, 'CHAT_WRITE_BEHIND_BATCH', 100)
+        self.fsync = getattr(settings, 'CHAT_WRITE_BEHIND_FSYNC', False) if fsync is None else fsync
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._segments = []  # 已切出、内容尚未全部落库的日志分段
+        self._seq = 0
+        self._journal = None
+        self._timer = None
+        self._flushing = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-journal')
+        # 接管已退出进程（含上一次运行的本进程）留下的日志，随第一次落库写入
+        for path in orphan_journals(self.directory):
+            self._pending.extend(read_journal(path))
+            self._segments.append(path)
+
+    # ---------- 日志 ----------
+    def _journal_path(self):
+        return os.path.join(self.directory, f"{os.getpid()}-{self._seq:08d}.jsonl")
+
+    def _append(self, entry):
+        if self._journal is None:
+            self._seq += 1
+            self._journal = open(self._journal_path(), 'a', encoding='utf-8')
+        line = json.dumps({**entry, 'send_time': entry['send_time'].isoformat()}, ensure_ascii=False)
+        self._journal.write(line + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _take(self):
+        """取出全部待写消息并切出当前日志分段，返回 (entries, segments)"""
+        with self._lock:
+            if self._journal is not None:
+                self._segments.append(self._journal.name)
+                self._journal.close()
+                self._journal = None
+            entries, self._pending = self._pending, []
+            segments, self._segments = self._segments, []
+            return entries, segments
+
+    def _done(self, segments):
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _restore(self, entries, segments):
+        # 落库失败：消息放回缓冲头部，分段保留在磁盘上，下次重试
+        with self._lock:
+            self._pending[:0] = entries
+            self._segments[:0] = segments
+
+    # ---------- 写入 ----------
+    def _record(self, sender_id, receiver_id, content):
+        """写日志并加入缓冲，返回 (消息, 是否攒满一批)"""
+        entry = {
+            'id': next_id(),
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'content': content,
+            'send_time': timezone.now(),
+        }
+        with self._lock:
+            self._append(entry)
+            self._pending.append(entry)
+            return entry, len(self._pending) >= self.batch_size
+
+    def add(self, sender_id, receiver_id, content):
+        """同步登记一条消息并返回其内容（含 id 与发送时间），调用方随即广播"""
+        entry, full = self._record(sender_id, receiver_id, content)
+        self._schedule(0 if full else self.interval)
+        return entry
+
+    async def add_async(self, sender_id, receiver_id, content):
+        """在事件循环中登记一条消息：写日志（及 fsync）在日志线程中执行"""
+        loop = asyncio.get_running_loop()
+        entry, full = await loop.run_in_executor(self._writer, self._record, sender_id, receiver_id, content)
+        self._schedule(0 if full else self.interval)
+        return entry
+
+    def _schedule(self, delay):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 不在事件循环中（同步调用）：由 flush_sync() 或退出时写入
+        if delay == 0:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._flushing is None or self._flushing.done():
+                self._flushing = loop.create_task(self.flush())
+        elif self._timer is None:
+            self._timer = loop.call_later(delay, self._on_timer, loop)
+
+    def _on_timer(self, loop):
+        self._timer = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = loop.create_task(self.flush())
+        else:
+            # 上一批还在写：等它结束后再触发
+            self._timer = loop.call_later(self.interval, self._on_timer, loop)
+
+    async def flush(self):
+        loop = asyncio.get_running_loop()
+        entries, segments = await loop.run_in_executor(self._writer, self._take)
+        if not entries:
+            await loop.run_in_executor(self._writer, self._done, segments)
+            return 0
+        try:
+            written = await database_sync_to_async(write_batch)(entries)
+        except Exception:
+            logger.exception("聊天消息批量落库失败，%s 条消息保留在缓冲与日志中", len(entries))
+            self._restore(entries, segments)
+            self._schedule(self.interval)
+            return 0
+        await loop.run_in_executor(self._writer, self._done, segments)
+        with self._lock:
+            remaining = len(self._pending)
+        if remaining:
+            self._schedule(0 if remaining >= self.batch_size else self.interval)
+        return written
+
+    def flush_sync(self):
+        """同步写完缓冲（进程退出、测试、命令行调用）"""
+        entries, segments = self._take()
+        try:
+            written = write_batch(entries)
+        except Exception:
+            logger.exception("退出时聊天消息落库失败，%s 条消息保留在日志中", len(entries))
+            self._restore(entries, segments)
+            return 0
+        self._done(segments)
+        return written
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def get_buffer():
+    """本进程的写后缓冲（首次调用时检查节点号、扫描遗留日志创建，并注册退出时落库）"""
+    global _buffer
+    if _buffer is None:
+        node_id()
+        with _lock:
+            if _buffer is None:
+                _buffer = MessageBuffer()
+                atexit.register(_buffer.flush_sync)
+    return _buffer
+
+
+async def submit(sender_id, receiver_id, content):
+    """事件循环中登记一条消息；首次创建缓冲（扫描、读取遗留日志）也放到线程中执行"""
+    buffer = _buffer or await asyncio.get_running_loop().run_in_executor(None, get_buffer)
+    return await buffer.add_async(sender_id, receiver_id, content)
+
+
+def replay(directory=None):
+    """回放日志目录中的全部日志（服务停止后执行），返回 (文件数, 写入条数)"""
+    paths = orphan_journals(directory, include_live=True)
+    written = 0
+    for path in paths:
+        written += write_batch(read_journal(path))
+        os.remove(path)
+    return len(paths), written
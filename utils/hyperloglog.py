@@ -0,0 +1,70 @@
+# utils/hyperloglog.py
+"""
+HyperLogLog 基数估计（估算去重后的访客数）
+
+- 2^p 个 6 位寄存器（这里用 uint8 存），p=10 时占 1KB，标准误差约 1.04/√1024 ≈ 3.3%
+- 哈希：blake2b 取 64 位；高 p 位选寄存器，其余位的前导零个数 + 1 更新寄存器最大值
+- 合并：逐个寄存器取最大值（可交换、可结合，多个进程/多天的草图可以任意顺序合并）
+- 序列化：zlib 压缩后的寄存器字节，访客少时寄存器大多为 0，压缩后只有几十字节
+"""
+import hashlib
+import math
+import zlib
+
+import numpy as np
+
+DEFAULT_PRECISION = 10
+
+
+class HyperLogLog:
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision 取值范围为 4~16")
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = np.zeros(self.size, dtype=np.uint8) if registers is None else registers
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rest = hashed & ((1 << remaining_bits) - 1)
+        # 剩余位中第一个 1 的位置（全 0 时为 remaining_bits + 1）
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("精度不同的草图不能合并")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = self.size
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # 小基数修正：线性计数
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes([self.precision]) + zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        data = bytes(data)
+        registers = np.frombuffer(zlib.decompress(data[1:]), dtype=np.uint8).copy()
+        return cls(precision=data[0], registers=registers)
+
+    @classmethod
+    def union(cls, sketches, precision=DEFAULT_PRECISION):
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
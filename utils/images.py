@@ -0,0 +1,74 @@
+# utils/images.py
+"""
+图片处理工具（Pillow）：读取上传图片、按宽度缩放、重新编码为 WebP / JPEG
+
+- 先按 EXIF 方向转正，再重新编码；编码时不写入 EXIF / ICC 等元数据（去掉 GPS、设备信息）
+- 动图（GIF）只取第一帧
+- 按宽度缩放时不放大：目标宽度大于原图宽度时按原图宽度输出
+- 头像等方图：先居中裁成正方形，再缩放到目标边长
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# 各格式的 Pillow 编码参数与文件扩展名
+FORMATS = {
+    'webp': {'format': 'WEBP', 'ext': 'webp', 'content_type': 'image/webp'},
+    'jpeg': {'format': 'JPEG', 'ext': 'jpg', 'content_type': 'image/jpeg'},
+}
+
+
+def open_image(file):
+    """读取图片并按 EXIF 方向转正，返回 (已加载到内存的 Image, (宽, 高))"""
+    with Image.open(file) as image:
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    return image, image.size
+
+
+def resize_to_width(image, width):
+    """等比缩放到指定宽度（不放大）"""
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def center_crop_square(image):
+    """居中裁剪为正方形（边长取宽高中较小者）"""
+    side = min(image.size)
+    left = (image.width - side) // 2
+    top = (image.height - side) // 2
+    return image.crop((left, top, left + side, top + side))
+
+
+def resize_square(image, size):
+    """把正方形图片缩放到 size x size（小图会被放大，保证各尺寸版本都是目标尺寸）"""
+    return image.resize((size, size), Image.LANCZOS) if image.width != size else image
+
+
+def _prepare_mode(image, fmt):
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if fmt == 'jpeg':
+        if has_alpha:
+            # JPEG 不支持透明通道：铺白底
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB') if image.mode != 'RGB' else image
+    return image.convert('RGBA' if has_alpha else 'RGB') if image.mode not in ('RGB', 'RGBA') else image
+
+
+def encode(image, fmt, quality):
+    """把图片编码为指定格式（'webp' / 'jpeg'）的字节串，不携带任何元数据"""
+    image = _prepare_mode(image, fmt)
+    buffer = BytesIO()
+    options = {'quality': quality}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=6)
+    image.save(buffer, FORMATS[fmt]['format'], **options)
+    return buffer.getvalue()
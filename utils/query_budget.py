@@ -0,0 +1,159 @@
+# utils/query_budget.py
+"""
+按请求统计 SQL 查询数 + N+1 检测
+
+- QueryBudgetMiddleware：统计每个请求执行的查询数，超出 settings.QUERY_BUDGETS 中为该路由
+  （URL name，可按 HTTP 方法分别声明）的预算、或同一形状的查询重复出现（疑似 N+1）时记录告警日志；
+  QUERY_BUDGET_STRICT 打开时改为抛出 QueryBudgetExceeded；
+  DEBUG 下在响应头中返回 X-Query-Count / X-Query-Budget
+- QueryBudgetTestRunner：测试运行器，打开 QUERY_BUDGET_STRICT，测试中任何请求超预算都会失败
+  （不只是包在 assertQueryBudget 里的请求）
+- QueryBudgetTestMixin：测试用断言，超出预算或出现 N+1 直接让测试失败，把回归拦在 CI
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+# 事务控制语句不计入预算，也不参与 N+1 判断（测试在外层事务中运行，atomic() 变成保存点，与线上条数不一致）
+_IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """严格模式下请求超出查询预算或疑似 N+1"""
+
+
+def normalize_sql(sql):
+    """把 SQL 中的字面量替换为 ?，得到查询"形状"（参数不同但结构相同的查询形状一致）"""
+    shape = _STRING_RE.sub('?', sql).replace('%s', '?')
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def counted(sqls):
+    """去掉事务控制语句后的查询（预算按这些计数）"""
+    return [sql for sql in sqls if not sql.lstrip().upper().startswith(_IGNORED_PREFIXES)]
+
+
+def get_budget(url_name, method=None):
+    """
+    返回路由声明的查询预算，未声明时返回 None
+    预算可以是一个数（各方法共用），也可以是 {方法: 预算}：HEAD 沿用 GET，
+    未列出的方法（以及 method 为 None）取其中最小的预算，不会因为漏写而放宽
+    """
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+    if not isinstance(budget, dict):
+        return budget
+    method = (method or '').upper()
+    if method == 'HEAD':
+        method = 'GET'
+    return budget.get(method, min(budget.values()))
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'QUERY_BUDGET_N_PLUS_ONE_THRESHOLD', 3)
+
+
+def find_repeated(sqls, threshold=None):
+    """返回重复次数达到阈值的查询形状：{形状: 次数}"""
+    threshold = threshold or n_plus_one_threshold()
+    shapes = Counter(normalize_sql(sql) for sql in counted(sqls))
+    return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+
+class QueryRecorder:
+    """connection.execute_wrapper 钩子：记录本次请求执行过的 SQL"""
+
+    def __init__(self):
+        self.sqls = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.sqls.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """统计每个请求的查询数，超预算或疑似 N+1 时记录告警"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_budget(url_name, request.method)
+        count = len(counted(recorder.sqls))
+
+        problems = []
+        if budget is not None and count > budget:
+            problems.append(f"查询数超出预算：{request.method} {request.path}（{url_name}）执行了 {count} 条查询，预算 {budget}")
+        for shape, times in find_repeated(recorder.sqls).items():
+            problems.append(f"疑似 N+1 查询：{request.method} {request.path} 中同一形状的查询执行了 {times} 次：{shape}")
+        if problems and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            listing = '\n'.join(f"  {i + 1}. {sql}" for i, sql in enumerate(recorder.sqls))
+            raise QueryBudgetExceeded('\n'.join(problems) + '\n' + listing)
+        for problem in problems:
+            logger.warning(problem)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(count)
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        return response
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """测试运行器：测试期间打开 QUERY_BUDGET_STRICT，经过中间件的请求超预算即抛异常让测试失败"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._saved_strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        settings.QUERY_BUDGET_STRICT = True
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_BUDGET_STRICT = self._saved_strict
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase 混入：
+        with self.assertQueryBudget('blog-list'):
+            self.client.get('/api/blogs/')
+        with self.assertQueryBudget('blog-detail', 'DELETE'):
+            self.client.delete('/api/blogs/1/')
+    查询数超出该路由（该方法）的预算，或同一形状的查询重复达到阈值（N+1）时测试失败
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, url_name, method='GET', connection_alias='default'):
+        budget = get_budget(url_name, method)
+        self.assertIsNotNone(budget, f"路由 {url_name} 没有在 settings.QUERY_BUDGETS 中声明查询预算")
+        with CaptureQueriesContext(connections[connection_alias]) as captured:
+            yield captured
+        sqls = counted(query['sql'] for query in captured.captured_queries)
+        listing = '\n'.join(f"  {i + 1}. {sql}" for i, sql in enumerate(sqls))
+        self.assertLessEqual(
+            len(sqls), budget,
+            f"{method} {url_name} 执行了 {len(sqls)} 条查询，超出预算 {budget}：\n{listing}"
+        )
+        repeated = find_repeated(sqls)
+        self.assertFalse(repeated, f"{url_name} 疑似 N+1 查询：{repeated}\n{listing}")
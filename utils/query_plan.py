@@ -0,0 +1,126 @@
+# utils/query_plan.py
+"""
+查询计划检查工具：获取 QuerySet 或实际执行过的 SQL 的 EXPLAIN 输出，并判断是否退化成全表（全索引）扫描
+
+- SQLite：SCAN <表>（含 SCAN <表> USING [COVERING] INDEX：没有范围条件，按索引顺序读完整张表）
+- MySQL：access_type 为 ALL（全表）或 index（全索引）
+- PostgreSQL：Seq Scan，以及没有 Index Cond 的 Index Scan / Index Only Scan
+只有 SEARCH（按索引键定位 / 范围扫描）才算走了索引，LIMIT 不改变判断；
+不使用部分索引：生产库 MySQL 不支持，迁移会静默跳过（models.W037 不再屏蔽）
+"""
+import json
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+_SQLITE_SCAN_RE = re.compile(r'\bSCAN (\w+)\b')
+_SQLITE_DERIVED_RE = re.compile(r'\b(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+_PG_NODE_RE = re.compile(r'(Seq Scan|Index Only Scan|Index Scan)(?: Backward)?(?: using \w+)? on (\w+)')
+
+
+def explain(queryset):
+    """返回 QuerySet 的执行计划文本（MySQL 用 JSON 格式，便于判断访问类型）"""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'mysql':
+        return queryset.explain(format='json')
+    return queryset.explain()
+
+
+def explain_sql(sql, using='default'):
+    """返回一条已执行 SQL（参数已代入）的执行计划文本"""
+    connection = connections[using]
+    prefix = {
+        'sqlite': 'EXPLAIN QUERY PLAN ',
+        'mysql': 'EXPLAIN FORMAT=JSON ',
+    }.get(connection.vendor, 'EXPLAIN ')
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(str(row[0]) for row in rows)
+
+
+def full_scans(queryset, plan=None, vendor=None):
+    """
+    返回执行计划中被全表 / 全索引扫描的表名列表（为空说明所有表都按索引条件定位）
+    临时 B 树排序、常量行等不算扫描
+    """
+    vendor = vendor or connections[queryset.db].vendor
+    plan = plan if plan is not None else explain(queryset)
+
+    if vendor == 'sqlite':
+        # 子查询 / 窗口函数的中间结果（CO-ROUTINE、MATERIALIZE）按行读出是正常的，不是表
+        derived = set(_SQLITE_DERIVED_RE.findall(plan)) | {'CONSTANT'}
+        return [table for table in _SQLITE_SCAN_RE.findall(plan) if table not in derived]
+    if vendor == 'mysql':
+        tables = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                if node.get('access_type') in ('ALL', 'index'):
+                    tables.append(node.get('table_name', '?'))
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+
+        walk(json.loads(plan))
+        return tables
+    if vendor == 'postgresql':
+        tables = []
+        for node in plan.split('->'):
+            match = _PG_NODE_RE.search(node)
+            if match and (match.group(1) == 'Seq Scan' or 'Index Cond' not in node):
+                tables.append(match.group(2))
+        return tables
+    return []
+
+
+class QueryPlanAssertionsMixin:
+    """TestCase 混入：断言查询计划没有退化成全表扫描，失败时输出完整 EXPLAIN 便于排查"""
+
+    def assertNoFullScan(self, queryset, msg=''):
+        plan = explain(queryset)
+        scanned = full_scans(queryset, plan)
+        self.assertFalse(scanned, f"{msg} 查询退化为全表扫描：{scanned}\n{queryset.query}\n{plan}")
+        return plan
+
+    def assertUsesIndex(self, queryset, *index_names):
+        """断言计划中用到了给定索引之一"""
+        plan = self.assertNoFullScan(queryset)
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f"查询没有使用索引 {index_names}\n{queryset.query}\n{plan}"
+        )
+        return plan
+
+    @contextmanager
+    def assertQueriesUseIndexes(self, *index_names, using='default'):
+        """
+        捕获代码块中实际执行的 SQL（视图、任务、Consumer 的真实查询），逐条 EXPLAIN：
+        任一 SELECT / UPDATE / DELETE 退化成全表 / 全索引扫描即失败；给出 index_names 时，每个索引都必须被至少一条查询用到
+            with self.assertQueriesUseIndexes('blog_public_feed_idx'):
+                self.client.get('/api/blogs/')
+        """
+        connection = connections[using]
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        plans = []
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            plan = explain_sql(sql, using)
+            scanned = full_scans(None, plan, vendor=connection.vendor)
+            self.assertFalse(scanned, f"查询退化为全表扫描：{scanned}\n{sql}\n{plan}")
+            plans.append(plan)
+        self.assertTrue(plans, "代码块中没有执行任何查询")
+        for name in index_names:
+            self.assertTrue(
+                any(name in plan for plan in plans),
+                f"没有查询使用索引 {name}\n" + '\n'.join(plans)
+            )
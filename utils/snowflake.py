@@ -0,0 +1,45 @@
+# utils/snowflake.py
+"""
+雪花 id：写入数据库之前就能确定的 64 位整数主键
+
+- 结构：41 位毫秒时间戳（自 2024-01-01 起，约 69 年）| 10 位节点号 | 12 位序列号
+- 同一节点内严格递增；同一毫秒内超过 4096 个时借用下一毫秒，系统时钟回拨时沿用上次的时间戳继续递增，
+  都不需要等待
+- 节点号须在同时写入的进程之间唯一，由调用方显式指定（进程号的低 10 位在多个 worker、多台机器之间可能重复，
+  重复时两个进程会在同一毫秒生成相同的 id）
+- 数值远大于自增主键，与已有数据混用时按 id 排序仍然是“先旧后新”
+"""
+import threading
+import time
+
+EPOCH_MS = 1704067200000  # 2024-01-01 00:00:00 UTC
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class Snowflake:
+    def __init__(self, node_id):
+        if not isinstance(node_id, int) or not 0 <= node_id <= MAX_NODE:
+            raise ValueError(f"节点号取值范围为 0~{MAX_NODE}")
+        self.node_id = node_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last_ms, self._sequence = self._last_ms + 1, 0
+            return (self._last_ms << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+
+def timestamp_ms(snowflake_id):
+    """雪花 id 中的 Unix 毫秒时间戳"""
+    return (snowflake_id >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
@@ -0,0 +1,135 @@
+# utils/sparse_fields.py
+"""
+稀疏字段集（sparse fieldsets）
+
+- ?fields=id,title,author.username：只返回列出的字段；嵌套序列化器用 "字段.子字段" 指定，
+  只写 "author" 表示返回作者的全部字段
+- ?omit=content,author.email：去掉列出的字段
+- 未知字段名直接忽略
+- sparse_queryset() 按最终要输出的字段收窄 SQL 投影（.only() + select_related），
+  列表接口不再读取用不到的大字段（如博客正文）
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def parse_field_list(value):
+    """'id, title,author.username' → [('id',), ('title',), ('author', 'username')]"""
+    if not value:
+        return []
+    return [tuple(part.split('.')) for part in (item.strip() for item in value.split(',')) if part]
+
+
+def get_selection(request):
+    """从请求参数中解析 (include, omit)；未传 fields 时 include 为 None（不限制）"""
+    params = getattr(request, 'query_params', None) or getattr(request, 'GET', None) or {}
+    include = parse_field_list(params.get(FIELDS_PARAM))
+    return include or None, parse_field_list(params.get(OMIT_PARAM))
+
+
+def select_field_names(names, path, include, omit):
+    """返回 path 这一层（() 为顶层）在 include / omit 约束下保留的字段名"""
+    depth = len(path)
+    if include is not None and not any(len(item) <= depth and path[:len(item)] == item for item in include):
+        # 没有整体选中这一层，只保留被点名的下一级字段
+        wanted = {item[depth] for item in include if len(item) > depth and item[:depth] == path}
+        names = [name for name in names if name in wanted]
+    omitted = {item[depth] for item in omit if len(item) == depth + 1 and item[:depth] == path}
+    return [name for name in names if name not in omitted]
+
+
+class SparseFieldsetMixin:
+    """
+    序列化器混入：按请求的 ?fields= / ?omit= 裁剪输出字段，顶层与嵌套序列化器都适用
+    SerializerMethodField 等不直接对应模型列的字段，在 sparse_sources 中声明其依赖的模型字段，
+    未声明依赖时 sparse_queryset() 不收窄投影，避免逐行回表
+    """
+    sparse_sources = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+        include, omit = get_selection(request)
+        if include is None and not omit:
+            return fields
+        kept = select_field_names(list(fields), self._sparse_path(), include, omit)
+        return {name: field for name, field in fields.items() if name in kept}
+
+    def _sparse_path(self):
+        """本序列化器在顶层序列化器中的字段路径，如 ('author',)"""
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return tuple(reversed(path))
+
+
+def _collect_columns(serializer, model, prefix, columns, relations):
+    """收集序列化器输出需要的模型字段；遇到无法确定依赖的字段返回 False"""
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.ModelSerializer):
+            relation = field.source
+            try:
+                related = model._meta.get_field(relation)
+            except FieldDoesNotExist:
+                return False
+            if not (related.many_to_one or related.one_to_one):
+                return False
+            columns.add(prefix + relation)
+            relations.add(prefix + relation)
+            if not _collect_columns(field, related.related_model, f'{prefix}{relation}__', columns, relations):
+                return False
+            continue
+        if isinstance(field, serializers.BaseSerializer):
+            return False
+
+        sources = getattr(serializer, 'sparse_sources', {}).get(name)
+        if sources is None:
+            if field.source == '*':
+                return False
+            sources = (field.source.replace('.', '__'),)
+        for source in sources:
+            if not _add_column(model, prefix, source, columns, relations):
+                return False
+    return True
+
+
+def _add_column(model, prefix, source, columns, relations):
+    parts = source.split('__')
+    for i, part in enumerate(parts):
+        try:
+            model_field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            # 属性 / 方法等非数据库字段，无法确定依赖的列
+            return False
+        if i < len(parts) - 1:
+            if not (model_field.many_to_one or model_field.one_to_one):
+                return False
+            relations.add(prefix + '__'.join(parts[:i + 1]))
+            model = model_field.related_model
+        elif not model_field.concrete:
+            return False
+    columns.add(prefix + source)
+    return True
+
+
+def sparse_queryset(queryset, serializer_class, request, always=()):
+    """
+    按 serializer_class 在本次请求中实际输出的字段收窄 queryset 的查询列
+    always：除序列化字段外必须加载的列（如游标分页依赖的 created_at）
+    """
+    serializer = serializer_class(context={'request': request})
+    columns, relations = set(always), set()
+    if not _collect_columns(serializer, queryset.model, '', columns, relations):
+        return queryset
+    # 关联查询也按实际输出重建：不输出的关联不再 JOIN（否则与 only() 冲突）
+    queryset = queryset.select_related(None)
+    if relations:
+        queryset = queryset.select_related(*sorted(relations))
+    return queryset.only(*sorted(columns))
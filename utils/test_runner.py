@@ -0,0 +1,36 @@
+# utils/test_runner.py
+"""
+项目的测试运行器（settings.TEST_RUNNER）
+
+- 继承 QueryBudgetTestRunner：测试中任何请求超出查询预算都会失败
+- 文件型存储（搜索索引、时间线、角标、分片上传、聊天日志、媒体文件）改到本次运行的临时目录，
+  测试中执行的事务提交回调不会写入项目目录下开发环境的数据文件；运行结束后删除临时目录
+"""
+import os
+import shutil
+import tempfile
+
+from django.test.utils import override_settings
+
+from .query_budget import QueryBudgetTestRunner
+
+
+class WeblogTestRunner(QueryBudgetTestRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._data_dir = tempfile.mkdtemp(prefix='weblog-test-')
+        self._isolated = override_settings(
+            BLOG_SEARCH_INDEX_PATH=os.path.join(self._data_dir, 'search_index.sqlite3'),
+            BLOG_TIMELINE_PATH=os.path.join(self._data_dir, 'timeline.sqlite3'),
+            USER_BADGE_PATH=os.path.join(self._data_dir, 'badges.sqlite3'),
+            CHUNKED_UPLOAD_DIR=os.path.join(self._data_dir, 'chunked_uploads'),
+            CHAT_WRITE_BEHIND_JOURNAL_DIR=os.path.join(self._data_dir, 'chat_journal'),
+            MEDIA_ROOT=os.path.join(self._data_dir, 'media'),
+        )
+        self._isolated.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated.disable()
+        shutil.rmtree(self._data_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
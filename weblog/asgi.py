@@ -14,12 +14,19 @@ def get_chat_consumer():
     module = importlib.import_module('user.consumers')
     return module.ChatConsumer.as_asgi()
 
+def get_user_chat_consumer():
+    # 每个用户一条连接（按 friend_id 订阅会话），见 UserChatConsumer
+    module = importlib.import_module('user.consumers')
+    return module.UserChatConsumer.as_asgi()
+
 # 3. ASGI 核心路由（用函数延迟导入，而非直接导入）
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),  # HTTP 请求正常处理
     "websocket": AuthMiddlewareStack(
         URLRouter([
             # 路由中调用函数，动态获取 Consumer
+            path('ws/chat/', get_user_chat_consumer()),
+            # 旧的每个好友一条连接，保留兼容；两种连接发出的消息互相可见
             path('ws/chat/<int:friend_id>/', get_chat_consumer()),
         ])
     ),
@@ -20,4 +20,24 @@ app.conf.beat_schedule = {
         'task': 'user.tasks.update_user_online_status',  # 任务路径（app名.任务文件名.任务函数名）
         'schedule': crontab(minute='*/1'),  # 每1分钟执行一次
     },
+    'recount-badges-every-10-minutes': {
+        'task': 'user.tasks.recount_badges',  # 重算活跃用户的未读消息/好友申请角标（纠正计数存储的偏差）
+        'schedule': crontab(minute='*/10'),
+    },
+    'flush-blog-counters-every-1-minute': {
+        'task': 'blog.tasks.flush_blog_counters',  # 合并点赞/转发/评论计数分片
+        'schedule': crontab(minute='*/1'),
+    },
+    'recompute-hot-ranking-every-5-minutes': {
+        'task': 'blog.tasks.recompute_hot_ranking',  # 增量更新热门排行（?ordering=hot）
+        'schedule': crontab(minute='*/5'),
+    },
+    'reconcile-blog-counters-every-1-hour': {
+        'task': 'blog.tasks.reconcile_blog_counters',  # 分块对账点赞/转发/评论计数（从检查点续跑）
+        'schedule': crontab(minute=30),
+    },
+    'cleanup-chunked-uploads-every-1-hour': {
+        'task': 'user.tasks.cleanup_chunked_uploads',  # 清理过期的分片上传临时文件
+        'schedule': crontab(minute=0),
+    },
 }
\ No newline at end of file
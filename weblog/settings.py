@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 from autobahn.util import public
@@ -59,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.query_budget.QueryBudgetMiddleware',
 ]
 CORS_ALLOW_METHODS = [
     'GET',
@@ -158,6 +160,18 @@ CHANNEL_LAYERS = {
     },
 }
 
+# ---------------------- 缓存 ----------------------
+# 所有 Web / Celery 进程共用 Redis 缓存（2号数据库）：列表缓存版本号、好友申请/未读角标等跨进程共享
+# 运行测试（manage.py test）时改用进程内缓存，不依赖 Redis 服务
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/2',
+    },
+}
+if sys.argv[1:2] == ['test']:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -227,6 +241,148 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # 本地存储路径（项目根
 # 允许的图片上传格式（安全限制）
 ALLOWED_UPLOAD_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif']
 MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 最大5MB
+# ---------------------- 分片上传 ----------------------
+# 分片临时文件目录（不在 MEDIA_ROOT 下，不对外提供访问）、单个分片上限、未完成会话的保留时间
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'tmp', 'chunked_uploads')
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 2 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRE_HOURS = 24
+# ---------------------- 博客互动计数 ----------------------
+# 点赞/转发/评论增量写入的分片数（越大并发写冲突越少，读实时计数时多汇总几行）
+BLOG_COUNTER_SHARDS = 8
+# ---------------------- 博客全文搜索 ----------------------
+# 倒排索引存放在独立的本地 SQLite 文件中（可用 manage.py rebuild_search_index 重建）
+BLOG_SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'search_index.sqlite3')
+BLOG_SEARCH_MAX_RESULTS = 200  # 单次搜索最多返回的博客数（按相关度截断）
+BLOG_SEARCH_MAX_POSTINGS_PER_TERM = 5000  # 每个查询词最多读取的倒排记录数（按词频取前 N 条，常见词剪枝）
+# ---------------------- 公开博客列表缓存 ----------------------
+# 匿名列表响应的缓存时间（秒）；公开博客变动时通过版本号立即失效，TTL 只兜底作者信息等间接变化
+BLOG_LIST_CACHE_TIMEOUT = 60
+# 匿名读接口（列表/详情/评论）允许反向代理缓存的秒数（Cache-Control: s-maxage），过期后凭 ETag 回源校验
+BLOG_HTTP_CACHE_S_MAXAGE = 30
+# ---------------------- 好友动态（时间线） ----------------------
+# 存储实现：blog.timeline.SQLiteTimelineStore（单机文件，多进程共享）或 blog.timeline.MemoryTimelineStore（进程内）
+BLOG_TIMELINE_STORE = 'blog.timeline.SQLiteTimelineStore'
+BLOG_TIMELINE_PATH = os.path.join(BASE_DIR, 'timeline.sqlite3')
+BLOG_TIMELINE_MAX_LENGTH = 500  # 每个用户的时间线最多保留的条数
+BLOG_TIMELINE_FANOUT_LIMIT = 1000  # 好友数超过该值的作者不推送，改为读取时合并
+BLOG_TIMELINE_FANOUT_BATCH = 500  # 推送时每批写入的好友数
+# ---------------------- 博客浏览量 ----------------------
+# 浏览先记在进程内缓冲，超过间隔（秒）或缓冲组数时投递任务批量写库；统计接口默认回看的天数
+BLOG_VIEW_FLUSH_INTERVAL = 30
+BLOG_VIEW_BUFFER_SIZE = 1000
+BLOG_VIEW_STATS_DAYS = 30
+# 反向代理（Nginx 等）的地址：只有来自这些地址的请求才采信 X-Forwarded-For 区分匿名访客
+BLOG_TRUSTED_PROXIES = ['127.0.0.1']
+# ---------------------- 热门排行 ----------------------
+# 热度 = Σ 权重 × 2^(-距今时长/半衰期)，由定时任务 recompute_hot_ranking 每 5 分钟增量计算
+BLOG_HOT_WEIGHTS = {'like': 1.0, 'share': 3.0, 'comment': 2.0}
+BLOG_HOT_HALF_LIFE_HOURS = 12
+BLOG_HOT_WINDOW_HOURS = 72  # 冷启动时回看的事件窗口
+BLOG_HOT_OVERLAP_SECONDS = 600  # 每次计算回看上次计算前的这段时间，读到提交较晚的事件（应大于最长的写事务耗时）
+BLOG_HOT_MIN_SCORE = 0.01  # 衰减到该值以下的博客移出排行
+BLOG_HOT_MAX_ITEMS = 1000  # 排行最多保留的博客数
+# ---------------------- 计数对账 ----------------------
+# 对账任务每块扫描的博客数、单次任务最多处理的块数（其余从检查点续跑）
+BLOG_RECONCILE_CHUNK_SIZE = 1000
+BLOG_RECONCILE_MAX_CHUNKS = 50
+# ---------------------- 楼中楼评论 ----------------------
+# 最大回复层级（更深的回复挂到最深一层下）；楼层列表每层默认/最多附带的回复数；单个楼层接口最多返回的评论数
+BLOG_COMMENT_MAX_DEPTH = 20
+BLOG_COMMENT_REPLY_PREVIEW = 3
+BLOG_COMMENT_REPLY_PREVIEW_MAX = 20
+BLOG_COMMENT_THREAD_LIMIT = 500
+# ---------------------- 博客批量操作 ----------------------
+# 单次批量发布/撤回/修改/删除最多处理的博客数
+BLOG_BULK_MAX_IDS = 500
+# ---------------------- 博客正文预渲染 ----------------------
+# 列表摘要的最大字符数（不超过 Blog.excerpt 的 300）与估算阅读时长用的阅读速度（字/分钟）
+BLOG_EXCERPT_LENGTH = 140
+BLOG_READING_SPEED = 300
+# ---------------------- 博客封面图版本 ----------------------
+# 上传封面后后台生成的固定宽度版本（像素，不放大）与各格式的编码质量
+BLOG_COVER_RENDITION_WIDTHS = [320, 640, 1280]
+BLOG_COVER_RENDITION_QUALITY = {'webp': 80, 'jpeg': 82}
+# ---------------------- 用户头像版本 ----------------------
+# 上传头像后后台生成的正方形版本边长（px）、编码格式与质量
+AVATAR_RENDITION_SIZES = [32, 64, 128, 256]
+AVATAR_RENDITION_FORMAT = 'webp'
+AVATAR_RENDITION_QUALITY = 85
+# ---------------------- 聊天记录 ----------------------
+# 聊天记录每页默认条数、客户端可请求的最大条数（page_size）
+CHAT_HISTORY_PAGE_SIZE = 30
+CHAT_HISTORY_MAX_PAGE_SIZE = 100
+# 聊天消息写后模式（见 user/writebehind.py）：WebSocket 消息先写本地日志并立即广播，
+# 每隔 INTERVAL_MS 毫秒或攒满 BATCH 条时批量落库；日志目录需放在本机磁盘上
+CHAT_WRITE_BEHIND = False
+CHAT_WRITE_BEHIND_INTERVAL_MS = 200
+CHAT_WRITE_BEHIND_BATCH = 100
+CHAT_WRITE_BEHIND_JOURNAL_DIR = os.path.join(BASE_DIR, 'chat_journal')
+CHAT_WRITE_BEHIND_FSYNC = False  # 每条日志都 fsync（扛断电，但每条消息多一次磁盘同步）
+# 雪花 id 节点号（0~1023）：开启写后模式时必须为每个进程（含多机）配置不同的值，例如启动时按 worker 序号设置环境变量
+CHAT_SNOWFLAKE_NODE_ID = int(os.environ['CHAT_SNOWFLAKE_NODE_ID']) if os.environ.get('CHAT_SNOWFLAKE_NODE_ID') else None
+# ---------------------- 角标计数 ----------------------
+# 未读消息数/待处理好友申请数的计数存储：user.badges.CacheBadgeStore（Django 缓存）、
+# user.badges.SQLiteBadgeStore（单机文件，多进程共享）、user.badges.MemoryBadgeStore（进程内）；
+# CacheBadgeStore 在默认缓存为进程内缓存（LocMem / Dummy）时不启用，角标退回按数据库计数
+USER_BADGE_STORE = 'user.badges.CacheBadgeStore'
+USER_BADGE_PATH = os.path.join(BASE_DIR, 'badges.sqlite3')
+USER_BADGE_TTL = 24 * 3600  # 缓存存储中计数的过期时间（秒），过期后读取时重新计数
+USER_BADGE_RECOUNT_ACTIVE_MINUTES = 30  # 自愈任务重算最近多少分钟内活跃的用户
+USER_BADGE_RECOUNT_BATCH_SIZE = 1000
+# ---------------------- SQL 查询预算 ----------------------
+# 每个路由（URL name）单次请求允许执行的最大查询数：线上超出时记录告警，测试中超出直接失败
+# 数值为测试中实测的最大查询数（含 JWT 认证查用户的 1 条）加少量余量，新增路由必须同时在此声明；
+# 各 HTTP 方法开销差别大的路由按方法声明 {方法: 预算}，未列出的方法（HEAD 除外，沿用 GET）按其中最小的预算检查
+QUERY_BUDGETS = {
+    # blog/urls.py
+    'api-root': 1,
+    'blog-list': 4,
+    'blog-detail': {'GET': 4, 'PUT': 5, 'PATCH': 5, 'DELETE': 15},  # 删除要级联清理评论、点赞、计数分片等
+    'blog-my-blogs': 4,
+    'blog-publish': 4,
+    'blog-unpublish': 4,
+    'blog-cache-stats': 1,
+    'blog-view-stats': 2,
+    'blog-author-view-stats': 2,
+    'blog-timeline': 5,
+    'blog-bulk-publish': 6,
+    'blog-bulk-unpublish': 6,
+    'blog-bulk-update': 6,
+    'blog-bulk-delete': 16,
+    'blog-like': 13,
+    'blog-share': 10,
+    'blog-comment-list': 4,
+    'blog-comment-thread': 2,
+    'blog-comment-add': 15,
+    # weblog/urls.py
+    'api_userinfo': 2,
+    'upload-avatar': 5,
+    # user/urls.py
+    'token_obtain_pair': 1,
+    'token_refresh': 1,
+    'friend-list': 3,
+    'chat-messages': 3,
+    'send-message': 6,
+    'mark-as-read': 5,
+    'unread-count': 2,
+    'send-friend-request': 5,
+    'my-friend-requests': 2,
+    'handle-friend-request': 4,
+    'cancel-friend-request': 3,
+    'delete-friend': 3,
+    'user-public-detail': 2,
+    'heartbeat': 2,
+    'pending-request-count': 2,
+    'chunked-upload-init': 2,
+    'chunked-upload-detail': {'GET': 2, 'PUT': 5},
+    'chunked-upload-finalize': 5,
+}
+# 同一形状的查询在一个请求中重复达到该次数即视为 N+1
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 3
+# 超出预算 / 疑似 N+1 时中间件直接抛异常（线上只记日志；测试运行器会打开，测试中任何请求超预算都失败）
+QUERY_BUDGET_STRICT = False
+# 测试运行器：打开严格的查询预算，并把文件型存储改到临时目录（见 utils/test_runner.py）
+TEST_RUNNER = 'utils.test_runner.WeblogTestRunner'
 # ---------------------- Celery配置 ----------------------
 # 消息代理（Broker）：Redis
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'  # 0号数据库
@@ -236,6 +392,11 @@ CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/1'  # 1号数据库
 CELERY_TIMEZONE = 'Asia/Shanghai'  # 与Django时区一致
 # 启用UTC（可选，建议与Django保持一致）
 CELERY_ENABLE_UTC = False
+# 运行测试（manage.py test）时任务在当前进程同步执行，不连接 Redis 消息代理与结果存储
+if sys.argv[1:2] == ['test']:
+    CELERY_TASK_ALWAYS_EAGER = True
+    CELERY_BROKER_URL = 'memory://'
+    CELERY_RESULT_BACKEND = 'cache+memory://'
 
 # ---------------------- django-celery-beat配置 ----------------------
 # 启用数据库调度器（用于通过Django admin管理定时任务）